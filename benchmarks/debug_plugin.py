@@ -0,0 +1,43 @@
+"""
+Measures the per-request overhead of ``DjangoDebugPlugin``:
+
+    python -m benchmarks.debug_plugin
+"""
+from .utils import create_dataset, measure, setup_django
+
+QUERY = """
+{
+    container(id: 1) { name, items { name } },
+    item_list(id: [1, 2, 3]) { name }
+}
+"""
+
+
+def main(iterations=200):
+    setup_django()
+    create_dataset()
+
+    from django_graphql.lib import DjangoSchema
+    from django_graphql.sql_debug import DjangoDebugPlugin
+    from tests.testapp.schema import T
+
+    schemas = [
+        ('no plugins', DjangoSchema(T), QUERY),
+        ('debug plugin', DjangoSchema(T, [DjangoDebugPlugin()]), QUERY),
+        ('debug plugin, __debug queried', DjangoSchema(T, [DjangoDebugPlugin()]),
+         QUERY.rstrip().rstrip('}') + '__debug { query_count, duration } }'),
+        ('debug plugin, light', DjangoSchema(T, [DjangoDebugPlugin(light=True)]), QUERY),
+        ('debug plugin, 1% sampled', DjangoSchema(T, [DjangoDebugPlugin(sample_rate=0.01)]),
+         QUERY),
+    ]
+    baseline = None
+    for name, schema, query in schemas:
+        mean, best = measure(lambda: schema.execute(query), iterations)
+        if baseline is None:
+            baseline = mean
+        print '%-32s mean %7.3fms  min %7.3fms  overhead %+7.3fms' % (
+            name, mean, best, mean - baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Runs a fixed corpus of documents against a generated dataset and reports
+the wall time, SQL queries, rows fetched and peak memory of each:
+
+    python -m benchmarks.suite --movements 100000 --output after.json
+    python -m benchmarks.suite --movements 100000 --compare before.json
+
+With ``--compare``, the exit status is 1 if any document regressed.
+"""
+import argparse
+import json
+import platform
+import sys
+
+import django
+
+from .utils import (
+    QueryCounter,
+    generate_dataset,
+    measure,
+    measure_peak_memory,
+    setup_django,
+)
+
+# Container 1 is the most crowded one, see ``generate_dataset``.
+DOCUMENTS = [
+    ('container_items', """
+        { container(id: 1) { name, items { name } } }
+    """),
+    ('container_current_items', """
+        { container(id: 1) { current_items { label, current_container { name } } } }
+    """),
+    ('container_movements_page', """
+        {
+            container(id: 1) {
+                itemmovement_set(first: 20) {
+                    edges { node { id, item { name } } }
+                    pageInfo { hasNextPage, endCursor }
+                }
+            }
+        }
+    """),
+    ('container_list_pages', """
+        {
+            container_list(id: [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]) {
+                name
+                itemmovement_set(first: 5) { edges { node { id } } }
+            }
+        }
+    """),
+    ('item_history', """
+        { item(id: 1) { name, containers { name }, itemmovement_set { container { name } } } }
+    """),
+    ('item_list_current_container', """
+        { item_list(id: [%s]) { label, current_container { name } } }
+    """ % ', '.join(str(i) for i in range(1, 51))),
+]
+
+
+def run_document(schema, query, iterations=20):
+    """
+    Returns the measurements of executing ``query`` with ``schema``:
+    'mean_ms' and 'min_ms' over ``iterations`` runs, the 'queries' and
+    'rows' of one run, and its 'peak_memory_kb'.
+    """
+    from django_graphql.recording import recording
+
+    counter = QueryCounter()
+    with recording(counter):
+        result = schema.execute(query)
+    if result.errors:
+        raise RuntimeError('Benchmark document failed: %s' % result.errors)
+    mean, best = measure(lambda: schema.execute(query), iterations, warmup=1)
+    return {
+        'mean_ms': mean,
+        'min_ms': best,
+        'queries': len(counter.queries),
+        'rows': counter.rows,
+        'peak_memory_kb': measure_peak_memory(lambda: schema.execute(query)),
+    }
+
+
+def compare(baseline, results, tolerance=0.1):
+    """
+    Returns a description of each way a document of ``results`` did worse
+    than in ``baseline``: any more queries or rows, or a best time or peak
+    memory more than ``tolerance`` (a fraction) above the baseline's.
+    """
+    regressions = []
+    if baseline['dataset'] != results['dataset']:
+        regressions.append('dataset differs from the baseline: %r, saw %r' % (
+            baseline['dataset'], results['dataset']))
+        return regressions
+    for name, measured in sorted(results['documents'].items()):
+        before = baseline['documents'].get(name)
+        if before is None:
+            continue
+        for key, slack in (('queries', 0), ('rows', 0),
+                           ('min_ms', tolerance), ('peak_memory_kb', tolerance)):
+            if before[key] is None or measured[key] is None:
+                continue
+            if measured[key] > before[key] * (1 + slack):
+                regressions.append('%s: %s went from %s to %s' % (
+                    name, key, before[key], measured[key]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--movements', type=int, default=1000,
+                        help='item movements to generate, e.g. 1000 to 1000000')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent of the movements per container')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='timed runs per document')
+    parser.add_argument('--documents', nargs='*',
+                        help='names of the documents to run (default: all)')
+    parser.add_argument('--output', help='file to write the results to, as JSON')
+    parser.add_argument('--compare', help='results file to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed relative increase of time and memory')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    dataset = generate_dataset(args.movements, args.skew, args.seed)
+    dataset.update(skew=args.skew, seed=args.seed)
+
+    from tests.testapp.schema import schema
+
+    results = {
+        'dataset': dataset,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+        },
+        'documents': {},
+    }
+    print 'Dataset: %(movements)s movements, %(containers)s containers, %(items)s items' % dataset
+    for name, query in DOCUMENTS:
+        if args.documents and name not in args.documents:
+            continue
+        measured = results['documents'][name] = run_document(schema, query, args.iterations)
+        print '%-30s mean %9.3fms  min %9.3fms  %4d queries  %8d rows  peak %s KiB' % (
+            name, measured['mean_ms'], measured['min_ms'], measured['queries'],
+            measured['rows'], measured['peak_memory_kb'])
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline), results, args.tolerance)
+        for regression in regressions:
+            print 'REGRESSION %s' % regression
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Helpers shared by the benchmarks, which run against the test app's
+models in an in-memory SQLite database.
+"""
+import os
+import random
+import resource
+import time
+from bisect import bisect_right
+from datetime import timedelta
+
+
+def setup_django():
+    """
+    Configures Django with the test app's settings and creates its tables
+    in an in-memory SQLite database.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.testapp.settings')
+    os.environ.setdefault('DB_BACKEND', 'sqlite3')
+    import django
+    django.setup()
+
+    from django.db import connection
+    connection.creation.create_test_db(verbosity=0)
+
+
+def create_dataset(containers=10, items_per_container=10):
+    """
+    Creates ``containers`` containers, each holding ``items_per_container``
+    items of its own.
+    """
+    from tests.testapp.models import Container, Item, ItemMovement
+
+    for i in range(containers):
+        container = Container.objects.create(name='container_%s' % i)
+        for j in range(items_per_container):
+            item = Item.objects.create(name='item_%s_%s' % (i, j))
+            ItemMovement.objects.create(item=item, container=container)
+
+
+def generate_dataset(movements=1000, skew=1.0, seed=0, batch_size=10000):
+    """
+    Creates ``movements`` item movements between ``movements // 100``
+    containers and ``movements // 4`` items, and returns those counts.
+
+    Each item moves 4 times on average; its last movement is the one it
+    hasn't left. Containers are picked with Zipf weights ``1 / rank **
+    skew``, so container 1 holds the most movements and the fan-out of
+    the rest falls off with their id; ``skew=0`` spreads them evenly.
+    """
+    from django.db import transaction
+    from django.utils import timezone
+    from tests.testapp.models import Container, Item, ItemMovement
+
+    container_count = max(1, movements // 100)
+    item_count = max(1, movements // 4)
+    weights = []
+    total = 0.0
+    for rank in range(1, container_count + 1):
+        total += 1.0 / rank ** skew
+        weights.append(total)
+    rng = random.Random(seed)
+    start = timezone.now() - timedelta(seconds=movements)
+
+    with transaction.atomic():
+        Container.objects.bulk_create(
+            Container(id=i, name='container_%s' % i)
+            for i in range(1, container_count + 1))
+        for offset in range(0, item_count, batch_size):
+            Item.objects.bulk_create(
+                Item(id=i, name='item_%s' % i)
+                for i in range(offset + 1, min(offset + batch_size, item_count) + 1))
+        for offset in range(0, movements, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, movements)):
+                # Movement i is item (i % item_count)'s (i // item_count)th,
+                # and it left when its next movement, item_count later, entered.
+                left = i + item_count
+                batch.append(ItemMovement(
+                    id=i + 1,
+                    item_id=i % item_count + 1,
+                    container_id=min(
+                        bisect_right(weights, rng.random() * total), container_count - 1) + 1,
+                    entered=start + timedelta(seconds=i),
+                    left=start + timedelta(seconds=left) if left < movements else None))
+            ItemMovement.objects.bulk_create(batch)
+    return {
+        'containers': container_count,
+        'items': item_count,
+        'movements': movements,
+    }
+
+
+class QueryCounter(object):
+    """
+    Recorder (see ``django_graphql.recording``) keeping the SQL, duration
+    and row count of every query run while it's recording.
+    """
+    stacktraces = False
+
+    def __init__(self):
+        self.queries = []
+
+    def wrap_cursor(self, cursor, connection):
+        from django_graphql.sql_debug import LightCursorWrapper
+        return LightCursorWrapper(cursor, connection, self)
+
+    def record_query(self, query):
+        self.queries.append(query)
+
+    @property
+    def rows(self):
+        return sum(query['rows'] for query in self.queries)
+
+
+def _get_rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def measure_peak_memory(fn):
+    """
+    Returns how far ``fn()`` raises the peak resident memory of the
+    process, in KiB, or None where that can't be measured.
+
+    ``fn()`` runs in a forked child, whose peak starts at the memory it
+    inherits, so each call is measured from the same baseline.
+    """
+    if not hasattr(os, 'fork') or not os.path.exists('/proc/self/statm'):
+        return None
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            start = _get_rss()
+            fn()
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(write_fd, str(max(peak - start, 0)))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    output = ''
+    while True:
+        chunk = os.read(read_fd, 64)
+        if not chunk:
+            break
+        output += chunk
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return int(output) if output else None
+
+
+def measure(fn, iterations=200, warmup=10):
+    """
+    Returns the mean and minimum duration of ``fn()``, in milliseconds,
+    over ``iterations`` calls made after ``warmup`` untimed ones.
+    """
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(iterations):
+        start_time = time.time()
+        fn()
+        durations.append((time.time() - start_time) * 1000)
+    return sum(durations) / len(durations), min(durations)
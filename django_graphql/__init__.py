@@ -4,14 +4,27 @@ from .lib import (
     DjangoType,
     mutation,
     prefetch,
+    requires,
     TypeRegistry
 )
+from .loaders import BatchLoader
+from .metrics import MetricsPlugin
+from .predicates import PredicateQuerySet
+from .result_cache import DjangoResultCache, LocalResultCache
+from .tracing import TracingPlugin
 
 __version__ = '0.0.1'
 __all__ = [
+    'BatchLoader',
+    'DjangoResultCache',
     'DjangoSchema',
     'DjangoType',
+    'LocalResultCache',
+    'MetricsPlugin',
     'mutation',
+    'PredicateQuerySet',
     'prefetch',
+    'requires',
+    'TracingPlugin',
     'TypeRegistry'
 ]
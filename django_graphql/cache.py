@@ -0,0 +1,114 @@
+import logging
+import threading
+from collections import OrderedDict
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedCache(object):
+    """
+    Thread-safe mapping holding at most ``maxsize`` entries.
+
+    ``eviction`` picks which entry is dropped once the cache is full:
+    'lru' drops the least recently read entry, 'fifo' drops the oldest
+    inserted one (reads never reorder entries, so they are a little cheaper).
+    A ``maxsize`` of 0 disables caching altogether.
+    """
+    EVICTION_POLICIES = ('lru', 'fifo')
+
+    def __init__(self, maxsize=128, eviction='lru'):
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError(
+                "Expected eviction to be one of %s, saw: %r"
+                % (self.EVICTION_POLICIES, eviction))
+        self.maxsize = maxsize
+        self.eviction = eviction
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.eviction == 'lru':
+                del self._data[key]
+                self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return 'BoundedCache(maxsize=%s, eviction=%r)' % (self.maxsize, self.eviction)
+
+
+class PlanCache(BoundedCache):
+    """
+    ``BoundedCache`` for prefetch plans that also records how long
+    building missing plans took, in milliseconds.
+    """
+    def __init__(self, maxsize=256, eviction='lru'):
+        super(PlanCache, self).__init__(maxsize=maxsize, eviction=eviction)
+        self.builds = 0
+        self.build_duration = 0
+        self.max_build_duration = 0
+
+    def get_or_build(self, key, build):
+        plan = self.get(key)
+        if plan is not None:
+            return plan
+
+        start_time = time()
+        plan = build()
+        duration = (time() - start_time) * 1000
+        with self._lock:
+            self.builds += 1
+            self.build_duration += duration
+            self.max_build_duration = max(self.max_build_duration, duration)
+        logger.debug('Built prefetch plan %r in %.3fms', plan, duration)
+
+        self.set(key, plan)
+        return plan
+
+    def stats(self):
+        stats = super(PlanCache, self).stats()
+        stats.update({
+            'builds': self.builds,
+            'build_duration': self.build_duration,
+            'max_build_duration': self.max_build_duration,
+        })
+        return stats
@@ -0,0 +1,164 @@
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.db import close_old_connections, connections
+
+from graphql.core.execution import Executor
+from graphql.core.pyutils.defer import Deferred
+
+from .recording import get_recorders, recording
+
+
+def _is_in_memory(connection):
+    return connection.vendor == 'sqlite' and \
+        connection.settings_dict['NAME'] in ('', ':memory:')
+
+
+def _run_in_worker(fn, args, shared_connections, recorders=()):
+    """
+    Runs ``fn(*args)`` on a pool thread, returning (result, exc_info).
+
+    Pool threads use their own database connections, closed when they
+    outlive ``CONN_MAX_AGE`` as at the end of a Django request. In-memory
+    SQLite databases only exist on the connection that created them, so
+    those are shared with the requesting thread instead.
+
+    Queries are recorded to the requesting thread's ``recorders``.
+    """
+    for alias, connection in shared_connections.items():
+        connections[alias] = connection
+    try:
+        with recording(*recorders):
+            return fn(*args), None
+    except Exception:
+        return None, sys.exc_info()
+    finally:
+        close_old_connections()
+
+
+class RequestWork(object):
+    """
+    Work one request runs on a ``ConcurrentExecutor``'s thread pool.
+
+    ``submit`` starts running a function and returns a Deferred; ``wait``
+    blocks until every submitted function returned and fires their
+    Deferreds on the requesting thread, in submission order, so results
+    and errors come out the same however the work interleaved.
+
+    If the requesting thread is inside a transaction, which other
+    connections can't see into, functions run synchronously instead.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.recorders = get_recorders()
+        self._submitted = []
+        self.shared_connections = {}
+        self.concurrent = True
+        for connection in connections.all():
+            if _is_in_memory(connection):
+                self.shared_connections[connection.alias] = connection
+            elif connection.in_atomic_block:
+                self.concurrent = False
+        self._thread_sharing = dict(
+            (alias, connection.allow_thread_sharing)
+            for alias, connection in self.shared_connections.items())
+
+    def __enter__(self):
+        for connection in self.shared_connections.values():
+            connection.allow_thread_sharing = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wait()
+        for alias, connection in self.shared_connections.items():
+            connection.allow_thread_sharing = self._thread_sharing[alias]
+
+    def submit(self, fn, *args):
+        """
+        Returns a Deferred firing with ``fn(*args)``.
+        """
+        deferred = Deferred()
+        async_result = self.pool.apply_async(
+            _run_in_worker, (fn, args, self.shared_connections, self.recorders))
+        self._submitted.append((deferred, async_result))
+        return deferred
+
+    def map(self, fn, iterable):
+        """
+        Returns ``[fn(item) for item in iterable]``, computed concurrently.
+        Exceptions are raised on the requesting thread.
+        """
+        if not self.concurrent:
+            return [fn(item) for item in iterable]
+        async_results = [
+            self.pool.apply_async(
+                _run_in_worker, (fn, (item,), self.shared_connections, self.recorders))
+            for item in iterable
+        ]
+        results = []
+        for async_result in async_results:
+            result, exc_info = async_result.get()
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            results.append(result)
+        return results
+
+    @property
+    def pending(self):
+        return bool(self._submitted)
+
+    def wait(self):
+        submitted, self._submitted = self._submitted, []
+        for deferred, async_result in submitted:
+            result, exc_info = async_result.get()
+            if exc_info is not None:
+                deferred.errback(exc_info[1])
+            else:
+                deferred.callback(result)
+
+
+class ConcurrentExecutor(Executor):
+    """
+    Executor resolving the root fields of query operations concurrently,
+    on a pool of ``max_workers`` threads.
+
+    Root resolvers run, and evaluate the QuerySets they return, on pool
+    threads; the rest of the execution stays on the requesting thread.
+    Requests pass a ``RequestWork`` as ``request_context['work']``.
+    """
+    def __init__(self, max_workers, **kwargs):
+        super(ConcurrentExecutor, self).__init__(**kwargs)
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        # Created on first use, so building a schema starts no threads.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.max_workers)
+            return self._pool
+
+    def get_work(self):
+        return RequestWork(self.pool)
+
+    def resolve_or_error(self, resolve_fn, source, args, info):
+        work = info.request_context.get('work')
+        if work is None or not work.concurrent or info.operation.operation != 'query' or \
+                info.parent_type is not info.schema.get_query_type():
+            return super(ConcurrentExecutor, self).resolve_or_error(
+                resolve_fn, source, args, info)
+
+        def resolve():
+            result = super(ConcurrentExecutor, self).resolve_or_error(
+                resolve_fn, source, args, info)
+            if isinstance(result, Exception):
+                raise result
+            if hasattr(result, '_fetch_all'):
+                # Run the QuerySet's SQL (and prefetches) on the worker too.
+                result._fetch_all()
+            return result
+
+        return work.submit(resolve)
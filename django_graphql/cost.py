@@ -0,0 +1,258 @@
+from graphql.core.error import GraphQLError
+from graphql.core.error import format_error as format_graphql_error
+from graphql.core.execution.values import get_argument_values, get_variable_values
+from graphql.core.language import ast
+from graphql.core.type import GraphQLList, GraphQLNonNull, GraphQLObjectType
+
+from .pagination import DEFAULT_PAGE_SIZE
+from .relations import get_relation
+
+# Rows assumed per parent for list fields without a ``Meta.list_sizes`` hint,
+# and for root lists of types without ``Meta.estimated_count``.
+DEFAULT_LIST_SIZE = 10
+
+
+class QueryCostError(GraphQLError):
+    """
+    Raised for documents whose ``QueryCost`` exceeds a schema's limits.
+    ``cost`` and ``limits`` hold the figures behind the message, and are
+    added to the error by ``format_error``.
+    """
+    def __init__(self, cost, limits):
+        self.cost = cost
+        self.limits = limits
+        super(QueryCostError, self).__init__(
+            'QueryCostExceeded: %s' % '; '.join(cost.exceeded(limits)))
+
+
+class QueryCost(object):
+    """
+    Static estimate of what executing an operation costs:
+
+        depth: deepest field nesting, root fields being at depth 1
+        rows: model instances loaded
+        queries: SQL queries issued
+    """
+    LIMITS = ('depth', 'rows', 'queries')
+
+    def __init__(self, depth=0, rows=0, queries=0):
+        self.depth = depth
+        self.rows = rows
+        self.queries = queries
+
+    def exceeded(self, limits):
+        """
+        Returns a description of every limit in ``limits`` (a dict of
+        'depth', 'rows' and/or 'queries' to maximums) this cost exceeds.
+        """
+        return [
+            '%s %s exceeds max_%s %s' % (name, getattr(self, name), name, limits[name])
+            for name in self.LIMITS
+            if limits.get(name) is not None and getattr(self, name) > limits[name]
+        ]
+
+    def as_dict(self):
+        return {'depth': self.depth, 'rows': self.rows, 'queries': self.queries}
+
+    def __repr__(self):
+        return 'QueryCost(depth=%s, rows=%s, queries=%s)' % (
+            self.depth, self.rows, self.queries)
+
+
+def format_error(error):
+    """
+    Formats ``error`` like ``graphql.core.error.format_error``, adding the
+    'cost' and 'limits' of a ``QueryCostError``, e.g.
+    {"cost": {"depth": 9, "rows": 120, "queries": 4}, "limits": {"depth": 6}}.
+    """
+    formatted = format_graphql_error(error)
+    if isinstance(error, QueryCostError):
+        formatted['cost'] = error.cost.as_dict()
+        formatted['limits'] = dict(
+            (name, limit) for name, limit in error.limits.items() if limit is not None)
+    return formatted
+
+
+def _unwrap(graphql_type):
+    while isinstance(graphql_type, (GraphQLList, GraphQLNonNull)):
+        graphql_type = graphql_type.of_type
+    return graphql_type
+
+
+def _is_list(graphql_type):
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+class CostAnalyzer(object):
+    """
+    Computes the ``QueryCost`` of an operation from its AST, before it
+    is executed, using hints declared on each DjangoType's ``Meta``:
+
+        list_sizes: dict of list or connection field name -> estimated rows
+            per parent (DEFAULT_LIST_SIZE when missing; connections use
+            their page size if smaller)
+        query_costs: dict of field name -> SQL queries the field's resolver
+            issues per level, overriding the estimate below
+        estimated_count: estimated rows of the '<type>_list' root field
+            when the request doesn't list the values it looks up
+
+    Arguments are read like execution reads them, from the variables
+    coerced by the operation's variable definitions, defaults included.
+    Root lists filtered by no list, or a null one, are unfiltered.
+
+    Root fields cost a query each. Relations loaded with the parent plan
+    (@prefetch, or fields named after relations) cost a query per level,
+    or nothing when joined with ``select_related``. Fields returning a
+    DjangoType through any other custom resolver cost a query per parent.
+    """
+    def __init__(self, registry, schema, document, variables=None):
+        self.registry = registry
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = dict(
+            (definition.name.value, definition)
+            for definition in document.definitions
+            if isinstance(definition, ast.FragmentDefinition))
+
+    def analyze(self, operation):
+        try:
+            self.variables = get_variable_values(
+                self.schema, operation.variable_definitions or [], self.variables)
+        except GraphQLError:
+            # Execution reports invalid variables; estimate with them as sent.
+            pass
+        cost = QueryCost()
+        self._visit(
+            cost, operation.selection_set, self.schema.get_query_type(), 1, 1, root=True)
+        return cost
+
+    def _get_fields(self, selection_set, graphql_type):
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                yield selection
+                continue
+            if isinstance(selection, ast.FragmentSpread):
+                fragment = self.fragments[selection.name.value]
+            else:
+                fragment = selection
+            condition = fragment.type_condition
+            if condition is None or condition.name.value == graphql_type.name:
+                for field in self._get_fields(fragment.selection_set, graphql_type):
+                    yield field
+
+    def _get_args(self, field, field_def):
+        return get_argument_values(field_def.args, field.arguments, self.variables)
+
+    def _get_django_type(self, graphql_type):
+        entry = self.registry._types.get(graphql_type.name)
+        if entry is None or entry.graphql_type is not graphql_type:
+            return None
+        return entry.django_type
+
+    def _visit(self, cost, selection_set, graphql_type, rows, depth, root=False):
+        if not isinstance(graphql_type, GraphQLObjectType):
+            return
+        django_type = self._get_django_type(graphql_type)
+        meta = getattr(django_type, 'Meta', None)
+        list_sizes = getattr(meta, 'list_sizes', {})
+        query_costs = getattr(meta, 'query_costs', {})
+        fields = graphql_type.get_fields()
+
+        for field in self._get_fields(selection_set, graphql_type):
+            name = field.name.value
+            if name.startswith('__') or name not in fields:
+                continue
+            cost.depth = max(cost.depth, depth)
+            field_type = fields[name].type
+            nested_type = _unwrap(field_type)
+            args = self._get_args(field, fields[name])
+            # Whether the field loads model instances of its own
+            loads_rows = True
+
+            if root:
+                nested_rows = self._get_root_rows(args, field_type, nested_type)
+                cost.queries += 1
+            elif django_type is None:
+                # Connection, edge and other plain types: their rows were
+                # counted by the field returning them.
+                nested_rows, loads_rows = rows, False
+            elif name in dict(django_type._connection_fields):
+                page_size = self._get_page_size(args)
+                nested_rows = rows * min(page_size, list_sizes.get(name, page_size))
+                cost.queries += query_costs.get(name, 1)
+            elif self._get_django_type(nested_type) is not None:
+                nested_rows = rows
+                if _is_list(field_type):
+                    nested_rows = rows * list_sizes.get(name, DEFAULT_LIST_SIZE)
+                cost.queries += query_costs.get(
+                    name, self._get_field_queries(django_type, name, rows))
+            else:
+                nested_rows, loads_rows = rows, False
+                cost.queries += query_costs.get(name, 0)
+
+            if field.selection_set is None:
+                continue
+            if loads_rows:
+                cost.rows += nested_rows
+            self._visit(cost, field.selection_set, nested_type, nested_rows, depth + 1)
+
+    def _get_root_rows(self, args, field_type, nested_type):
+        if not _is_list(field_type) and not nested_type.name.endswith('Connection'):
+            return 1
+        if nested_type.name.endswith('Connection'):
+            return self._get_page_size(args)
+        sizes = [len(value) for value in args.values() if isinstance(value, list)]
+        if sizes:
+            return max(sizes)
+        django_type = self._get_django_type(nested_type)
+        return getattr(django_type.Meta, 'estimated_count', DEFAULT_LIST_SIZE)
+
+    @staticmethod
+    def _get_page_size(args):
+        for name in ('first', 'last'):
+            if args.get(name) is not None:
+                return args[name]
+        return DEFAULT_PAGE_SIZE
+
+    @staticmethod
+    def _get_field_queries(django_type, name, rows):
+        resolver_name = 'get_%s' % name
+        lookups = django_type._get_prefetch_lookups(name)
+        if not lookups:
+            # Resolved for each parent on its own.
+            return rows if hasattr(django_type, resolver_name) else 0
+        if resolver_name not in django_type._prefetch:
+            relation = get_relation(django_type.Meta.model, name)
+            if relation is not None and relation.is_to_one:
+                return 0
+        return 1
+
+
+def get_operation(document, operation_name=None):
+    """
+    Returns the operation of ``document`` that ``operation_name`` picks,
+    or its first operation, or None if it has none.
+    """
+    operations = [
+        definition for definition in document.definitions
+        if isinstance(definition, ast.OperationDefinition)
+    ]
+    operation = operations[0] if operations else None
+    if operation_name is not None:
+        for definition in operations:
+            if definition.name and definition.name.value == operation_name:
+                operation = definition
+    return operation
+
+
+def analyze_cost(registry, schema, document, operation_name=None, variables=None):
+    """
+    Returns the ``QueryCost`` of the operation of ``document`` that
+    ``operation_name`` picks, see ``CostAnalyzer``.
+    """
+    operation = get_operation(document, operation_name)
+    if operation is None:
+        return QueryCost()
+    return CostAnalyzer(registry, schema, document, variables).analyze(operation)
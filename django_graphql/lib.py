@@ -1,10 +1,17 @@
 import functools
+import json
 import pprint
+import sys
+from collections import OrderedDict
 from contextlib import contextmanager
 
+from django.db.models import Manager, Prefetch
+
 from graphql.core.error import GraphQLError
-from graphql.core.execution import Executor
-from graphql.core.execution.middlewares.sync import SynchronousExecutionMiddleware
+from graphql.core.execution import ExecutionResult, Executor
+from graphql.core.language import ast
+from graphql.core.language.parser import parse
+from graphql.core.language.source import Source
 from graphql.core.type import (
     GraphQLBoolean,
     GraphQLFloat,
@@ -17,19 +24,96 @@ from graphql.core.type import (
     GraphQLSchema,
     GraphQLString,
 )
+from graphql.core.validation import validate
+
+from .cache import BoundedCache, PlanCache
+from .concurrency import ConcurrentExecutor
+from .cost import QueryCostError, analyze_cost, format_error, get_operation
+from .loaders import LoaderRegistry, RootLookupLoader
+from .metrics import MetricsMiddleware
+from .nplusone import QueryAttributionMiddleware
+from .pagination import (
+    CONNECTION_ARGS,
+    MAX_PAGE_SIZE,
+    Page,
+    PageLoader,
+    make_connection_type,
+    paginate,
+)
+from .persisted import PersistedQueryStore
+from .relations import FORWARD, REVERSE, get_column, get_relation, get_relation_path
+from .streaming import stream_execution
+from .tracing import TracingMiddleware
 
 
 class DjangoSchema(object):
-    def __init__(self, registry, plugins=()):
+    def __init__(self, registry, plugins=(), document_cache_size=128,
+                 document_cache_eviction='lru', strict_persisted_queries=True,
+                 strict_prefetch=False, max_workers=0, concurrent_loaders=False,
+                 max_depth=None, max_rows=None, max_queries=None, result_cache=None,
+                 persisted_query_cache_size=1024):
+        """
+        Args:
+            registry (TypeRegistry): holds the DjangoTypes exposed by the schema
+            plugins (iterable): see ``apply_plugins``
+            document_cache_size (int): number of parsed and validated documents
+                kept in ``document_cache``; 0 disables the cache
+            document_cache_eviction (str): 'lru' or 'fifo', see ``BoundedCache``
+            strict_persisted_queries (bool): only execute persisted queries
+                registered up front, see ``PersistedQueryStore``
+            strict_prefetch (bool): raise ValueError if a list field of a
+                registered DjangoType has no resolvable prefetch path, see
+                ``DjangoType.check_prefetch``
+            max_workers (int): resolve the root fields of queries concurrently
+                on a pool of this many threads, see ``ConcurrentExecutor``;
+                0 resolves them one after another
+            concurrent_loaders (bool): with ``max_workers``, also load the
+                batches of different ``BatchLoader``s concurrently
+            max_depth (int): reject documents nesting fields deeper than this
+            max_rows (int): reject documents estimated to load more rows
+            max_queries (int): reject documents estimated to issue more SQL
+                queries; see ``cost.CostAnalyzer`` for the three estimates
+            result_cache (ResultCache): caches the results of root lookups,
+                see ``result_cache.ResultCache``
+            persisted_query_cache_size (int): number of persisted queries
+                registered on demand which are kept when not strict
+        """
         self.registry = registry
         self.plugins = plugins
+        self.document_cache = BoundedCache(
+            maxsize=document_cache_size,
+            eviction=document_cache_eviction)
 
         self.query_root = GraphQLObjectType(
             'QUERY_ROOT',
             fields=self._get_root_fields)
         # TODO: add mutation root to GraphQLSchema
         self.schema = GraphQLSchema(query=self.query_root)
-        self.executor = Executor([SynchronousExecutionMiddleware()])
+        # Resolvers may return Deferreds from ``BatchLoader``s, which
+        # ``execute`` fires by dispatching the request's loaders.
+        self.max_workers = max_workers
+        self.concurrent_loaders = concurrent_loaders
+        self.result_cache = result_cache
+        middlewares = [
+            TracingMiddleware(),
+            MetricsMiddleware(),
+            QueryAttributionMiddleware(registry),
+        ]
+        if max_workers:
+            self.executor = ConcurrentExecutor(max_workers, execution_middlewares=middlewares)
+        else:
+            self.executor = Executor(execution_middlewares=middlewares)
+        self.persisted_queries = PersistedQueryStore(
+            self.schema,
+            strict=strict_persisted_queries,
+            on_demand_size=persisted_query_cache_size)
+        self.cost_limits = {
+            'depth': max_depth,
+            'rows': max_rows,
+            'queries': max_queries,
+        }
+        if strict_prefetch:
+            self.check_prefetch()
 
     def _get_root_fields(self):
         root_type_names = [
@@ -42,9 +126,23 @@ class DjangoSchema(object):
             root_spec.update(self.registry._get_root_spec(name))
         return root_spec
 
+    def check_prefetch(self):
+        problems = [
+            problem
+            for name, entry in sorted(self.registry._types.iteritems())
+            if entry.django_type is not None
+            for problem in entry.django_type.check_prefetch()
+        ]
+        if problems:
+            raise ValueError(
+                "Expected every list field to have a prefetch path, saw:\n%s"
+                % '\n'.join(problems))
+
     @contextmanager
-    def apply_plugins(self, request=None, root=None, schema=None):
+    def apply_plugins(self, request=None, root=None, schema=None, plugins=()):
         """
+        Applies the schema's plugins, followed by ``plugins``.
+
         Plugins must have an ``apply`` method and are assumed to
         take a dict of:
         {
@@ -54,24 +152,257 @@ class DjangoSchema(object):
         }
 
         Each plugin's ``apply`` method should return a new dict
-        with those same keys.
+        with those same keys, and optionally a 'request_context' dict of
+        entries to add to the ``request_context`` resolvers see, and an
+        'on_result' callable, which ``execute`` calls with the
+        ``ExecutionResult``, the name of the executed operation (or None)
+        and its estimated ``QueryCost`` (None if the document didn't
+        parse or validate) before the plugin's context exits;
+        ``execute_stream`` passes None rather than the result once the
+        stream has been written.
+
+        If execution raises, each plugin's context exits with that
+        exception, so code after a plugin's ``yield`` only runs on failure
+        if it's in a ``finally``.
         """
         plugin_kwargs = {
             'request': request,
             'root': root,
             'schema': schema
         }
+        request_context = {}
+        on_result = []
         contexts = []
         # TODO: replace with backported ExitStack()
-        for plugin in self.plugins:
+        for plugin in tuple(self.plugins) + tuple(plugins):
             context = plugin.apply(**plugin_kwargs)
-            plugin_kwargs = context.__enter__()
+            plugin_kwargs = dict(context.__enter__())
+            request_context.update(plugin_kwargs.pop('request_context', None) or {})
+            if plugin_kwargs.get('on_result') is not None:
+                on_result.append(plugin_kwargs['on_result'])
+            plugin_kwargs.pop('on_result', None)
             contexts.append((context, plugin_kwargs))
-        yield plugin_kwargs
+        plugin_kwargs = dict(
+            plugin_kwargs,
+            request_context=request_context,
+            on_result=on_result)
+        # ``sys.exc_info()`` can't be read in a ``finally``: Python 2 leaves
+        # the last handled exception there even when the body succeeded.
+        try:
+            yield plugin_kwargs
+        except BaseException:
+            exc_info = sys.exc_info()
+        else:
+            exc_info = (None, None, None)
+        # Each plugin exits with the exception execution raised, if any.
+        # Plugins recording queries must stop even if another plugin's exit
+        # failed; that failure is raised once every plugin has exited, unless
+        # execution's own exception is already propagating.
+        exit_exc_info = None
         for context, kwargs in contexts[::-1]:
-            context.__exit__(None, None, None)
+            try:
+                context.__exit__(*exc_info)
+            except Exception:
+                if sys.exc_info()[1] is not exc_info[1]:
+                    exit_exc_info = exit_exc_info or sys.exc_info()
+        if exc_info[0] is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if exit_exc_info is not None:
+            raise exit_exc_info[0], exit_exc_info[1], exit_exc_info[2]
+
+    @contextmanager
+    def request_context(self):
+        """
+        Yields the ``request_context`` of one execution: the request's
+        ``LoaderRegistry``, the schema's ``result_cache``, and the request's
+        ``RequestWork`` if root fields are resolved concurrently.
+        """
+        if not self.max_workers:
+            yield {'loaders': LoaderRegistry(), 'result_cache': self.result_cache}
+            return
+        with self.executor.get_work() as work:
+            yield {
+                'loaders': LoaderRegistry(work if self.concurrent_loaders else None),
+                'work': work,
+                'result_cache': self.result_cache,
+            }
+
+    def get_document(self, schema, graphql_string):
+        """
+        Parses and validates ``graphql_string`` against ``schema``, reusing
+        the result of earlier calls from ``document_cache``.
+
+        Plugins may swap the schema a request runs against, so cache
+        entries are keyed by (schema, query text).
+
+        Returns:
+            tuple of (graphql.core.language.ast.Document, list of validation
+            errors); the document is None if the text doesn't parse, and the
+            errors hold the syntax error
+        """
+        key = (schema, graphql_string)
+        cached = self.document_cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            document = parse(Source(graphql_string, 'GraphQL request'))
+        except GraphQLError as e:
+            cached = (None, [e])
+        else:
+            cached = (document, validate(schema, document))
+        self.document_cache.set(key, cached)
+        return cached
+
+    def get_cost(self, schema, document, variables=None, operation_name=None):
+        """
+        Returns the ``QueryCost`` of executing ``document`` against ``schema``.
+
+        Raises:
+            QueryCostError: if the cost exceeds the schema's limits
+        """
+        cost = analyze_cost(self.registry, schema, document, operation_name, variables)
+        if cost.exceeded(self.cost_limits):
+            raise QueryCostError(cost, self.cost_limits)
+        return cost
 
-    def execute(self, graphql_string):
+    def execute(self, graphql_string, variables=None, operation_name=None, plugins=()):
+        """
+        Executes ``graphql_string``, which may also be an already validated
+        ``graphql.core.language.ast.Document``, applying ``plugins`` after
+        the schema's own for this execution only.
+
+        Resolvers find the request's ``LoaderRegistry`` in
+        ``info.request_context['loaders']``, and the ``QueryCost`` the
+        document was admitted with in ``info.request_context['cost']``.
+        """
+        kwargs = {
+            'request': graphql_string,
+            'root': self.query_root,
+            'schema': self.schema
+        }
+        with self.apply_plugins(plugins=plugins, **kwargs) as plugin_kwargs:
+            result, operation, cost = self._execute(plugin_kwargs, variables, operation_name)
+            name = operation.name.value if operation and operation.name else operation_name
+            for on_result in plugin_kwargs['on_result']:
+                on_result(result, name, cost)
+            return result
+
+    def _admit(self, schema, request, variables, operation_name):
+        """
+        Returns the document, operation and ``QueryCost`` of ``request``,
+        text or a ``Document``, followed by None, or by the invalid
+        ``ExecutionResult`` to return instead of executing it (with the
+        cost which exceeded the schema's limits, if that's why).
+        """
+        if isinstance(request, ast.Document):
+            document = request
+        else:
+            document, errors = self.get_document(schema, request)
+            if errors:
+                return None, None, None, ExecutionResult(errors=errors, invalid=True)
+        operation = get_operation(document, operation_name)
+        try:
+            cost = self.get_cost(schema, document, variables, operation_name)
+        except QueryCostError as e:
+            return document, operation, e.cost, ExecutionResult(errors=[e], invalid=True)
+        return document, operation, cost, None
+
+    def _execute(self, plugin_kwargs, variables, operation_name):
+        """
+        Returns the ``ExecutionResult`` of the request in ``plugin_kwargs``,
+        the operation it executed (None if the request was invalid) and its
+        ``QueryCost``, see ``_admit``.
+        """
+        schema = plugin_kwargs['schema']
+        root = plugin_kwargs['root']
+        document, operation, cost, invalid = self._admit(
+            schema, plugin_kwargs['request'], variables, operation_name)
+        if invalid is not None:
+            return invalid, operation, cost
+        with self.request_context() as request_context:
+            request_context.update(plugin_kwargs['request_context'])
+            request_context['cost'] = cost
+            deferred = self.executor.execute(
+                schema,
+                request=document,
+                root=root,
+                args=variables,
+                operation_name=operation_name,
+                request_context=request_context,
+                validate_ast=False)
+            if 'work' in request_context:
+                request_context['work'].wait()
+            return request_context['loaders'].resolve(deferred), operation, cost
+
+    def execute_batch(self, requests):
+        """
+        Executes several requests at once and returns their
+        ``ExecutionResult``s, in order. Requests are dicts of 'query' (text
+        or a ``Document``), and optionally 'variables' and 'operationName'.
+
+        The batch pays the per-request overhead once: plugins are applied
+        once (with a None 'request'), and every document shares one
+        ``request_context``, so loaders batch and cache keys across
+        documents. With a serial executor, root fields looking a row up by
+        a unique filter, e.g. ``item(id: 1)`` and ``item(id: 2)``, wait for
+        the rest of the batch and load with one ``id__in`` query per
+        DjangoType and selection (see ``RootLookupLoader``).
+        """
+        kwargs = {
+            'request': None,
+            'root': self.query_root,
+            'schema': self.schema
+        }
+        with self.apply_plugins(**kwargs) as plugin_kwargs:
+            schema = plugin_kwargs['schema']
+            results = [None] * len(requests)
+            operations = [None] * len(requests)
+            costs = [None] * len(requests)
+            with self.request_context() as request_context:
+                request_context.update(plugin_kwargs['request_context'])
+                request_context['batch'] = True
+                executing = []
+                for index, request in enumerate(requests):
+                    variables = request.get('variables')
+                    operation_name = request.get('operationName')
+                    document, operations[index], cost, invalid = self._admit(
+                        schema, request.get('query'), variables, operation_name)
+                    costs[index] = cost
+                    if invalid is not None:
+                        results[index] = invalid
+                        continue
+                    executing.append((index, self.executor.execute(
+                        schema,
+                        request=document,
+                        root=plugin_kwargs['root'],
+                        args=variables,
+                        operation_name=operation_name,
+                        request_context=dict(request_context, cost=cost),
+                        validate_ast=False)))
+                if 'work' in request_context:
+                    request_context['work'].wait()
+                for index, deferred in executing:
+                    results[index] = request_context['loaders'].resolve(deferred)
+
+            for request, operation, result, cost in zip(requests, operations, results, costs):
+                name = operation.name.value if operation and operation.name \
+                    else request.get('operationName')
+                for on_result in plugin_kwargs['on_result']:
+                    on_result(result, name, cost)
+            return results
+
+    def execute_stream(self, graphql_string, variables=None, operation_name=None,
+                       chunk_size=500):
+        """
+        Executes ``graphql_string`` like ``execute``, but returns a generator
+        of JSON fragments which concatenate to ``{"data": ..., "errors": ...}``.
+
+        Root fields resolving to a QuerySet (e.g. '<type>_list') are fetched
+        with ``iterator()`` and prefetched ``chunk_size`` rows at a time, so
+        memory use stays flat however many rows match. The generator can be
+        returned from a ``StreamingHttpResponse``.
+        """
         kwargs = {
             'request': graphql_string,
             'root': self.query_root,
@@ -80,8 +411,74 @@ class DjangoSchema(object):
         with self.apply_plugins(**kwargs) as plugin_kwargs:
             schema = plugin_kwargs['schema']
             request = plugin_kwargs['request']
-            root = plugin_kwargs['root']
-            return self.executor.execute(schema, request=request, root=root)
+            if isinstance(request, ast.Document):
+                document = request
+            else:
+                document, errors = self.get_document(schema, request)
+                if errors:
+                    for on_result in plugin_kwargs['on_result']:
+                        on_result(
+                            ExecutionResult(errors=errors, invalid=True), operation_name, None)
+                    yield json.dumps({'errors': [format_error(e) for e in errors]})
+                    return
+            operation = get_operation(document, operation_name)
+            name = operation.name.value if operation and operation.name else operation_name
+            try:
+                cost = self.get_cost(schema, document, variables, operation_name)
+            except QueryCostError as e:
+                for on_result in plugin_kwargs['on_result']:
+                    on_result(ExecutionResult(errors=[e], invalid=True), name, e.cost)
+                yield json.dumps({'errors': [format_error(e)]})
+                return
+            for fragment in stream_execution(
+                    self.executor,
+                    schema,
+                    document,
+                    plugin_kwargs['root'],
+                    variables=variables,
+                    operation_name=operation_name,
+                    request_context=dict(
+                        plugin_kwargs['request_context'],
+                        loaders=LoaderRegistry(),
+                        cost=cost,
+                        streaming=True),
+                    chunk_size=chunk_size):
+                yield fragment
+            # Errors were streamed as they happened; report none here.
+            for on_result in plugin_kwargs['on_result']:
+                on_result(None, name, cost)
+
+    def execute_persisted(self, query_hash, variables=None, operation_name=None,
+                          graphql_string=None):
+        """
+        Executes the document registered in ``persisted_queries`` under
+        ``query_hash``, without parsing or validating it again.
+
+        Unknown hashes are rejected with a 'PersistedQueryNotFound' error,
+        unless the schema is not strict and ``graphql_string`` is sent along,
+        in which case it is registered first.
+        """
+        try:
+            document = self.get_persisted_document(query_hash, graphql_string)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        return self.execute(document, variables=variables, operation_name=operation_name)
+
+    def get_persisted_document(self, query_hash, graphql_string=None):
+        """
+        Returns the document registered under ``query_hash``, registering
+        ``graphql_string`` first if the hash is unknown (see
+        ``execute_persisted``).
+
+        Raises:
+            GraphQLError: if the hash is unknown and can't be registered
+        """
+        document = self.persisted_queries.get(query_hash)
+        if document is None:
+            if graphql_string is None:
+                raise GraphQLError("PersistedQueryNotFound: '%s'" % query_hash)
+            document = self.persisted_queries.register_on_demand(query_hash, graphql_string)
+        return document
 
 
 class RegistryEntry(object):
@@ -92,28 +489,36 @@ class RegistryEntry(object):
 
 
 class TypeRef(object):
-    def __init__(self, typename, registry, is_list=False):
+    def __init__(self, typename, registry, is_list=False, is_connection=False):
         self.typename = typename
         self.registry = registry
         self.is_list = is_list
+        self.is_connection = is_connection
 
     def __call__(self, typeref):
         """
-        Enables parametrizing other `TypeRef`s, e.g. 'T.List'
+        Enables parametrizing other `TypeRef`s, e.g. 'T.List' or 'T.Connection'
 
         # TODO: add support for DictType
         """
         if self.typename == 'List':
             return type(self)(typeref.typename, self.registry, is_list=True)
+        if self.typename == 'Connection':
+            return type(self)(typeref.typename, self.registry, is_connection=True)
 
     def __repr__(self):
         return 'TypeRef(%s)' % self.typename
 
 
 class TypeRegistry(object):
-    def __init__(self):
+    def __init__(self, plan_cache_size=256):
         self._root = None
         self._types = {}
+        # Prefetch plans keyed by root field AST, see DjangoType.get_prefetch_plan
+        self.plan_cache = PlanCache(maxsize=plan_cache_size)
+        # '<Type>Connection' types, kept apart from ``_types`` since they
+        # have no DjangoType (and no root field)
+        self._connection_types = {}
         self._register(GraphQLList, name='List')
         for scalar in (
                 GraphQLBoolean,
@@ -123,6 +528,20 @@ class TypeRegistry(object):
                 GraphQLString):
             self._register(scalar)
 
+    def get_models(self):
+        """
+        Returns the models of the registered DjangoTypes, and the through
+        models of their many-to-many fields.
+        """
+        models = set()
+        for entry in self._types.values():
+            if entry.django_type is None:
+                continue
+            model = entry.django_type.Meta.model
+            models.add(model)
+            models.update(field.rel.through for field in model._meta.many_to_many)
+        return models
+
     def _register(self, graphql_type, django_type=None, name=None):
         entry = RegistryEntry(graphql_type, django_type=django_type, name=name)
         if entry.name in self._types:
@@ -151,6 +570,13 @@ class TypeRegistry(object):
     def _get_model(self, name):
         return self._get_django_type(name).Meta.model
 
+    def _get_connection_type(self, name):
+        connection_type = self._connection_types.get(name)
+        if connection_type is None:
+            connection_type = self._connection_types[name] = make_connection_type(
+                self._get_graphql_type(name))
+        return connection_type
+
     def _get_root_spec(self, name):
         return self._get_django_type(name).get_root_spec()
 
@@ -173,7 +599,43 @@ class TypeRegistry(object):
         return 'TypeRegistry(%s)' % types_str
 
 
-def prefetch(*fields):
+class PrefetchFilter(object):
+    """
+    Declarative ``Prefetch``: loads the last hop of ``lookup`` filtered by
+    ``filter`` (a dict of ``QuerySet.filter`` keyword arguments), into
+    ``to_attr`` if given. Built by ``@prefetch(lookup, filter=..., to_attr=...)``.
+    """
+    def __init__(self, lookup, filter=None, to_attr=None):
+        self.prefetch_through = lookup
+        self.filter = filter or {}
+        self.to_attr = to_attr
+
+    def get_queryset(self, model):
+        return model.objects.filter(**self.filter)
+
+    def __repr__(self):
+        return 'PrefetchFilter(%r, filter=%r, to_attr=%r)' % (
+            self.prefetch_through, self.filter, self.to_attr)
+
+
+def prefetch(*fields, **kwargs):
+    """
+    Declares the ``prefetch_related`` lookups a resolver reads. Lookups are
+    strings or Django ``Prefetch`` objects; lookups starting with the
+    ``to_attr`` of a ``Prefetch`` declared on the same DjangoType continue
+    from its rows, e.g. ``'current_movements__item'``.
+
+    A single string lookup may also be given ``filter`` and ``to_attr``
+    keyword arguments, see ``PrefetchFilter``.
+    """
+    if kwargs:
+        unknown = set(kwargs) - {'filter', 'to_attr'}
+        if unknown or len(fields) != 1:
+            raise TypeError(
+                "Expected a single lookup with 'filter' and/or 'to_attr' keyword "
+                "arguments, saw: %r, %r" % (fields, kwargs))
+        fields = (PrefetchFilter(fields[0], **kwargs),)
+
     def inner(fn):
         fn._is_prefetch = True
         fn._prefetch = fields
@@ -185,6 +647,21 @@ def prefetch(*fields):
     return inner
 
 
+def requires(*columns):
+    """
+    Declares the model columns a custom ``get_*`` resolver reads, so they
+    are loaded when root resolvers only select the columns a query asks for.
+    """
+    def inner(fn):
+        fn._requires = columns
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return fn(*args, **kwargs)
+        return wrapper
+    return inner
+
+
 def mutation(fn):
     """
     Classmethod decorator that marks DjangoType methods as GraphQL mutations.
@@ -212,8 +689,10 @@ class DjangoTypeMeta(type):
 
         self._fields = []
         self._list_fields = []
+        self._connection_fields = []
         self._queries = []
         self._prefetch = {}
+        self._requires = {}
         self._mutations = []
         registry_set = set()
 
@@ -221,16 +700,21 @@ class DjangoTypeMeta(type):
             if isinstance(attrvalue, TypeRef):
                 if attrvalue.is_list:
                     self._list_fields.append((attrname, attrvalue))
+                elif attrvalue.is_connection:
+                    self._connection_fields.append((attrname, attrvalue))
                 else:
                     self._fields.append((attrname, attrvalue))
                 registry_set.add(attrvalue.registry)
 
-            elif getattr(attrvalue, '_is_prefetch', False):
-                self._prefetch[attrname] = attrvalue._prefetch
-
             elif getattr(attrvalue, '_is_mutation', False):
                 self._mutations.append(attrvalue)
 
+            else:
+                if getattr(attrvalue, '_is_prefetch', False):
+                    self._prefetch[attrname] = attrvalue._prefetch
+                if hasattr(attrvalue, '_requires'):
+                    self._requires[attrname] = attrvalue._requires
+
         if len(registry_set) > 1:
             raise RuntimeError(
                 "Expected a single registry instance to register %s's types, "
@@ -245,16 +729,181 @@ class DjangoTypeMeta(type):
         self.registry._register(object_type, django_type=self)
 
 
+class QueryPlan(object):
+    """
+    How to load ``model`` for one selection set: the columns passed to
+    ``only`` (None loads every column) and the relations loaded along with
+    it. To-one relations are joined with ``select_related``; to-many
+    relations are prefetched, each with a ``QueryPlan`` of its own.
+    """
+    def __init__(self, model, only=None, joined=False, relation_name=None,
+                 queryset=None, to_attr=None, source=None):
+        self.model = model
+        self.only = only
+        self.joined = joined
+        # Set on child plans: what to pass to ``Prefetch``, and the declared
+        # Prefetch / PrefetchFilter customizing them, if any.
+        self.relation_name = relation_name
+        self.queryset = queryset
+        self.to_attr = to_attr
+        self.source = source
+        # relation name (or to_attr) -> QueryPlan
+        self.children = OrderedDict()
+        # prefetch_related lookups that don't resolve to model relations
+        self.lookups = []
+
+    def add_columns(self, columns):
+        if self.only is None:
+            return
+        if columns is None:
+            self.only = None
+            return
+        self.only.extend(c for c in columns if c not in self.only)
+
+    def add_relation(self, relation, columns, source=None):
+        """
+        Returns the child plan loading ``relation``, merging ``columns``
+        into it if the relation was already planned.
+
+        ``source`` is the ``Prefetch`` or ``PrefetchFilter`` customizing the
+        relation's queryset; the child is then keyed by its ``to_attr``.
+        """
+        if relation.kind == FORWARD:
+            self.add_columns([relation.field.name])
+        if columns is not None and relation.kind == REVERSE:
+            # Django matches prefetched rows to parents by foreign key.
+            columns = columns + [relation.field.name]
+
+        to_attr = getattr(source, 'to_attr', None)
+        key = to_attr or relation.name
+        child = self.children.get(key)
+        if child is None:
+            queryset = None
+            if isinstance(source, PrefetchFilter):
+                queryset = source.get_queryset(relation.related_model)
+            elif source is not None:
+                queryset = source.queryset
+            child = self.children[key] = type(self)(
+                relation.related_model,
+                only=list(columns) if columns is not None else None,
+                joined=relation.is_to_one and source is None,
+                relation_name=relation.name,
+                queryset=queryset,
+                to_attr=to_attr,
+                source=source)
+        elif child.source is not source:
+            raise ValueError(
+                "Expected a single prefetch queryset for '%s' on %s, saw: %r and %r. "
+                "Give filtered prefetches a 'to_attr'."
+                % (key, self.model.__name__, child.source, source))
+        else:
+            child.add_columns(columns)
+        return child
+
+    def lookup_paths(self):
+        """
+        Returns the plain ``prefetch_related`` lookups covering this plan.
+        """
+        paths = []
+        for name, child in self.children.items():
+            paths.append(child.relation_name)
+            paths.extend('%s__%s' % (name, path) for path in child.lookup_paths())
+        paths.extend(
+            lookup if isinstance(lookup, basestring) else lookup.prefetch_through
+            for lookup in self.lookups)
+        return paths
+
+    def _flatten(self, prefix, only, select_related, prefetch):
+        if only is not None and self.only is not None:
+            only.extend(prefix + column for column in self.only)
+        for name, child in self.children.items():
+            if child.joined:
+                select_related.append(prefix + name)
+                child._flatten(prefix + name + '__', only, select_related, prefetch)
+            else:
+                prefetch.append(Prefetch(
+                    prefix + child.relation_name,
+                    queryset=child.get_queryset(),
+                    to_attr=child.to_attr))
+        for lookup in self.lookups:
+            if isinstance(lookup, basestring):
+                prefetch.append(prefix + lookup)
+            else:
+                prefetch.append(Prefetch(
+                    prefix + lookup.prefetch_through,
+                    queryset=lookup.queryset,
+                    to_attr=lookup.to_attr))
+
+    def related_lookups(self):
+        """
+        Returns the ``prefetch_related`` lookups loading every relation of
+        this plan, joined ones included, for rows fetched without ``apply``.
+        """
+        prefetch = []
+        for name, child in self.children.items():
+            prefetch.append(Prefetch(
+                child.relation_name,
+                queryset=child.get_queryset(),
+                to_attr=child.to_attr))
+        prefetch.extend(
+            lookup if isinstance(lookup, basestring) else Prefetch(
+                lookup.prefetch_through,
+                queryset=lookup.queryset,
+                to_attr=lookup.to_attr)
+            for lookup in self.lookups)
+        return prefetch
+
+    def apply(self, queryset):
+        only = [] if self.only is not None else None
+        if queryset.query.deferred_loading != (set(), True):
+            # Keep columns deferred by a declared Prefetch queryset.
+            only = None
+        select_related = []
+        prefetch = []
+        self._flatten('', only, select_related, prefetch)
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if only is not None:
+            queryset = queryset.only(*only)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    def get_queryset(self):
+        if self.queryset is not None:
+            return self.apply(self.queryset)
+        return self.apply(self.model.objects.all())
+
+    def __repr__(self):
+        return 'QueryPlan(%s, only=%r, children=%r)' % (
+            self.model.__name__, self.only, self.children.items())
+
+
 class DjangoType(object):
     __metaclass__ = DjangoTypeMeta
 
     @classmethod
     def _get_resolver(cls, field_name):
         def default_resolver(self, obj, *args):
-            return getattr(obj, field_name)
+            value = getattr(obj, field_name)
+            if isinstance(value, Manager):
+                # To-many relation, read from the prefetch cache if planned.
+                return value.all()
+            return value
         resolver = getattr(cls, 'get_%s' % field_name, default_resolver)
         return functools.partial(resolver, cls())
 
+    def load(self, info, loader_class, key):
+        """
+        Loads ``key`` with the request's ``loader_class`` instance, batched
+        with the keys other objects load. Resolvers return the result:
+
+            def get_current_container(self, obj, args, info):
+                return self.load(info, CurrentContainerLoader, obj.pk)
+        """
+        return info.request_context['loaders'].get(loader_class).load(key)
+
     @classmethod
     def get_fields(cls):
         fields = {
@@ -271,41 +920,136 @@ class DjangoType(object):
                 resolver=cls._get_resolver(name))
             for name, typeref in cls._list_fields
         })
+        fields.update({
+            name: GraphQLField(
+                cls.registry._get_connection_type(typeref.typename),
+                description=cls._get_resolver(name).__doc__,
+                args=CONNECTION_ARGS,
+                resolver=cls._get_connection_resolver(name, typeref))
+            for name, typeref in cls._connection_fields
+        })
         return fields
 
+    @classmethod
+    def _get_connection_resolver(cls, field_name, typeref):
+        """
+        Resolves ``T.Connection`` fields to a page of their rows, selected
+        with the 'first', 'after', 'last' and 'before' arguments.
+
+        A ``get_*`` resolver may return the QuerySet to paginate. Otherwise
+        the field names a to-many relation of ``Meta.model``, whose pages
+        are loaded for every parent of a list with a single query.
+        """
+        resolver_name = 'get_%s' % field_name
+        relation = get_relation(cls.Meta.model, field_name)
+        if not hasattr(cls, resolver_name) and (relation is None or relation.is_to_one):
+            raise ValueError(
+                "Expected connection field '%s' on %s to have a '%s' resolver "
+                "or to name a to-many relation of %s"
+                % (field_name, cls.__name__, resolver_name, cls.Meta.model.__name__))
+        node_type = cls.registry._get_django_type(typeref.typename)
+
+        def resolve_connection(obj, args, info):
+            page = Page.from_args(args, node_type.Meta.model, node_type.get_max_page_size())
+            plan = node_type.get_connection_plan(info.field_asts[0])
+            if hasattr(cls, resolver_name):
+                queryset = getattr(cls(), resolver_name)(obj, args, info)
+                return paginate(plan.apply(queryset), page)
+            loader = info.request_context['loaders'].get(PageLoader)
+            return loader.load(((relation, plan, page), obj.pk))
+
+        return resolve_connection
+
+    @classmethod
+    def get_max_page_size(cls):
+        """
+        Returns the largest page of the type's connections: the
+        'max_page_size' of ``Meta.connection`` when it's a dict of options
+        rather than True, or ``MAX_PAGE_SIZE``.
+        """
+        options = getattr(cls.Meta, 'connection', None)
+        if isinstance(options, dict):
+            return options.get('max_page_size', MAX_PAGE_SIZE)
+        return MAX_PAGE_SIZE
+
     @classmethod
     def get_root_spec(cls):
+        """
+        Root fields for ``Meta.model``: '<type>' looks a row up by
+        ``Meta.filters``, '<type>_list' returns every row matching lists of
+        values for them, and '<type>_connection' paginates rows if
+        ``Meta.connection`` is set.
+        """
         name = cls.__name__
-        return {
+        spec = {
             name.lower(): GraphQLField(
                 cls.registry._get_graphql_type(name),
                 description=cls.__doc__,
                 args=cls.get_root_args(),
                 resolver=cls.get_root_resolver()
-            )
+            ),
+            '%s_list' % name.lower(): GraphQLField(
+                GraphQLList(cls.registry._get_graphql_type(name)),
+                description=cls.__doc__,
+                args=cls.get_root_args(many=True),
+                resolver=cls.get_root_resolver(many=True)
+            ),
         }
+        if getattr(cls.Meta, 'connection', False):
+            args = cls.get_root_args()
+            args.update(CONNECTION_ARGS)
+            spec['%s_connection' % name.lower()] = GraphQLField(
+                cls.registry._get_connection_type(name),
+                description=cls.__doc__,
+                args=args,
+                resolver=cls.get_root_connection_resolver())
+        return spec
 
     @classmethod
-    def get_root_args(cls):
-        return {
-            field_name: GraphQLArgument(
-                type=cls.registry._get_graphql_type(typeref.typename))
-            for field_name, typeref in cls._fields
-            if field_name in cls.Meta.filters
-        }
+    def get_root_connection_resolver(cls):
+        def get_connection(root, query_args, info):
+            """
+            Fetches a page of the rows matching ``Meta.filters`` arguments,
+            with one keyset query plus the prefetches the selection needs.
+            """
+            model = cls.Meta.model
+            page = Page.from_args(query_args, model, cls.get_max_page_size())
+            filter_kwargs = dict(
+                (name, value) for name, value in query_args.iteritems()
+                if name not in CONNECTION_ARGS)
+            plan = cls.get_connection_plan(info.field_asts[0])
+            return paginate(plan.apply(model.objects.filter(**filter_kwargs)), page)
+
+        return get_connection
 
     @classmethod
-    def get_root_resolver(cls):
+    def get_root_args(cls, many=False):
+        """
+        Arguments for ``Meta.filters``, taking lists of values if ``many``.
         """
-        Call ``Model.objects.get()`` with arguments from GraphQL query.
+        args = {}
+        for field_name, typeref in cls._fields:
+            if field_name in cls.Meta.filters:
+                arg_type = cls.registry._get_graphql_type(typeref.typename)
+                args[field_name] = GraphQLArgument(
+                    type=GraphQLList(arg_type) if many else arg_type)
+        return args
+
+    @classmethod
+    def get_root_resolver(cls, many=False):
+        """
+        Call ``Model.objects.get()`` with arguments from GraphQL query, or
+        ``Model.objects.filter()`` if ``many``.
 
         Allowable filter fields are specified in ``DjangoType.Meta.filters``.
         """
+        unique_filters = cls.get_unique_filters()
+
         def get_model(root, query_args, info):
             """
             Fetches model(s) with Django manager ``get`` or ``filter`` method,
-            and prefetches related fields as specified by DjangoType
-            @prefetch decorators.
+            loading only the columns the query selects, and prefetches
+            related fields as specified by DjangoType @prefetch decorators.
 
             Args:
                 root (GraphQLObjectType): GraphQL query root
@@ -314,30 +1058,124 @@ class DjangoType(object):
                     context and schema
 
             Returns:
-                Single Django model or Django QuerySet.
+                Single Django model (or None if no row matches) or Django QuerySet.
 
-            TODO: wrap prefetched object caches in PredicateQuerySets to allow
-                calling manager methods inside resolvers w/o incurring queries.
+            Single models are fetched with one query: ``get()`` when the
+            arguments cover a unique constraint, ``LIMIT 1`` otherwise.
+
+            Resolvers can wrap prefetched relations in a ``PredicateQuerySet``
+            to call manager methods without incurring queries.
+
+            With a schema ``result_cache``, results are read from and stored
+            in it (QuerySets as lists), unless ``Meta.cache_results`` is False.
             """
-            root_fields = info.schema.get_type_map()['QUERY_ROOT'].get_fields()
-            field = info.field_asts[0]
-            graphql_type = root_fields[field.name.value].type
-            prefetch = cls.prefetch_list(field, graphql_type, cls)
+            graphql_type = info.return_type
+            if isinstance(graphql_type, GraphQLList):
+                graphql_type = graphql_type.of_type
+            plan = cls.get_prefetch_plan(info.field_asts[0], graphql_type)
+
+            result_cache = info.request_context.get('result_cache')
+            if result_cache is not None and getattr(cls.Meta, 'cache_results', True):
+                return result_cache.get_or_load(
+                    info.field_name, query_args, plan, lambda: load(plan, query_args))
+
+            # In a batch, lookups by one unique filter load together
+            # (RootLookupLoader isn't thread-safe: not with a worker pool).
+            if info.request_context.get('batch') and 'work' not in info.request_context \
+                    and not many and len(query_args) == 1:
+                (name, value), = query_args.items()
+                if frozenset([name]) in unique_filters and not isinstance(value, list):
+                    return info.request_context['loaders'].get(RootLookupLoader).load_row(
+                        cls, name, plan, value)
+            return load(plan, query_args)
+
+        def load(plan, query_args):
             model = cls.Meta.model
-
-            if any(isinstance(values, list) for values in query_args.itervalues()):
+            if many or any(isinstance(values, list) for values in query_args.itervalues()):
                 filter_kwargs = cls._format_list_fields(query_args)
                 # Return QuerySet.
-                return model.objects.filter(**filter_kwargs).prefetch_related(*prefetch)
+                return plan.apply(model.objects.filter(**filter_kwargs))
 
             # Return single object, not QuerySet.
-            obj_qs = model.objects.filter(**query_args).prefetch_related(*prefetch)
-            if not obj_qs.exists():
-                return None
-            return obj_qs[0]
+            obj_qs = plan.apply(model.objects.all())
+            if any(fields <= set(query_args) for fields in unique_filters):
+                try:
+                    return obj_qs.get(**query_args)
+                except model.DoesNotExist:
+                    return None
+            objs = list(obj_qs.filter(**query_args)[:1])
+            return objs[0] if objs else None
 
         return get_model
 
+    @classmethod
+    def get_unique_filters(cls):
+        """
+        Returns the sets of ``Meta.filters`` that cover a unique field or
+        ``unique_together`` constraint of ``Meta.model``; root lookups
+        filtering on all fields of one of them match at most one row.
+        """
+        opts = cls.Meta.model._meta
+        constraints = [
+            (field.name,) for field in opts.concrete_fields if field.unique
+        ]
+        constraints.extend(opts.unique_together)
+        filters = set(getattr(cls.Meta, 'filters', ()))
+        return [
+            frozenset(fields) for fields in constraints
+            if filters.issuperset(fields)
+        ]
+
+    @classmethod
+    def get_prefetch_plan(cls, field, graphql_type):
+        """
+        Returns the ``QueryPlan`` for a root field, built once per field AST.
+
+        Field ASTs belong to a single (cached) document and the plan only
+        depends on the selection set, so repeated documents skip the
+        selection set walk. Build timings are kept in ``registry.plan_cache``.
+        """
+        return cls.registry.plan_cache.get_or_build(
+            field,
+            lambda: cls.build_plan(field, graphql_type))
+
+    @classmethod
+    def get_connection_plan(cls, field):
+        """
+        Returns the ``QueryPlan`` loading the nodes of connection ``field``,
+        built once per field AST from its ``edges { node { ... } }``
+        selection set.
+        """
+        def build():
+            model = cls.Meta.model
+            try:
+                node_field = cls._get_node_field(field)
+            except ValueError:
+                # Fragments may select anything.
+                return QueryPlan(model)
+            if node_field is None:
+                return QueryPlan(model, only=[model._meta.pk.name])
+            return cls.build_plan(node_field, cls.registry._get_graphql_type(cls.__name__))
+        return cls.registry.plan_cache.get_or_build(field, build)
+
+    @staticmethod
+    def _get_node_field(field):
+        """
+        Returns the 'node' field AST of connection ``field``, or None if no
+        node is selected. Raises ValueError if fragments hide the selection.
+        """
+        for selection in field.selection_set.selections:
+            if not isinstance(selection, ast.Field):
+                raise ValueError(selection)
+            if selection.name.value != 'edges' or not selection.selection_set:
+                continue
+            for node in selection.selection_set.selections:
+                if not isinstance(node, ast.Field):
+                    raise ValueError(node)
+                if node.name.value == 'node':
+                    return node
+        return None
+
     @classmethod
     def _format_list_fields(cls, query_args):
         formatted = {}
@@ -349,43 +1187,218 @@ class DjangoType(object):
         return formatted
 
     @classmethod
-    def prefetch_list(cls, field, graphql_type, django_type):
+    def _get_nested_types(cls, graphql_type, field):
         """
-        Generates list to be passed to prefetch_related to minimize
-        database queries incurred by GraphQL request.
+        Returns the GraphQL object type and DjangoType of the nested ``field``.
+        """
+        nested_graphql_type = graphql_type.get_fields()[field.name.value].type
+        if isinstance(nested_graphql_type, GraphQLList):
+            nested_graphql_type = nested_graphql_type.of_type
+        nested_django_type = cls.registry._get_django_type(nested_graphql_type.name)
+        return nested_graphql_type, nested_django_type
+
+    @classmethod
+    def only_list(cls, field, graphql_type):
+        """
+        Generates the list of columns to pass to ``only`` when loading
+        ``Meta.model`` for the selection set of ``field``.
+
+        Selected fields resolved by attribute access load their own column.
+        Custom ``get_*`` resolvers load the column of the same name, if any,
+        plus columns declared with @requires. Foreign keys followed by
+        prefetched or joined relations are added by ``QueryPlan``.
+
+        Returns:
+            list of field names, or None if a selected field may read any column
+        """
+        model = cls.Meta.model
+        columns = [model._meta.pk.name]
+
+        for nested_field in field.selection_set.selections:
+            if not isinstance(nested_field, ast.Field):
+                return None
+            name = nested_field.name.value
+            if name.startswith('__'):
+                continue
+
+            resolver_name = 'get_%s' % name
+            column = get_column(model, name)
+            needed = [column] if column else []
+            if hasattr(cls, resolver_name):
+                needed.extend(cls._requires.get(resolver_name, ()))
+            elif column is None and get_relation(model, name) is None:
+                # Default resolver reads an attribute we know nothing about.
+                return None
+
+            columns.extend(c for c in needed if c not in columns)
+
+        return columns
+
+    @classmethod
+    def _get_prefetch_lookups(cls, field_name):
+        """
+        Returns the lookups loading ``field_name``: the ones declared with
+        @prefetch on its resolver, or the field itself if it names a
+        relation of ``Meta.model`` (including reverse relations to
+        through models, e.g. 'itemmovement_set').
+        """
+        resolver_name = 'get_%s' % field_name
+        if any(name == field_name for name, _ in cls._connection_fields):
+            # Paginated separately, see ``_get_connection_resolver``.
+            return ()
+        if resolver_name in cls._prefetch:
+            return cls._prefetch[resolver_name]
+        if get_relation(cls.Meta.model, field_name) is not None:
+            return (field_name,)
+        return ()
+
+    @classmethod
+    def _resolve_lookup(cls, lookup):
+        """
+        Resolves a lookup declared with @prefetch (a string, ``Prefetch`` or
+        ``PrefetchFilter``) into a list of (Relation, source) pairs, where
+        ``source`` is the declared object customizing that hop, or None.
+
+        Returns None if the lookup does not resolve to model relations.
+        """
+        source = None if isinstance(lookup, basestring) else lookup
+        parts = (lookup if source is None else lookup.prefetch_through).split('__')
+
+        model = cls.Meta.model
+        path = []
+        aliases = dict(
+            (declared.to_attr, declared)
+            for lookups in cls._prefetch.itervalues()
+            for declared in lookups
+            if getattr(declared, 'to_attr', None))
+        alias = aliases.get(parts[0])
+        if alias is not None and alias is not source:
+            path = cls._resolve_lookup(alias)
+            if path is None:
+                return None
+            parts = parts[1:]
+            model = path[-1][0].related_model
+
+        if parts:
+            relations = get_relation_path(model, '__'.join(parts))
+            if relations is None:
+                return None
+            path.extend((relation, None) for relation in relations)
+        if source is not None:
+            path[-1] = (path[-1][0], source)
+        return path
+
+    @classmethod
+    def check_prefetch(cls):
+        """
+        Returns a list of problems with list fields that would be loaded
+        one query per object: fields whose resolver has no @prefetch and
+        that don't name a relation of ``Meta.model``, and @prefetch lookups
+        that don't resolve to relations.
+
+        Decorate a resolver with a bare ``@prefetch()`` to declare that it
+        needs nothing prefetched.
+        """
+        problems = []
+        model = cls.Meta.model
+        for name, typeref in cls._list_fields:
+            if cls.registry._get_django_type(typeref.typename) is None:
+                continue
+            lookups = cls._get_prefetch_lookups(name)
+            if not lookups and 'get_%s' % name not in cls._prefetch:
+                problems.append(
+                    "%s.%s: no @prefetch on 'get_%s' and '%s' is not a relation of %s"
+                    % (cls.__name__, name, name, name, model.__name__))
+            for lookup in lookups:
+                if cls._resolve_lookup(lookup) is None:
+                    problems.append(
+                        "%s.%s: @prefetch lookup '%s' is not a relation path of %s"
+                        % (cls.__name__, name, lookup, model.__name__))
+        return problems
+
+    @classmethod
+    def build_plan(cls, field, graphql_type):
+        """
+        Builds the ``QueryPlan`` loading ``Meta.model`` and every relation
+        the selection set of ``field`` reaches.
 
         Args:
-            types (OrderedDict): schema type map
-            ast (graphql.core.language.ast.Field): AST of GraphQL request
+            field (graphql.core.language.ast.Field): AST of GraphQL request
+            graphql_type (GraphQLObjectType): type ``field`` resolves to
 
         Returns:
-            list of strings containing model + relation names
+            QueryPlan
         """
-        if field.selection_set is None:
-            return []
+        plan = QueryPlan(cls.Meta.model, only=cls.only_list(field, graphql_type))
+        cls._plan_selections(field, graphql_type, plan)
+        return plan
 
-        prefetch = []
+    @classmethod
+    def _plan_selections(cls, field, graphql_type, plan):
+        if field.selection_set is None:
+            return
 
         for nested_field in field.selection_set.selections:
-            nested_prefetch = list(django_type._prefetch.get(
-                'get_%s' % nested_field.name.value,
-                []))
+            if not isinstance(nested_field, ast.Field):
+                continue
+            nested_prefetch = cls._get_prefetch_lookups(nested_field.name.value)
+            if not nested_prefetch:
+                continue
 
+            nested_django_type = nested_columns = None
             if nested_field.selection_set:
-                fields = graphql_type.get_fields()
-                nested_graphql_type = fields[nested_field.name.value].type
-                if isinstance(nested_graphql_type, GraphQLList):
-                    nested_graphql_type = nested_graphql_type.of_type
-                nested_django_type = cls.registry._get_django_type(nested_graphql_type.name)
-                nested_prefetch.extend([
-                    '%s__%s' % (np, pf)
-                    for np in nested_prefetch
-                    for pf in cls.prefetch_list(
-                        nested_field,
-                        nested_graphql_type,
-                        nested_django_type)
-                ])
-
-            prefetch.extend(nested_prefetch)
+                nested_graphql_type, nested_django_type = cls._get_nested_types(
+                    graphql_type, nested_field)
+                nested_columns = nested_django_type.only_list(
+                    nested_field, nested_graphql_type)
+
+            for lookup in nested_prefetch:
+                path = cls._resolve_lookup(lookup)
+                if path is None:
+                    if isinstance(lookup, PrefetchFilter):
+                        raise ValueError(
+                            "Expected filtered prefetch '%s' on %s to be a relation path"
+                            % (lookup.prefetch_through, cls.__name__))
+                    plan.lookups.append(lookup)
+                    if nested_django_type is not None and isinstance(lookup, basestring):
+                        nested_plan = nested_django_type.build_plan(
+                            nested_field, nested_graphql_type)
+                        plan.lookups.extend(
+                            '%s__%s' % (lookup, nested_lookup)
+                            for nested_lookup in nested_plan.lookup_paths())
+                    continue
+
+                # Only the hop loading the nested type's rows is projected;
+                # resolvers may read any column of the other hops.
+                node = plan
+                nested_node = None
+                for relation, source in path:
+                    if (nested_node is None and nested_django_type is not None and
+                            relation.related_model is nested_django_type.Meta.model):
+                        node = nested_node = node.add_relation(
+                            relation, nested_columns, source)
+                    else:
+                        node = node.add_relation(relation, None, source)
+
+                if nested_node is not None:
+                    nested_django_type._plan_selections(
+                        nested_field, nested_graphql_type, nested_node)
 
-        return prefetch
+    @classmethod
+    def prefetch_list(cls, field, graphql_type, django_type):
+        """
+        Generates list to be passed to prefetch_related to minimize
+        database queries incurred by GraphQL request.
+
+        ``build_plan`` additionally joins to-one relations and restricts
+        loaded columns; this is the equivalent list of plain lookups.
+
+        Args:
+            field (graphql.core.language.ast.Field): AST of GraphQL request
+            graphql_type (GraphQLObjectType): type ``field`` resolves to
+            django_type (DjangoType): DjangoType for ``graphql_type``
+
+        Returns:
+            list of strings containing model + relation names
+        """
+        return django_type.build_plan(field, graphql_type).lookup_paths()
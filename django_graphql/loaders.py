@@ -0,0 +1,246 @@
+import logging
+from collections import Mapping, OrderedDict
+
+from graphql.core.pyutils.defer import Deferred, DeferredList, succeed
+
+from .nplusone import attributed, get_attribution
+from .result_cache import get_plan_key
+
+logger = logging.getLogger(__name__)
+
+
+class BatchLoader(object):
+    """
+    Loads values for many keys with a single call, DataLoader style.
+
+    Subclasses implement ``load_batch``; resolvers call ``load`` and
+    return the Deferred it gives back:
+
+        class CurrentContainerLoader(BatchLoader):
+            def load_batch(self, item_ids):
+                movements = ItemMovement.objects.filter(
+                    item_id__in=item_ids,
+                    left__isnull=True).select_related('container')
+                return {m.item_id: m.container for m in movements}
+
+        class Item(DjangoType):
+            def get_current_container(self, obj, args, info):
+                return self.load(info, CurrentContainerLoader, obj.pk)
+
+    Keys are queued until the executor has resolved every field it can
+    without them, then ``load_batch`` runs once for all of them. Fields
+    resolved from the loaded values queue their own keys for the next
+    batch, so a loader issues one call per nesting level rather than one
+    per object.
+
+    A loader lives for a single request (see ``LoaderRegistry``) and caches
+    the value of every key it has loaded, so loading a key twice is free.
+
+    The queries of a batch are attributed (see ``NPlusOnePlugin``) to the
+    field that queued its first key.
+    """
+    def __init__(self):
+        self._cache = {}
+        self._queue = OrderedDict()
+        self._queued_by = None
+        self._batch_queued_by = None
+
+    def load_batch(self, keys):
+        """
+        Args:
+            keys (list): distinct, hashable keys
+
+        Returns:
+            A list of values in the same order as ``keys``, or a dict mapping
+            keys to values, in which case missing keys load as None. Values
+            that are Exception instances fail the fields that loaded them.
+        """
+        raise NotImplementedError
+
+    def load(self, key):
+        """
+        Returns a Deferred firing with the value for ``key`` once the
+        current batch is dispatched.
+        """
+        if key in self._cache:
+            return succeed(self._cache[key])
+        deferred = Deferred()
+        if not self._queue:
+            self._queued_by = get_attribution()
+        self._queue.setdefault(key, []).append(deferred)
+        return deferred
+
+    def load_many(self, keys):
+        """
+        Returns a Deferred firing with the list of values for ``keys``.
+        """
+        return DeferredList([self.load(key) for key in keys])
+
+    @property
+    def pending(self):
+        return bool(self._queue)
+
+    def dispatch(self):
+        """
+        Loads every queued key with one ``load_batch`` call and fires the
+        Deferreds waiting on them.
+        """
+        queue = self.take_batch()
+        try:
+            values = self.load_values(list(queue))
+        except Exception as e:
+            self.fire(queue, error=e)
+        else:
+            self.fire(queue, values)
+
+    def take_batch(self):
+        """
+        Returns the queued keys, mapped to the Deferreds waiting on them,
+        and starts a new batch.
+        """
+        queue, self._queue = self._queue, OrderedDict()
+        self._batch_queued_by, self._queued_by = self._queued_by, None
+        return queue
+
+    def load_values(self, keys):
+        """
+        Calls ``load_batch``, for the batch last taken with ``take_batch``,
+        returning a list of values in ``keys`` order.
+        """
+        logger.debug('%s loading %s keys', type(self).__name__, len(keys))
+        with attributed(self._batch_queued_by):
+            values = self.load_batch(keys)
+        if isinstance(values, Mapping):
+            values = [values.get(key) for key in keys]
+        else:
+            values = list(values)
+        if len(values) != len(keys):
+            raise ValueError(
+                '%s.load_batch() returned %s values for %s keys'
+                % (type(self).__name__, len(values), len(keys)))
+        return values
+
+    def fire(self, queue, values=None, error=None):
+        """
+        Fires the Deferreds of a batch taken with ``take_batch``, with
+        ``values`` or, if ``load_values`` raised, with ``error``.
+        """
+        if error is not None:
+            for deferreds in queue.itervalues():
+                for deferred in deferreds:
+                    deferred.errback(error)
+            return
+
+        for key, value in zip(queue, values):
+            if not isinstance(value, Exception):
+                self._cache[key] = value
+            for deferred in queue[key]:
+                if isinstance(value, Exception):
+                    deferred.errback(value)
+                else:
+                    deferred.callback(value)
+
+
+class LoaderRegistry(object):
+    """
+    The ``BatchLoader``s used by one request, one instance per loader class.
+
+    ``DjangoSchema.execute`` creates a registry per request and exposes it
+    to resolvers as ``info.request_context['loaders']``.
+
+    Given a ``RequestWork`` (see ``ConcurrentExecutor``), loaders with
+    queued keys load their batches concurrently.
+    """
+    def __init__(self, work=None):
+        self.work = work
+        self._loaders = OrderedDict()
+
+    def get(self, loader_class):
+        loader = self._loaders.get(loader_class)
+        if loader is None:
+            loader = self._loaders[loader_class] = loader_class()
+        return loader
+    __getitem__ = get
+
+    @property
+    def pending(self):
+        return any(loader.pending for loader in self._loaders.values())
+
+    def dispatch(self):
+        """
+        Dispatches every loader with queued keys. Returns False if there
+        was nothing to dispatch.
+        """
+        loaders = [loader for loader in self._loaders.values() if loader.pending]
+        if self.work is None or len(loaders) < 2:
+            for loader in loaders:
+                loader.dispatch()
+            return bool(loaders)
+
+        batches = [(loader, loader.take_batch()) for loader in loaders]
+
+        def load(batch):
+            loader, queue = batch
+            try:
+                return loader.load_values(list(queue)), None
+            except Exception as e:
+                return None, e
+
+        # Deferreds are fired here, on the requesting thread.
+        for (loader, queue), (values, error) in zip(batches, self.work.map(load, batches)):
+            loader.fire(queue, values, error)
+        return True
+
+    def resolve(self, deferred):
+        """
+        Dispatches loaders until ``deferred`` (an execution result) fires,
+        and returns its result.
+        """
+        while not deferred.called or deferred.paused:
+            if not self.dispatch():
+                raise RuntimeError(
+                    'Execution is waiting on a Deferred that no BatchLoader '
+                    'will fire')
+        return deferred.result
+
+
+class RootLookupLoader(BatchLoader):
+    """
+    Loads the rows root fields of a batch of documents look up by one
+    unique filter (see ``DjangoSchema.execute_batch``). Lookups of the
+    same DjangoType, filter and selection load with one ``<filter>__in``
+    query. Keys are ((DjangoType, filter, plan key), value).
+    """
+    def __init__(self):
+        super(RootLookupLoader, self).__init__()
+        self._plans = {}
+
+    def load_row(self, django_type, name, plan, value):
+        """
+        Returns a Deferred firing with the ``django_type`` row whose
+        ``name`` is ``value``, loaded with ``plan``, or None.
+        """
+        lookup = (django_type, name, repr((get_plan_key(plan), plan.lookups)))
+        self._plans.setdefault(lookup, plan)
+        return self.load((lookup, value))
+
+    def load_batch(self, keys):
+        lookups = OrderedDict()
+        for lookup, value in keys:
+            lookups.setdefault(lookup, []).append(value)
+
+        results = {}
+        for lookup, values in lookups.iteritems():
+            django_type, name, _ = lookup
+            model = django_type.Meta.model
+            queryset = self._plans[lookup].apply(
+                model.objects.filter(**{'%s__in' % name: values}))
+            fields, deferred = queryset.query.deferred_loading
+            if not deferred and name not in fields:
+                # Rows are matched to lookups by the filtered column.
+                queryset = queryset.only(*(list(fields) + [name]))
+            attname = model._meta.get_field(name).attname
+            rows = dict((getattr(row, attname), row) for row in queryset)
+            for value in values:
+                results[lookup, value] = rows.get(value)
+        return results
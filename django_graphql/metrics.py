@@ -0,0 +1,380 @@
+"""
+Process-wide request metrics, aggregated across requests rather than
+returned with them, and exported in the Prometheus text format.
+
+Each request accumulates its own measurements without locking, and adds
+them to the shared ``Metrics`` in one locked update when it finishes.
+"""
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import time
+
+from django.http import HttpResponse
+
+from graphql.core.pyutils.defer import Deferred
+
+from .recording import recording
+from .tracing import get_resolve_args
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+REQUEST_LABELS = ('operation',)
+ROOT_FIELD_LABELS = ('operation', 'field')
+
+# name -> (type, help, label names, buckets or None)
+FAMILIES = OrderedDict([
+    ('graphql_requests_total', (
+        'counter', 'GraphQL requests executed.', REQUEST_LABELS, None)),
+    ('graphql_errors_total', (
+        'counter', 'Errors returned by GraphQL requests.', REQUEST_LABELS, None)),
+    ('graphql_request_duration_seconds', (
+        'histogram', 'Time to execute a GraphQL request.',
+        REQUEST_LABELS, DURATION_BUCKETS)),
+    ('graphql_request_sql_queries', (
+        'histogram', 'SQL queries run per GraphQL request.',
+        REQUEST_LABELS, QUERY_COUNT_BUCKETS)),
+    ('graphql_request_sql_duration_seconds', (
+        'histogram', 'Time spent running SQL per GraphQL request.',
+        REQUEST_LABELS, DURATION_BUCKETS)),
+    ('graphql_root_field_errors_total', (
+        'counter', 'Errors raised by root field resolvers.', ROOT_FIELD_LABELS, None)),
+    ('graphql_root_field_duration_seconds', (
+        'histogram', 'Time to resolve a root field.',
+        ROOT_FIELD_LABELS, DURATION_BUCKETS)),
+    ('graphql_root_field_sql_queries', (
+        'histogram', 'SQL queries run per root field resolution.',
+        ROOT_FIELD_LABELS, QUERY_COUNT_BUCKETS)),
+    ('graphql_root_field_sql_duration_seconds', (
+        'histogram', 'Time spent running SQL per root field resolution.',
+        ROOT_FIELD_LABELS, DURATION_BUCKETS)),
+])
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(names, values):
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in zip(names, values))
+
+
+class Metrics(object):
+    """
+    Counters and fixed-bucket histograms of the ``FAMILIES`` above, keyed
+    by their label values.
+
+    Operation names come from clients, so only the first
+    ``max_operations`` distinct names get their own label value; later
+    ones are counted as 'other'.
+    """
+    def __init__(self, max_operations=100):
+        self.max_operations = max_operations
+        self._operations = set()
+        # (name, label values) -> count, or [count per bucket..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_operation_label(self, operation_name):
+        label = operation_name or 'anonymous'
+        if label in self._operations:
+            return label
+        with self._lock:
+            if len(self._operations) >= self.max_operations:
+                return 'other'
+            self._operations.add(label)
+        return label
+
+    def update(self, increments=(), observations=()):
+        """
+        Adds ``increments``, (counter name, label values, amount) tuples,
+        and ``observations``, (histogram name, label values, value)
+        tuples, under one lock.
+        """
+        with self._lock:
+            for name, labels, amount in increments:
+                key = (name, labels)
+                self._values[key] = self._values.get(key, 0) + amount
+            for name, labels, value in observations:
+                buckets = FAMILIES[name][3]
+                key = (name, labels)
+                counts = self._values.get(key)
+                if counts is None:
+                    counts = self._values[key] = [0] * (len(buckets) + 2)
+                counts[bisect_left(buckets, value)] += 1
+                counts[-1] += value
+
+    def record(self, request_metrics):
+        """
+        Adds the measurements of a finished ``RequestMetrics``.
+        """
+        operation = self.get_operation_label(request_metrics.operation_name)
+        labels = (operation,)
+        increments = [
+            ('graphql_requests_total', labels, 1),
+            ('graphql_errors_total', labels, request_metrics.errors),
+        ]
+        observations = [
+            ('graphql_request_duration_seconds', labels, request_metrics.duration),
+            ('graphql_request_sql_queries', labels, len(request_metrics.queries)),
+            ('graphql_request_sql_duration_seconds', labels,
+             sum(duration for _, duration in request_metrics.queries)),
+        ]
+        for field in request_metrics.get_root_fields():
+            labels = (operation, field.name)
+            increments.append(('graphql_root_field_errors_total', labels, int(field.error)))
+            observations.extend([
+                ('graphql_root_field_duration_seconds', labels, field.duration),
+                ('graphql_root_field_sql_queries', labels, field.queries),
+                ('graphql_root_field_sql_duration_seconds', labels, field.sql_duration),
+            ])
+        self.update(increments, observations)
+
+    def get_value(self, name, **labels):
+        """
+        Returns the count of counter ``name``, or the (bucket counts,
+        sum) of histogram ``name``, for ``labels``; None if nothing was
+        recorded for them.
+        """
+        value = self._values.get((name, tuple(labels[label] for label in FAMILIES[name][2])))
+        if value is None or FAMILIES[name][0] == 'counter':
+            return value
+        return value[:-1], value[-1]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._operations.clear()
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            values = sorted(
+                (key, value[:] if isinstance(value, list) else value)
+                for key, value in self._values.items())
+        lines = []
+        for name, (kind, help, label_names, buckets) in FAMILIES.items():
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for (family, labels), value in values:
+                if family != name:
+                    continue
+                if kind == 'counter':
+                    lines.append('%s%s %s' % (
+                        name, _format_labels(label_names, labels), _format_value(value)))
+                    continue
+                cumulative = 0
+                for le, count in zip(buckets + (float('inf'),), value[:-1]):
+                    cumulative += count
+                    lines.append('%s_bucket%s %s' % (
+                        name,
+                        _format_labels(label_names + ('le',), labels + (_format_value(float(le)),)),
+                        cumulative))
+                lines.append('%s_sum%s %s' % (
+                    name, _format_labels(label_names, labels), _format_value(value[-1])))
+                lines.append('%s_count%s %s' % (
+                    name, _format_labels(label_names, labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+default_metrics = Metrics()
+
+
+class RootFieldMetrics(object):
+    """
+    One root field resolution: its resolver's duration (in seconds,
+    including evaluating a returned QuerySet and its prefetches), the SQL
+    the resolver ran, and whether it raised.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_duration = 0.0
+        self.error = False
+
+
+class RequestMetrics(object):
+    """
+    The measurements of one request, recorded without locks: queries are
+    appended to a list, which is safe across the threads of a
+    ``ConcurrentExecutor``, and summed once the request finishes.
+    """
+    def __init__(self):
+        self.start_time = time()
+        self.duration = None
+        self.operation_name = None
+        self.errors = 1
+        self.reported = False
+        # (RootFieldMetrics resolving at the time or None, duration)
+        self.queries = []
+        self.root_fields = []
+        self._current = threading.local()
+
+    def wrap_cursor(self, cursor, connection):
+        return MetricsCursorWrapper(cursor, self)
+
+    def record_query(self, duration):
+        self.queries.append((getattr(self._current, 'field', None), duration))
+
+    def resolve_root_field(self, resolve_fn, info):
+        """
+        Calls ``resolve_fn()``, the resolver of root field ``info``, and
+        times it along with the SQL it runs.
+        """
+        # Streamed QuerySets are fetched in chunks after the resolver.
+        fetch = not info.request_context.get('streaming')
+        field = RootFieldMetrics(info.field_name)
+        self.root_fields.append(field)
+        start_time = time()
+
+        def finish(result):
+            field.duration = time() - start_time
+            return result
+
+        def fail(failure):
+            field.error = True
+            return finish(failure)
+
+        self._current.field = field
+        try:
+            result = resolve_fn()
+            if fetch and hasattr(result, '_fetch_all'):
+                result._fetch_all()
+        except Exception:
+            fail(None)
+            raise
+        finally:
+            self._current.field = None
+        if isinstance(result, Deferred):
+            return result.add_callbacks(finish, fail)
+        return finish(result)
+
+    def set_result(self, result, operation_name, cost=None):
+        # Batches report each of their results; the first names the request.
+        errors = len(result.errors or ()) if result is not None else 0
+        if self.reported:
+            self.errors += errors
+            return
+        self.reported = True
+        self.operation_name = operation_name
+        self.errors = errors
+
+    def finish(self):
+        self.duration = time() - self.start_time
+
+    def get_root_fields(self):
+        """
+        Returns the request's ``RootFieldMetrics``, with the SQL their
+        resolvers ran added up.
+        """
+        for field, duration in self.queries:
+            if field is not None:
+                field.queries += 1
+                field.sql_duration += duration
+        return self.root_fields
+
+
+class MetricsCursorWrapper(object):
+    """
+    Wraps a cursor and times the queries it runs for a ``RequestMetrics``.
+    """
+    def __init__(self, cursor, request_metrics):
+        self.cursor = cursor
+        self.request_metrics = request_metrics
+
+    def execute(self, sql, params=()):
+        start_time = time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.request_metrics.record_query(time() - start_time)
+
+    def executemany(self, sql, param_list):
+        start_time = time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.request_metrics.record_query(time() - start_time)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class MetricsMiddleware(object):
+    """
+    graphql-core execution middleware timing the root fields of requests
+    with a ``RequestMetrics`` in ``request_context['metrics']``.
+    """
+    def run_resolve_fn(self, resolve_fn, original_resolve_fn):
+        _, _, info = get_resolve_args(resolve_fn)
+        request_metrics = info.request_context.get('metrics')
+        if request_metrics is None or (
+                info.parent_type is not info.schema.get_query_type() and
+                info.parent_type is not info.schema.get_mutation_type()):
+            return resolve_fn()
+        return request_metrics.resolve_root_field(resolve_fn, info)
+
+
+class MetricsPlugin(object):
+    """
+    Adds every request's count, errors, duration and SQL to ``metrics``,
+    per operation name and per root field, without adding anything to the
+    response. Serve them with ``metrics_view``, or ``metrics.render()``.
+
+    Requests whose execution raised count as one error. Durations are in
+    seconds.
+
+    Args:
+        metrics (Metrics): where to aggregate, by default
+            ``default_metrics``
+    """
+    def __init__(self, metrics=None):
+        self.metrics = metrics if metrics is not None else default_metrics
+
+    @contextmanager
+    def apply(self, request=None, root=None, schema=None):
+        request_metrics = RequestMetrics()
+        try:
+            with recording(request_metrics):
+                yield {
+                    'request': request,
+                    'root': root,
+                    'schema': schema,
+                    'request_context': {'metrics': request_metrics},
+                    'on_result': request_metrics.set_result,
+                }
+        finally:
+            request_metrics.finish()
+            self.metrics.record(request_metrics)
+
+
+def metrics_view(request, metrics=None):
+    """
+    Django view serving ``metrics`` (by default ``default_metrics``) to a
+    Prometheus scraper, e.g.
+    ``url(r'^metrics$', metrics_view, {'metrics': plugin.metrics})``.
+    """
+    metrics = metrics if metrics is not None else default_metrics
+    return HttpResponse(metrics.render(), content_type=CONTENT_TYPE)
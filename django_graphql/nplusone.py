@@ -0,0 +1,270 @@
+import logging
+import re
+import threading
+import warnings
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from graphql.core.pyutils.defer import Deferred
+
+from .recording import recording
+from .relations import get_relation
+from .tracing import ResponsePaths, format_path, get_resolve_args
+
+logger = logging.getLogger(__name__)
+
+_attribution = threading.local()
+
+_IN_PARAMS = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_FROM_TABLE = re.compile(r'\bFROM [`"]?(\w+)')
+
+
+def get_attribution():
+    """
+    Returns the field resolving on this thread, as (path, type name, field
+    name, DjangoType), or None.
+    """
+    return getattr(_attribution, 'field', None)
+
+
+@contextmanager
+def attributed(field):
+    """
+    Attributes the queries run on this thread to ``field``, as returned by
+    ``get_attribution``, e.g. those a ``BatchLoader`` runs for the field
+    that queued its keys.
+    """
+    previous = get_attribution()
+    _attribution.field = field
+    try:
+        yield
+    finally:
+        _attribution.field = previous
+
+
+def get_query_shape(sql):
+    """
+    Returns ``sql`` without its parameters, so queries differing only by
+    the rows they look up share a shape.
+    """
+    return _LITERALS.sub('?', _IN_PARAMS.sub('IN (...)', sql))
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+class NPlusOneError(RuntimeError):
+    pass
+
+
+class NPlusOne(namedtuple('NPlusOne', 'path type_name field_name sql count suggestion')):
+    """
+    A query shape the field at ``path`` ran ``count`` times in one request,
+    across every list index.
+    """
+    def __str__(self):
+        message = '%s ran %s queries shaped: %s' % (self.path, self.count, self.sql)
+        if self.suggestion:
+            message += '\n  ' + self.suggestion
+        return message
+
+
+def get_relations_to(model, sql):
+    """
+    Returns the names of the relations of ``model`` to the table ``sql``
+    selects from.
+    """
+    match = _FROM_TABLE.search(sql)
+    if match is None:
+        return []
+    names = []
+    for name in model._meta.get_all_field_names():
+        relation = get_relation(model, name)
+        if relation is None:
+            accessor = getattr(model._meta.get_field_by_name(name)[0], 'get_accessor_name', None)
+            relation = accessor and get_relation(model, accessor())
+        if relation is not None and \
+                relation.related_model._meta.db_table == match.group(1):
+            names.append(relation.name)
+    return sorted(set(names))
+
+
+def suggest_prefetch(django_type, field_name, sql):
+    """
+    Returns how to load ``field_name`` of ``django_type`` with its parents
+    rather than with ``sql`` for each, or None if ``django_type`` is not a
+    DjangoType.
+    """
+    if django_type is None:
+        return None
+    type_name = django_type.__name__
+    resolver_name = 'get_%s' % field_name
+    model = django_type.Meta.model
+    if get_relation(model, field_name) is not None:
+        lookups = [field_name]
+    else:
+        lookups = get_relations_to(model, sql)
+    lookups = ' or '.join("'%s'" % lookup for lookup in lookups) or '...'
+
+    if resolver_name in django_type._prefetch:
+        return "The @prefetch%r on %s.%s doesn't cover what it reads, e.g. %s." % (
+            tuple(django_type._prefetch[resolver_name]), type_name, resolver_name, lookups)
+    if hasattr(django_type, resolver_name):
+        return 'Decorate %s.%s with @prefetch(%s), or load it with a BatchLoader.' % (
+            type_name, resolver_name, lookups)
+    return (
+        "%s instances resolving '%s' weren't loaded by a root field or "
+        "@prefetch resolver; prefetch %s where they are loaded."
+        % (type_name, field_name, lookups))
+
+
+class QueryAttributionMiddleware(object):
+    """
+    graphql-core execution middleware marking which field is resolving,
+    and at which response path, while its resolver runs, for requests with
+    an ``NPlusOneDetector`` in ``request_context['nplusone']``.
+
+    QuerySets returned by resolvers are evaluated before the mark is
+    removed, so their SQL is attributed to the field returning them.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+
+    def run_resolve_fn(self, resolve_fn, original_resolve_fn):
+        source, _, info = get_resolve_args(resolve_fn)
+        detector = info.request_context.get('nplusone')
+        if detector is None:
+            return resolve_fn()
+
+        entry = self.registry._types.get(info.parent_type.name)
+        django_type = entry.django_type if entry is not None else None
+        path = detector.paths.get(source, info)
+        with attributed((path, info.parent_type.name, info.field_name, django_type)):
+            result = resolve_fn()
+            if hasattr(result, '_fetch_all') and not info.request_context.get('streaming'):
+                result._fetch_all()
+        if isinstance(result, Deferred):
+            return result.add_callback(lambda value: detector.paths.register(path, value))
+        return detector.paths.register(path, result)
+
+
+class AttributedCursorWrapper(object):
+    """
+    Wraps a cursor and records the shape of the queries it runs, along
+    with the field resolving at the time.
+    """
+    def __init__(self, cursor, detector):
+        self.cursor = cursor
+        self.detector = detector
+
+    def execute(self, sql, params=()):
+        self.detector.record(sql)
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.detector.record(sql)
+        return self.cursor.executemany(sql, param_list)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class NPlusOneDetector(object):
+    """
+    Counts the queries of one request by (response path, query shape),
+    paths counting every list index as one, e.g. 'container_list.items'.
+    Fields of the query root are skipped: they run once per request by
+    design.
+    """
+    def __init__(self, root_name, threshold=1):
+        self.root_name = root_name
+        self.threshold = threshold
+        self.paths = ResponsePaths()
+        # path -> (type name, field name, DjangoType, {shape: count})
+        self.counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def wrap_cursor(self, cursor, connection):
+        return AttributedCursorWrapper(cursor, self)
+
+    def record(self, sql):
+        field = get_attribution()
+        if field is None or field[1] == self.root_name:
+            return
+        path, type_name, field_name, django_type = field
+        path = format_path(key for key in path if not isinstance(key, int))
+        shape = get_query_shape(sql)
+        with self._lock:
+            _, _, _, shapes = self.counts.setdefault(
+                path, (type_name, field_name, django_type, {}))
+            shapes[shape] = shapes.get(shape, 0) + 1
+
+    def problems(self):
+        """
+        Returns an ``NPlusOne`` for each query shape a path ran more than
+        ``threshold`` times.
+        """
+        return [
+            NPlusOne(
+                path, type_name, field_name, shape, count,
+                suggest_prefetch(django_type, field_name, shape))
+            for path, (type_name, field_name, django_type, shapes) in self.counts.items()
+            for shape, count in shapes.items()
+            if count > self.threshold
+        ]
+
+
+class NPlusOnePlugin(object):
+    """
+    Reports fields running the same query shape more than ``threshold``
+    times in one request, i.e. once per parent rather than once per level.
+
+    Args:
+        threshold (int): repeats of a query shape tolerated per response
+            path
+        action (str): 'warn' issues an ``NPlusOneWarning``, 'log' logs a
+            warning, 'raise' raises an ``NPlusOneError`` once the request
+            has executed (for tests)
+    """
+    ACTIONS = ('warn', 'log', 'raise')
+
+    def __init__(self, threshold=1, action='warn'):
+        if action not in self.ACTIONS:
+            raise ValueError(
+                "Expected action to be one of %s, saw: %r" % (self.ACTIONS, action))
+        self.threshold = threshold
+        self.action = action
+
+    def report(self, problems):
+        message = 'N+1 queries:\n' + '\n'.join(str(problem) for problem in problems)
+        if self.action == 'raise':
+            raise NPlusOneError(message)
+        if self.action == 'log':
+            logger.warning(message)
+        else:
+            warnings.warn(message, NPlusOneWarning, stacklevel=4)
+
+    @contextmanager
+    def apply(self, request=None, root=None, schema=None):
+        detector = NPlusOneDetector(schema.get_query_type().name, self.threshold)
+        with recording(detector):
+            yield {
+                'request': request,
+                'root': root,
+                'schema': schema,
+                'request_context': {'nplusone': detector},
+            }
+        problems = detector.problems()
+        if problems:
+            self.report(problems)
@@ -0,0 +1,265 @@
+import base64
+import binascii
+from collections import OrderedDict, namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models.query import prefetch_related_objects
+
+from graphql.core.error import GraphQLError
+from graphql.core.type import (
+    GraphQLArgument,
+    GraphQLBoolean,
+    GraphQLField,
+    GraphQLInt,
+    GraphQLList,
+    GraphQLNonNull,
+    GraphQLObjectType,
+    GraphQLString,
+)
+
+from .loaders import BatchLoader
+from .relations import REVERSE
+
+# Page size used when neither 'first' nor 'last' is passed.
+DEFAULT_PAGE_SIZE = 100
+# Largest 'first' or 'last' accepted, unless the node type's
+# ``Meta.connection`` sets its own 'max_page_size'.
+MAX_PAGE_SIZE = 1000
+
+CONNECTION_ARGS = {
+    'first': GraphQLArgument(GraphQLInt),
+    'after': GraphQLArgument(GraphQLString),
+    'last': GraphQLArgument(GraphQLInt),
+    'before': GraphQLArgument(GraphQLString),
+}
+
+
+def encode_cursor(pk):
+    return base64.b64encode('cursor:%s' % pk)
+
+
+def decode_cursor(cursor, model):
+    """
+    Returns the primary key of ``model`` encoded in ``cursor``.
+    """
+    try:
+        prefix, _, value = base64.b64decode(cursor).partition(':')
+        if prefix != 'cursor':
+            raise ValueError(cursor)
+        return model._meta.pk.to_python(value)
+    except (TypeError, ValueError, binascii.Error, ValidationError):
+        raise GraphQLError("Invalid cursor: '%s'" % cursor)
+
+
+class Page(namedtuple('Page', 'limit after before reverse')):
+    """
+    One page of a keyset-paginated list: at most ``limit`` rows with a
+    primary key between ``after`` and ``before`` (both exclusive, None
+    when unbounded), counted from the end of the list if ``reverse``.
+    """
+    @classmethod
+    def from_args(cls, args, model, max_page_size=MAX_PAGE_SIZE):
+        first, last = args.get('first'), args.get('last')
+        if first is not None and last is not None:
+            raise GraphQLError("Pass either 'first' or 'last', not both")
+        limit = first if first is not None else last
+        if limit is None:
+            limit = min(DEFAULT_PAGE_SIZE, max_page_size)
+        if limit < 0:
+            raise GraphQLError("Expected 'first' and 'last' to be non-negative, saw: %s" % limit)
+        if limit > max_page_size:
+            raise GraphQLError(
+                "Expected 'first' and 'last' to be at most %s, saw: %s" % (max_page_size, limit))
+        after, before = args.get('after'), args.get('before')
+        return cls(
+            limit,
+            decode_cursor(after, model) if after is not None else None,
+            decode_cursor(before, model) if before is not None else None,
+            last is not None)
+
+    def filter(self, queryset):
+        """
+        Restricts ``queryset`` to the rows between the page's cursors.
+        ``WHERE pk > after`` uses the primary key index however deep the
+        page is, unlike OFFSET.
+        """
+        if self.after is not None:
+            queryset = queryset.filter(pk__gt=self.after)
+        if self.before is not None:
+            queryset = queryset.filter(pk__lt=self.before)
+        return queryset
+
+    @property
+    def ordering(self):
+        return '-pk' if self.reverse else 'pk'
+
+    def get_connection(self, rows):
+        """
+        Builds the ``Connection`` for ``rows``, fetched in page order with
+        one row more than the page holds, which tells whether more follow.
+        """
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if self.reverse:
+            rows.reverse()
+        return Connection(
+            rows,
+            has_next_page=has_more and not self.reverse,
+            has_previous_page=has_more and self.reverse)
+
+
+def paginate(queryset, page):
+    """
+    Fetches ``page`` of ``queryset`` with a single keyset query (plus the
+    queryset's prefetches).
+    """
+    queryset = page.filter(queryset).order_by(page.ordering)
+    return page.get_connection(list(queryset[:page.limit + 1]))
+
+
+class Edge(object):
+    def __init__(self, node):
+        self.node = node
+        self.cursor = encode_cursor(node.pk)
+
+
+class Connection(object):
+    """
+    A page of model instances, as exposed by ``T.Connection`` fields.
+    """
+    def __init__(self, nodes, has_next_page=False, has_previous_page=False):
+        self.edges = [Edge(node) for node in nodes]
+        self.has_next_page = has_next_page
+        self.has_previous_page = has_previous_page
+
+    @property
+    def start_cursor(self):
+        return self.edges[0].cursor if self.edges else None
+
+    @property
+    def end_cursor(self):
+        return self.edges[-1].cursor if self.edges else None
+
+
+def _attr_resolver(attr):
+    return lambda obj, args, info: getattr(obj, attr)
+
+
+PageInfo = GraphQLObjectType(
+    'PageInfo',
+    description='Where a page of a connection sits in the whole list.',
+    fields={
+        'hasNextPage': GraphQLField(
+            GraphQLNonNull(GraphQLBoolean), resolver=_attr_resolver('has_next_page')),
+        'hasPreviousPage': GraphQLField(
+            GraphQLNonNull(GraphQLBoolean), resolver=_attr_resolver('has_previous_page')),
+        'startCursor': GraphQLField(GraphQLString, resolver=_attr_resolver('start_cursor')),
+        'endCursor': GraphQLField(GraphQLString, resolver=_attr_resolver('end_cursor')),
+    })
+
+
+def make_connection_type(node_type):
+    """
+    Returns the '<Node>Connection' GraphQL type paginating ``node_type``.
+    """
+    edge_type = GraphQLObjectType(
+        '%sEdge' % node_type.name,
+        fields={
+            'cursor': GraphQLField(GraphQLNonNull(GraphQLString)),
+            'node': GraphQLField(node_type),
+        })
+    return GraphQLObjectType(
+        '%sConnection' % node_type.name,
+        description='A page of %s.' % node_type.name,
+        fields={
+            'edges': GraphQLField(GraphQLList(edge_type)),
+            'pageInfo': GraphQLField(
+                GraphQLNonNull(PageInfo), resolver=lambda connection, args, info: connection),
+        })
+
+
+def _get_parent_column(relation, queryset):
+    """
+    Returns the lookup filtering ``relation.related_model`` by parent, and
+    the quoted column holding the parent's primary key in that query.
+    """
+    quote_name = connections[queryset.db].ops.quote_name
+    field = relation.field
+    if relation.kind == REVERSE:
+        table, column = field.model._meta.db_table, field.column
+        lookup = field.name
+    elif field.model is relation.model:
+        # Many-to-many declared on the parent, e.g. Container.items.
+        table, column = field.m2m_db_table(), field.m2m_column_name()
+        lookup = field.related_query_name()
+    else:
+        table, column = field.m2m_db_table(), field.m2m_reverse_name()
+        lookup = field.name
+    return lookup, '%s.%s' % (quote_name(table), quote_name(column))
+
+
+def paginate_related(relation, plan, page, parent_pks):
+    """
+    Fetches ``page`` of ``relation`` for every parent in ``parent_pks`` with
+    a single query, ranking rows per parent with ROW_NUMBER() and keeping
+    the first ``page.limit + 1`` of each.
+
+    The rows are loaded with the columns of ``plan``, then its relations
+    are prefetched for all pages at once.
+
+    Returns:
+        dict of parent primary key -> Connection
+    """
+    model = relation.related_model
+    queryset = model.objects.all()
+    lookup, parent_column = _get_parent_column(relation, queryset)
+    queryset = page.filter(queryset.filter(**{'%s__in' % lookup: parent_pks}))
+    if plan.only is not None:
+        queryset = queryset.only(*plan.only)
+
+    quote_name = connections[queryset.db].ops.quote_name
+    pk_column = '%s.%s' % (
+        quote_name(model._meta.db_table), quote_name(model._meta.pk.column))
+    queryset = queryset.extra(select=OrderedDict([
+        ('_page_parent', parent_column),
+        ('_page_rank', 'ROW_NUMBER() OVER (PARTITION BY %s ORDER BY %s %s)' % (
+            parent_column, pk_column, 'DESC' if page.reverse else 'ASC')),
+    ]))
+    sql, params = queryset.query.sql_with_params()
+    rows = list(model.objects.raw(
+        'SELECT * FROM (' + sql + ') page WHERE _page_rank <= %s '
+        'ORDER BY _page_parent, _page_rank',
+        tuple(params) + (page.limit + 1,)))
+
+    parent_pk = relation.model._meta.pk
+    pages = dict((pk, []) for pk in parent_pks)
+    for row in rows:
+        pages[parent_pk.to_python(row._page_parent)].append(row)
+    # The extra row fetched per page is only counted, not resolved.
+    prefetch_related_objects(
+        [row for page_rows in pages.itervalues() for row in page_rows[:page.limit]],
+        plan.related_lookups())
+    return dict(
+        (pk, page.get_connection(page_rows))
+        for pk, page_rows in pages.iteritems())
+
+
+class PageLoader(BatchLoader):
+    """
+    Loads pages of to-many relations for a batch of parents. Keys are
+    ((relation, plan, page), parent primary key); parents sharing a
+    relation, plan and page are paginated with one query.
+    """
+    def load_batch(self, keys):
+        parents = OrderedDict()
+        for page_query, parent_pk in keys:
+            parents.setdefault(page_query, []).append(parent_pk)
+
+        results = {}
+        for page_query, parent_pks in parents.iteritems():
+            relation, plan, page = page_query
+            for parent_pk, connection in paginate_related(
+                    relation, plan, page, parent_pks).iteritems():
+                results[page_query, parent_pk] = connection
+        return results
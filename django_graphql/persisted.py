@@ -0,0 +1,134 @@
+import hashlib
+import io
+import json
+import os
+
+from graphql.core.error import GraphQLError
+from graphql.core.language.parser import parse
+from graphql.core.language.source import Source
+from graphql.core.validation import validate
+
+from .cache import BoundedCache
+
+
+def hash_query(graphql_string):
+    """
+    Returns the sha256 hex digest clients use to refer to ``graphql_string``.
+    """
+    if not isinstance(graphql_string, bytes):
+        graphql_string = graphql_string.encode('utf-8')
+    return hashlib.sha256(graphql_string).hexdigest()
+
+
+class PersistedQueryStore(object):
+    """
+    Documents registered ahead of time, stored parsed and validated and
+    looked up by hash.
+
+    In strict mode only registered hashes can be executed. Otherwise a
+    client may send an unknown hash along with the query text, which is
+    registered on first use if the hash matches. Clients choose those
+    documents, so they are kept in a ``BoundedCache`` of ``on_demand_size``
+    entries rather than alongside the ones registered ahead of time.
+    """
+    def __init__(self, schema, strict=True, on_demand_size=1024):
+        """
+        Args:
+            schema (GraphQLSchema): schema documents are validated against
+            strict (bool): reject unknown hashes instead of registering them
+            on_demand_size (int): number of documents registered on demand
+                which are kept, least recently used first out
+        """
+        self.schema = schema
+        self.strict = strict
+        self._documents = {}
+        self._on_demand = BoundedCache(maxsize=on_demand_size)
+
+    def register(self, graphql_string, query_hash=None):
+        """
+        Parses and validates ``graphql_string`` and stores it under
+        ``query_hash`` (by default the sha256 of the query text).
+
+        Raises:
+            GraphQLError: if the document does not validate against the schema
+
+        Returns:
+            str: the hash the document was stored under
+        """
+        if query_hash is None:
+            query_hash = hash_query(graphql_string)
+        self._documents[query_hash] = self._validate(graphql_string, query_hash)
+        return query_hash
+
+    def _validate(self, graphql_string, query_hash):
+        document = parse(Source(graphql_string, 'Persisted query %s' % query_hash))
+        errors = validate(self.schema, document)
+        if errors:
+            raise GraphQLError(
+                "Persisted query '%s' is invalid: %s"
+                % (query_hash, '; '.join(error.message for error in errors)))
+        return document
+
+    def register_on_demand(self, query_hash, graphql_string):
+        """
+        Registers a document sent by a client in non-strict mode.
+
+        Raises:
+            GraphQLError: in strict mode, if ``query_hash`` is not the
+                sha256 of ``graphql_string``, or if the document does not
+                validate against the schema
+
+        Returns:
+            the parsed document, which may already have been evicted
+        """
+        if self.strict:
+            raise GraphQLError("PersistedQueryNotFound: '%s'" % query_hash)
+        if hash_query(graphql_string) != query_hash:
+            raise GraphQLError(
+                "Persisted query hash '%s' does not match the query text" % query_hash)
+        document = self._validate(graphql_string, query_hash)
+        self._on_demand.set(query_hash, document)
+        return document
+
+    def load_directory(self, path, extension='.graphql'):
+        """
+        Registers every ``*.graphql`` file below ``path``.
+
+        Returns:
+            list of the registered hashes
+        """
+        hashes = []
+        for dirpath, _, filenames in os.walk(path):
+            for filename in sorted(filenames):
+                if not filename.endswith(extension):
+                    continue
+                with io.open(os.path.join(dirpath, filename), encoding='utf-8') as f:
+                    hashes.append(self.register(f.read()))
+        return hashes
+
+    def load_manifest(self, path):
+        """
+        Registers the documents in a JSON manifest mapping hash (or any
+        client-side id) to query text.
+
+        Returns:
+            list of the registered hashes
+        """
+        with io.open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        return [
+            self.register(graphql_string, query_hash)
+            for query_hash, graphql_string in sorted(manifest.items())
+        ]
+
+    def get(self, query_hash):
+        document = self._documents.get(query_hash)
+        if document is None:
+            document = self._on_demand.get(query_hash)
+        return document
+
+    def __contains__(self, query_hash):
+        return query_hash in self._documents or query_hash in self._on_demand
+
+    def __len__(self):
+        return len(self._documents) + len(self._on_demand)
@@ -0,0 +1,376 @@
+import logging
+import operator
+import threading
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.constants import LOOKUP_SEP
+
+logger = logging.getLogger(__name__)
+
+_COMPARISONS = {
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+}
+LOOKUP_TYPES = ('exact', 'in', 'isnull') + tuple(_COMPARISONS)
+_UNSET = object()
+# Key of the through relation a ``ManyToManyField`` manager's join reuses.
+_THROUGH = '<through>'
+
+
+class PredicateStats(object):
+    """
+    Counts operations ``PredicateQuerySet``s evaluated in memory, and the
+    ones that fell back to SQL (with the reason they did).
+    """
+    def __init__(self):
+        self.in_memory = 0
+        self.fallbacks = 0
+        self.fallback_reasons = Counter()
+        self._lock = threading.Lock()
+
+    def record_in_memory(self):
+        with self._lock:
+            self.in_memory += 1
+
+    def record_fallback(self, reason):
+        with self._lock:
+            self.fallbacks += 1
+            self.fallback_reasons[reason] += 1
+        logger.debug('PredicateQuerySet fell back to SQL: %s', reason)
+
+    def reset(self):
+        with self._lock:
+            self.in_memory = 0
+            self.fallbacks = 0
+            self.fallback_reasons.clear()
+
+
+stats = PredicateStats()
+
+
+class CannotEvaluate(Exception):
+    """Raised when a lookup can't be evaluated over prefetched rows."""
+    pass
+
+
+class PredicateQuerySet(object):
+    """
+    QuerySet-like wrapper over a relation prefetched by @prefetch, so
+    resolvers can keep calling manager methods without issuing queries:
+
+        @prefetch('items__itemmovement_set')
+        def get_current_items(self, obj, args, info):
+            return PredicateQuerySet(obj.items).filter(itemmovement__left__isnull=True)
+
+    ``filter``, ``exclude``, ``order_by``, ``count`` and ``exists`` run in
+    memory for exact/in/isnull/lt/lte/gt/gte lookups on loaded columns,
+    following relations that are cached on the rows (joined or prefetched).
+    Anything else, including relations that were not prefetched, replays
+    the same calls as SQL and is counted in ``predicates.stats``.
+    """
+    def __init__(self, manager, _operations=(), _rows=_UNSET):
+        self._manager = manager
+        self._operations = list(_operations)
+        self._queryset = None
+        if _rows is not _UNSET:
+            self._rows = _rows
+            return
+
+        queryset = manager.all()
+        self._rows = queryset._result_cache
+        if self._rows is None:
+            stats.record_fallback('not prefetched')
+
+    def _clone(self, operation, rows):
+        return type(self)(
+            self._manager,
+            _operations=self._operations + [operation],
+            _rows=rows)
+
+    def _sql(self):
+        if self._queryset is None:
+            queryset = self._manager.all()
+            for method, args, kwargs in self._operations:
+                queryset = getattr(queryset, method)(*args, **kwargs)
+            self._queryset = queryset
+        return self._queryset
+
+    def _apply(self, method, args, kwargs, evaluate):
+        operation = (method, args, kwargs)
+        if self._rows is None:
+            return self._clone(operation, None)
+        try:
+            rows = evaluate()
+        except CannotEvaluate as e:
+            stats.record_fallback(str(e))
+            return self._clone(operation, None)
+        stats.record_in_memory()
+        return self._clone(operation, rows)
+
+    def all(self):
+        return self
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', args, kwargs, lambda: self._filtered(args, kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return self._apply(
+            'exclude', args, kwargs,
+            lambda: [row for row in self._rows if not self._matches(row, args, kwargs, True)])
+
+    def order_by(self, *fields):
+        return self._apply('order_by', fields, {}, lambda: self._sorted(fields))
+
+    def count(self):
+        if self._rows is None:
+            return self._sql().count()
+        stats.record_in_memory()
+        return len(self._rows)
+
+    def exists(self):
+        if self._rows is None:
+            return self._sql().exists()
+        stats.record_in_memory()
+        return bool(self._rows)
+
+    def first(self):
+        rows = list(self[:1])
+        return rows[0] if rows else None
+
+    def _get_rows(self):
+        if self._rows is None:
+            return list(self._sql())
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._get_rows())
+
+    def __len__(self):
+        return len(self._get_rows())
+
+    def __nonzero__(self):
+        return bool(self._get_rows())
+    __bool__ = __nonzero__
+
+    def __getitem__(self, index):
+        if self._rows is None:
+            return self._sql()[index]
+        return self._rows[index]
+
+    def __repr__(self):
+        return '<PredicateQuerySet %r>' % (self._get_rows(),)
+
+    def _sorted(self, fields):
+        rows = list(self._rows)
+        # Successive stable sorts, least significant field first.
+        for field_name in reversed(fields):
+            descending = field_name.startswith('-')
+            name = field_name.lstrip('-')
+            if LOOKUP_SEP in name or name == '?':
+                raise CannotEvaluate('order_by(%r)' % field_name)
+            keys = {}
+            for row in rows:
+                values, _ = self._values(row, type(row), [name], False)
+                _, value = values[0]
+                if value is None:
+                    raise CannotEvaluate('order_by(%r) over NULL values' % field_name)
+                keys[id(row)] = value
+            rows.sort(key=lambda row: keys[id(row)], reverse=descending)
+        return rows
+
+    def _filtered(self, args, kwargs):
+        """
+        Returns the rows matching ``kwargs`` as often as SQL would: a
+        ``ManyToManyField`` manager's rows repeat once per through row
+        linking them, and a lookup on that through relation keeps one
+        copy per through row matching it.
+        """
+        copies = Counter(row.pk for row in self._rows)
+        rows = []
+        for row in self._rows:
+            if row.pk not in copies:
+                continue
+            matches = self._matches(row, args, kwargs, False)
+            if matches:
+                throughs = set(match[_THROUGH] for match in matches if _THROUGH in match)
+                rows.extend([row] * (len(throughs) or copies[row.pk]))
+            del copies[row.pk]
+        return rows
+
+    def _matches(self, row, args, kwargs, negated):
+        """
+        Returns the ways ``row`` matches ``kwargs``, as dicts mapping each
+        multi-valued relation the lookups follow to the pk of the related
+        row they matched (None for an empty relation); empty if it doesn't.
+
+        Like the single join SQL uses for the lookups of one ``filter()``
+        call, lookups following the same relation must all match the same
+        related row.
+        """
+        if args:
+            raise CannotEvaluate('Q objects')
+        matches = [{}]
+        for lookup, value in kwargs.iteritems():
+            parts = lookup.split(LOOKUP_SEP)
+            lookup_type = 'exact'
+            if len(parts) > 1 and parts[-1] in LOOKUP_TYPES:
+                lookup_type = parts.pop()
+            if value is None and lookup_type == 'exact':
+                lookup_type, value = 'isnull', True
+            values, field = self._values(row, type(row), parts, negated)
+            if lookup_type == 'in':
+                value = [self._to_python(field, v) for v in value]
+            elif lookup_type != 'isnull':
+                value = self._to_python(field, value)
+            matching = [
+                dict(joins) for joins, candidate in values
+                if self._compare(lookup_type, candidate, value)
+            ]
+            matches = [
+                dict(match.items() + joins.items()) for match in matches for joins in matching
+                if all(match.get(key, pk) == pk for key, pk in joins.iteritems())
+            ]
+            if not matches:
+                break
+        return matches
+
+    @staticmethod
+    def _to_python(field, value):
+        if isinstance(value, Model):
+            value = value.pk
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            raise CannotEvaluate("can't compare %r with %s" % (value, field.name))
+
+    @staticmethod
+    def _compare(lookup_type, candidate, value):
+        if lookup_type == 'isnull':
+            return (candidate is None) == bool(value)
+        if candidate is None:
+            return False
+        if lookup_type == 'exact':
+            return candidate == value
+        if lookup_type == 'in':
+            return candidate in value
+        return _COMPARISONS[lookup_type](candidate, value)
+
+    def _values(self, row, model, parts, negated):
+        """
+        Returns the values ``parts`` reaches from ``row``, one per related
+        row for multi-valued relations, with None standing in for an empty
+        relation (like the LEFT OUTER JOIN Django would use). Each value
+        comes with the (relation, related pk) pairs of the multi-valued
+        relations it was reached through. Also returns the field whose
+        ``to_python`` coerces lookup values.
+        """
+        current = [((), row)]
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            if part == 'pk':
+                part = model._meta.pk.name
+            try:
+                field, _, direct, m2m = model._meta.get_field_by_name(part)
+            except FieldDoesNotExist:
+                if last and index:
+                    raise CannotEvaluate("unsupported lookup type '%s'" % part)
+                raise CannotEvaluate("unknown field '%s'" % part)
+
+            if direct and not m2m and getattr(field, 'rel', None) is None:
+                if index + 2 == len(parts):
+                    raise CannotEvaluate("unsupported lookup type '%s'" % parts[-1])
+                if not last:
+                    raise CannotEvaluate("lookup through column '%s'" % part)
+                return [
+                    (joins, None if obj is None else self._column(obj, field))
+                    for joins, obj in current
+                ], field
+
+            if direct and not m2m:
+                # Forward ForeignKey / OneToOneField.
+                target = field.rel.to
+                next_part = None if last else parts[index + 1]
+                if last or (index + 2 == len(parts) and
+                            next_part in ('pk', target._meta.pk.name)):
+                    return [
+                        (joins, None if obj is None else self._column(obj, field))
+                        for joins, obj in current
+                    ], field.related_field
+                current = [
+                    (joins, None if obj is None else self._related_object(obj, field))
+                    for joins, obj in current
+                ]
+                model = target
+                continue
+
+            if not m2m and field.field.unique:
+                raise CannotEvaluate("reverse one-to-one '%s'" % part)
+            if index == 0 and part == getattr(self._manager, 'query_field_name', None):
+                # SQL reuses the manager's join, i.e. only its instance matches.
+                raise CannotEvaluate("'%s' back to the manager's instance" % part)
+            if negated:
+                raise CannotEvaluate("exclude() across multi-valued '%s'" % part)
+
+            related_model = field.rel.to if direct else field.model
+            key = _THROUGH if self._reuses_through(field, index) else LOOKUP_SEP.join(
+                parts[:index + 1])
+            related = []
+            for joins, obj in current:
+                related_rows = [] if obj is None else self._prefetched(obj, part, field, index)
+                related.extend(
+                    (joins + ((key, getattr(related_row, 'pk', None)),), related_row)
+                    for related_row in related_rows or [None])
+            current = related
+            model = related_model
+            if last:
+                return [
+                    (joins, None if obj is None else obj.pk) for joins, obj in current
+                ], related_model._meta.pk
+
+        return current, model._meta.pk
+
+    @staticmethod
+    def _column(obj, field):
+        if field.attname not in obj.__dict__:
+            raise CannotEvaluate("deferred column '%s'" % field.attname)
+        return getattr(obj, field.attname)
+
+    @staticmethod
+    def _related_object(obj, field):
+        cache_name = field.get_cache_name()
+        if not hasattr(obj, cache_name):
+            if getattr(obj, field.attname, None) is None:
+                return None
+            raise CannotEvaluate("'%s' is not cached" % field.name)
+        return getattr(obj, cache_name)
+
+    def _reuses_through(self, field, index):
+        """
+        Returns whether the relation ``field``, followed at ``index``, is
+        the through table of a ``ManyToManyField`` manager:
+        ``container.items.filter(itemmovement__...)`` reuses the join on
+        it, so only the through rows linking a row to the manager's
+        instance take part in the lookup.
+        """
+        return index == 0 and getattr(self._manager, 'through', None) is not None and \
+            getattr(field, 'field', None) is self._manager.target_field
+
+    def _prefetched(self, obj, cache_name, field, index):
+        cache = getattr(obj, '_prefetched_objects_cache', {})
+        if cache_name not in cache or cache[cache_name]._result_cache is None:
+            raise CannotEvaluate("'%s' is not prefetched" % cache_name)
+        rows = cache[cache_name]._result_cache
+
+        if self._reuses_through(field, index):
+            source_field = self._manager.source_field
+            instance_value = source_field.get_foreign_related_value(self._manager.instance)
+            rows = [
+                through_row for through_row in rows
+                if source_field.get_local_related_value(through_row) == instance_value
+            ]
+        return rows
@@ -0,0 +1,61 @@
+"""
+Routes the SQL queries a thread runs to the recorders it is currently
+recording to, e.g. the ``WrappedRoot`` of a debug request.
+
+Connections get a cursor factory installed once, and never removed, which
+wraps cursors for each of the calling thread's recorders, if any, and
+otherwise returns them untouched. Recorders are thread-local, so requests
+sharing a connection object (or running concurrently) never record each
+other's queries. Greenlet servers patching ``threading.local`` (gevent,
+eventlet) get greenlet-local recorders.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import connections
+
+_state = threading.local()
+
+
+def get_recorders():
+    """
+    Returns the recorders of the calling thread, innermost last.
+    """
+    return getattr(_state, 'recorders', ())
+
+
+def install(connection):
+    """
+    Makes ``connection`` wrap its cursors for the calling thread's
+    recorders. Installing twice is a no-op.
+    """
+    if hasattr(connection, '_recorded_cursor'):
+        return
+    connection._recorded_cursor = connection.cursor
+
+    def cursor():
+        cursor = connection._recorded_cursor()
+        for recorder in get_recorders():
+            cursor = recorder.wrap_cursor(cursor, connection)
+        return cursor
+
+    connection.cursor = cursor
+
+
+@contextmanager
+def recording(*recorders):
+    """
+    Records the queries the calling thread runs to ``recorders`` as well,
+    which must have a ``wrap_cursor(cursor, connection)`` method returning
+    the cursor to use. None recorders are skipped.
+    """
+    previous = get_recorders()
+    recorders = tuple(recorder for recorder in recorders if recorder is not None)
+    if recorders:
+        for connection in connections.all():
+            install(connection)
+    _state.recorders = previous + recorders
+    try:
+        yield
+    finally:
+        _state.recorders = previous
@@ -0,0 +1,95 @@
+from django.db.models.fields import FieldDoesNotExist
+
+
+FORWARD = 'forward'
+REVERSE = 'reverse'
+MANY_TO_MANY = 'many_to_many'
+
+
+class Relation(object):
+    """
+    One hop of a relation path, as seen from ``model``.
+
+    Attributes:
+        name (str): accessor name on ``model``, e.g. 'itemmovement_set'
+        kind (str): FORWARD (ForeignKey / OneToOneField declared on ``model``),
+            REVERSE (ForeignKey / OneToOneField pointing at ``model``) or
+            MANY_TO_MANY (either side)
+        model: model the accessor lives on
+        related_model: model the accessor returns instances of
+        field: the ForeignKey, OneToOneField or ManyToManyField behind the relation
+    """
+    def __init__(self, name, kind, model, related_model, field):
+        self.name = name
+        self.kind = kind
+        self.model = model
+        self.related_model = related_model
+        self.field = field
+
+    @property
+    def is_to_one(self):
+        """
+        Whether the accessor returns a single instance, which lets the
+        relation be joined with ``select_related``.
+        """
+        if self.kind == FORWARD:
+            return True
+        return self.kind == REVERSE and self.field.unique
+
+    def __repr__(self):
+        return 'Relation(%s.%s, %s)' % (self.model.__name__, self.name, self.kind)
+
+
+def get_relation(model, name):
+    """
+    Returns the ``Relation`` behind accessor ``name`` on ``model``, or None
+    if ``name`` is not a relation.
+    """
+    opts = model._meta
+    try:
+        field, _, direct, m2m = opts.get_field_by_name(name)
+    except FieldDoesNotExist:
+        field, direct = None, False
+
+    if direct:
+        if m2m:
+            return Relation(name, MANY_TO_MANY, model, field.rel.to, field)
+        if getattr(field, 'rel', None) is not None:
+            return Relation(name, FORWARD, model, field.rel.to, field)
+        return None
+
+    for related in opts.get_all_related_objects():
+        if related.get_accessor_name() == name:
+            return Relation(name, REVERSE, model, related.field.model, related.field)
+
+    for related in opts.get_all_related_many_to_many_objects():
+        if related.get_accessor_name() == name:
+            return Relation(name, MANY_TO_MANY, model, related.field.model, related.field)
+
+    return None
+
+
+def get_relation_path(model, lookup):
+    """
+    Resolves a ``prefetch_related``-style lookup, e.g. 'items__containers',
+    into a list of ``Relation``s, or None if any hop is not a relation.
+    """
+    path = []
+    for name in lookup.split('__'):
+        relation = get_relation(model, name)
+        if relation is None:
+            return None
+        path.append(relation)
+        model = relation.related_model
+    return path
+
+
+def get_column(model, name):
+    """
+    Returns the name to pass to ``QuerySet.only`` for attribute ``name``
+    of ``model``, or None if ``name`` is not a concrete field.
+    """
+    for field in model._meta.concrete_fields:
+        if field.name == name or field.attname == name:
+            return field.name
+    return None
@@ -0,0 +1,228 @@
+import hashlib
+import threading
+from time import time
+
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .cache import BoundedCache
+from .relations import MANY_TO_MANY, get_relation
+
+
+def get_model_label(model):
+    opts = model._meta.concrete_model._meta
+    return '%s.%s' % (opts.app_label, opts.object_name)
+
+
+def get_plan_models(plan):
+    """
+    Returns the models whose rows ``plan`` loads, including the through
+    models of many-to-many relations, or None if the plan has lookups
+    which don't resolve to model relations.
+    """
+    if plan.lookups:
+        return None
+    models = set([plan.model])
+    for child in plan.children.values():
+        relation = get_relation(plan.model, child.relation_name)
+        if relation.kind == MANY_TO_MANY:
+            models.add(relation.field.rel.through)
+        child_models = get_plan_models(child)
+        if child_models is None:
+            return None
+        models.update(child_models)
+    return models
+
+
+def get_plan_key(plan):
+    """
+    Returns what ``plan`` loads: the model, columns and relations, as
+    nested tuples and lists which compare equal for equivalent plans.
+    """
+    return (
+        get_model_label(plan.model),
+        plan.only,
+        [(name, get_plan_key(child)) for name, child in plan.children.items()])
+
+
+class ResultCache(object):
+    """
+    Caches the results of root fields, keyed by (root field, arguments,
+    ``QueryPlan``) and invalidated whenever a row of a model the plan
+    loads is saved or deleted.
+
+    Invalidation keeps a version per model, bumped by ``post_save``,
+    ``post_delete`` and ``m2m_changed``; entries are stored under the
+    versions their models had when they were loaded, so stale entries are
+    never read again and age out of the backend. ``QuerySet.update``,
+    ``bulk_create`` and raw SQL send no signals and invalidate nothing.
+
+    Signals sent inside a transaction bump versions before it commits, so
+    a concurrent request may still load the old rows and cache them under
+    the new version. Those models are bumped again once the transaction
+    is over: when the request finishes, or at the next ``get_or_load`` of
+    the writing thread. Until then, results may be stale.
+
+    Subclasses store entries and versions, see ``LocalResultCache`` and
+    ``DjangoResultCache``.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._pending = threading.local()
+        post_save.connect(self._on_change)
+        post_delete.connect(self._on_change)
+        m2m_changed.connect(self._on_m2m_change)
+        request_finished.connect(self.invalidate_pending)
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    def get_versions(self, labels):
+        """
+        Returns the current version of each model label in ``labels``.
+        """
+        raise NotImplementedError
+
+    def invalidate(self, model):
+        """
+        Drops every entry loading rows of ``model``.
+        """
+        raise NotImplementedError
+
+    def _on_change(self, sender, using, **kwargs):
+        self._invalidate_changed(sender, using)
+
+    def _on_m2m_change(self, sender, instance, model, action, using, **kwargs):
+        if action.startswith('post_'):
+            for changed in (sender, type(instance), model):
+                self._invalidate_changed(changed, using)
+
+    def _invalidate_changed(self, model, using):
+        self.invalidate(model)
+        if connections[using].in_atomic_block:
+            pending = self._pending.__dict__.setdefault('models', set())
+            pending.add((using, model))
+
+    def invalidate_pending(self, **kwargs):
+        """
+        Invalidates again the models this thread changed inside
+        transactions which have since ended.
+        """
+        pending = getattr(self._pending, 'models', None)
+        if not pending:
+            return
+        for using, model in list(pending):
+            if not connections[using].in_atomic_block:
+                pending.discard((using, model))
+                self.invalidate(model)
+
+    def get_or_load(self, field_name, args, plan, load):
+        """
+        Returns the cached result of root field ``field_name`` called with
+        ``args`` and loaded with ``plan``, or calls ``load()`` and caches
+        what it returns. QuerySets are cached as lists.
+        """
+        self.invalidate_pending()
+        models = get_plan_models(plan)
+        if models is None:
+            return load()
+        labels = sorted(get_model_label(model) for model in models)
+        key = hashlib.sha1(repr((
+            field_name,
+            sorted(args.items()),
+            get_plan_key(plan),
+            zip(labels, self.get_versions(labels)),
+        ))).hexdigest()
+
+        cached = self._get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        result = load()
+        if hasattr(result, '_fetch_all'):
+            result = list(result)
+        self._set(key, (result,))
+        return result
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class LocalResultCache(ResultCache):
+    """
+    ``ResultCache`` holding at most ``maxsize`` results in process memory.
+    Cached model instances are shared between requests, so resolvers must
+    not modify them.
+    """
+    def __init__(self, maxsize=1024, eviction='lru'):
+        super(LocalResultCache, self).__init__()
+        self.entries = BoundedCache(maxsize=maxsize, eviction=eviction)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        return self.entries.get(key)
+
+    def _set(self, key, value):
+        self.entries.set(key, value)
+
+    def get_versions(self, labels):
+        with self._lock:
+            return [self._versions.get(label, 0) for label in labels]
+
+    def invalidate(self, model):
+        label = get_model_label(model)
+        with self._lock:
+            self._versions[label] = self._versions.get(label, 0) + 1
+
+    def stats(self):
+        stats = super(LocalResultCache, self).stats()
+        stats.update(self.entries.stats())
+        return stats
+
+
+class DjangoResultCache(ResultCache):
+    """
+    ``ResultCache`` storing results (pickled model instances) and model
+    versions in the Django cache ``alias``, so processes sharing the cache
+    share results and invalidations.
+    """
+    def __init__(self, alias='default', timeout=300, key_prefix='django_graphql'):
+        super(DjangoResultCache, self).__init__()
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def _get(self, key):
+        return self.cache.get('%s:result:%s' % (self.key_prefix, key))
+
+    def _set(self, key, value):
+        self.cache.set('%s:result:%s' % (self.key_prefix, key), value, self.timeout)
+
+    def _version_key(self, label):
+        return '%s:version:%s' % (self.key_prefix, label)
+
+    def get_versions(self, labels):
+        keys = [self._version_key(label) for label in labels]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # Start evicted versions at the current time rather than 0,
+                # so entries stored under earlier versions can't match again.
+                self.cache.add(key, int(time() * 1000), None)
+                versions[key] = self.cache.get(key)
+        return [versions[key] for key in keys]
+
+    def invalidate(self, model):
+        key = self._version_key(get_model_label(model))
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, int(time() * 1000), None)
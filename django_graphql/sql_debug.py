@@ -1,11 +1,11 @@
 from __future__ import absolute_import, unicode_literals
 
 import json
+import random
 from contextlib import contextmanager
-from threading import local
+from threading import Lock, local
 from time import time
 
-from django.db import connections
 from django.utils import six
 from django.utils.encoding import force_text
 
@@ -14,6 +14,7 @@ from debug_toolbar.utils import get_stack, get_template_info, tidy_stacktrace
 
 from graphql.core.type import (
     GraphQLArgument,
+    GraphQLBoolean,
     GraphQLField,
     GraphQLFloat,
     GraphQLInt,
@@ -23,6 +24,8 @@ from graphql.core.type import (
     GraphQLString,
 )
 
+from .recording import recording as record_queries
+
 
 class SQLQueryTriggered(Exception):
     """Thrown when template panel triggers a query"""
@@ -47,23 +50,6 @@ state = ThreadLocalState()
 recording = state.recording
 
 
-def wrap_cursor(connection, panel):
-    if not hasattr(connection, '_djdt_cursor'):
-        connection._djdt_cursor = connection.cursor
-
-        def cursor():
-            return state.Wrapper(connection._djdt_cursor(), connection, panel)
-
-        connection.cursor = cursor
-        return cursor
-
-
-def unwrap_cursor(connection):
-    if hasattr(connection, '_djdt_cursor'):
-        del connection._djdt_cursor
-        del connection.cursor
-
-
 class ExceptionCursorWrapper(object):
     """
     Wraps a cursor and raises an exception on any operation.
@@ -115,7 +101,7 @@ class NormalCursorWrapper(object):
         finally:
             stop_time = time()
             duration = (stop_time - start_time) * 1000
-            if dt_settings.CONFIG['ENABLE_STACKTRACES']:
+            if self.logger.stacktraces:
                 stacktrace = tidy_stacktrace(reversed(get_stack()))
             else:
                 stacktrace = []
@@ -186,18 +172,122 @@ class NormalCursorWrapper(object):
         self.close()
 
 
+class LightCursorWrapper(object):
+    """
+    Wraps a cursor and logs only the duration, SQL (without parameters)
+    and row count of queries, plus the stack if the logger's
+    ``stacktraces`` is set. Cheap enough to leave on in production.
+    """
+
+    def __init__(self, cursor, db, logger):
+        self.cursor = cursor
+        self.db = db
+        self.logger = logger
+        self._query = None
+
+    def _record(self, method, sql, params):
+        start_time = time()
+        try:
+            return method(sql, params)
+        finally:
+            stop_time = time()
+            rowcount = self.cursor.rowcount
+            self._query = {
+                'vendor': self.db.vendor,
+                'alias': self.db.alias,
+                'sql': sql,
+                'raw_sql': sql,
+                'duration': (stop_time - start_time) * 1000,
+                # Backends that don't count SELECT rows up front (-1) have
+                # them counted as they are fetched.
+                'rows': max(rowcount, 0),
+                'start_time': start_time,
+                'stop_time': stop_time,
+                'stacktrace': (
+                    tidy_stacktrace(reversed(get_stack())) if self.logger.stacktraces else []),
+            }
+            self._count_fetched = rowcount < 0
+            # Recorded as is, so rows fetched afterwards are counted in.
+            self.logger.record_query(self._query)
+
+    def _fetched(self, rows):
+        if self._count_fetched and rows:
+            self._query['rows'] += len(rows)
+        return rows
+
+    def callproc(self, procname, params=()):
+        return self._record(self.cursor.callproc, procname, params)
+
+    def execute(self, sql, params=()):
+        return self._record(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._record(self.cursor.executemany, sql, param_list)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self._fetched([row])
+        return row
+
+    def fetchmany(self, *args):
+        return self._fetched(self.cursor.fetchmany(*args))
+
+    def fetchall(self):
+        return self._fetched(self.cursor.fetchall())
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        for row in self.cursor:
+            self._fetched([row])
+            yield row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
 class WrappedRoot(object):
-    def __init__(self, root):
+    """
+    Query root of debug requests, recording the SQL queries they run.
+
+    ``light`` records queries with ``LightCursorWrapper`` rather than
+    ``NormalCursorWrapper``; ``stacktraces`` defaults to debug toolbar's
+    ENABLE_STACKTRACES setting, or False if ``light``. Requests which are
+    not ``sampled`` record nothing.
+    """
+    def __init__(self, root, light=False, stacktraces=None, sampled=True):
         self.queries = []
         self.duration = 0
         self._last_query = time()
         self._root = root
+        self.Wrapper = LightCursorWrapper if light else NormalCursorWrapper
+        if stacktraces is None:
+            stacktraces = not light and dt_settings.CONFIG['ENABLE_STACKTRACES']
+        self.stacktraces = stacktraces
+        self.sampled = sampled
+        # Pool threads may record queries of the same request concurrently.
+        self._lock = Lock()
+
+    def wrap_cursor(self, cursor, connection):
+        Wrapper = state.Wrapper
+        if Wrapper is NormalCursorWrapper:
+            Wrapper = self.Wrapper
+        return Wrapper(cursor, connection, self)
 
     def record(self, **kwargs):
-        self.queries.append(kwargs)
-        now = time()
-        self.duration += (now - self._last_query) * 1000
-        self._last_query = now
+        self.record_query(kwargs)
+
+    def record_query(self, query):
+        with self._lock:
+            self.queries.append(query)
+            now = time()
+            self.duration += (now - self._last_query) * 1000
+            self._last_query = now
 
 # TODO: convenience 'ObjectType' class that auto-generates
 # resolvers based on class-fields, and just assumes ``data`` is dict
@@ -221,10 +311,97 @@ DjangoDebugSQL = GraphQLObjectType(
             GraphQLString,
             resolver=lambda data, *args: data['raw_sql']),
         'params': GraphQLField(GraphQLString),
+        'rows': GraphQLField(
+            GraphQLInt,
+            description='Rows fetched or changed, only recorded in light mode',
+            resolver=lambda data, *args: data.get('rows')),
         'stacktrace': GraphQLField(GraphQLList(GraphQLString)),
     })
 
 
+DjangoDebugCost = GraphQLObjectType(
+    'DjangoDebugCost',
+    description='Cost estimated for the request before executing it',
+    fields=lambda: {
+        'depth': GraphQLField(
+            GraphQLInt,
+            resolver=lambda cost, *args: cost.depth),
+        'rows': GraphQLField(
+            GraphQLInt,
+            resolver=lambda cost, *args: cost.rows),
+        'queries': GraphQLField(
+            GraphQLInt,
+            resolver=lambda cost, *args: cost.queries),
+    })
+
+
+DjangoDebugResolver = GraphQLObjectType(
+    'DjangoDebugResolver',
+    description='One field resolution, times in milliseconds',
+    fields=lambda: {
+        'path': GraphQLField(
+            GraphQLList(GraphQLString),
+            resolver=lambda timing, *args: timing.path),
+        'parent_type': GraphQLField(
+            GraphQLString,
+            resolver=lambda timing, *args: timing.parent_type),
+        'field_name': GraphQLField(
+            GraphQLString,
+            resolver=lambda timing, *args: timing.field_name),
+        'return_type': GraphQLField(
+            GraphQLString,
+            resolver=lambda timing, *args: timing.return_type),
+        'start_offset': GraphQLField(
+            GraphQLFloat,
+            resolver=lambda timing, *args: timing.start_offset),
+        'duration': GraphQLField(
+            GraphQLFloat,
+            resolver=lambda timing, *args: timing.duration),
+    })
+
+
+DjangoDebugFieldStats = GraphQLObjectType(
+    'DjangoDebugFieldStats',
+    description='Resolutions of one Type.field, times in milliseconds',
+    fields=lambda: {
+        'name': GraphQLField(
+            GraphQLString,
+            resolver=lambda stats, *args: stats['name']),
+        'count': GraphQLField(
+            GraphQLInt,
+            resolver=lambda stats, *args: stats['count']),
+        'total': GraphQLField(
+            GraphQLFloat,
+            resolver=lambda stats, *args: stats['total']),
+        'p50': GraphQLField(
+            GraphQLFloat,
+            resolver=lambda stats, *args: stats['p50']),
+        'max': GraphQLField(
+            GraphQLFloat,
+            resolver=lambda stats, *args: stats['max']),
+    })
+
+
+DjangoDebugTrace = GraphQLObjectType(
+    'DjangoDebugTrace',
+    description='Resolver timings recorded by the TracingPlugin',
+    fields=lambda: {
+        'duration': GraphQLField(
+            GraphQLFloat,
+            resolver=lambda trace, *args: trace.duration),
+        'resolvers': GraphQLField(
+            GraphQLList(DjangoDebugResolver),
+            resolver=lambda trace, *args: list(trace.resolvers)),
+        'fields': GraphQLField(
+            GraphQLList(DjangoDebugFieldStats),
+            resolver=lambda trace, *args: trace.stats()),
+        'json': GraphQLField(
+            GraphQLString,
+            description='The trace in the Apollo Tracing format',
+            resolver=lambda trace, *args: trace.to_json()),
+    })
+
+
 DjangoDebug = GraphQLObjectType(
     'DjangoDebug',
     fields=lambda: {
@@ -237,23 +414,66 @@ DjangoDebug = GraphQLObjectType(
             resolver=lambda data, *args: data['query_count']),
         'duration': GraphQLField(
             GraphQLFloat,
-            resolver=lambda data, *args: data['duration'])
+            resolver=lambda data, *args: data['duration']),
+        'cost': GraphQLField(
+            DjangoDebugCost,
+            resolver=lambda data, *args: data['cost']),
+        'trace': GraphQLField(
+            DjangoDebugTrace,
+            resolver=lambda data, *args: data['trace']),
+        'sampled': GraphQLField(
+            GraphQLBoolean,
+            description='Whether SQL queries were recorded for this request',
+            resolver=lambda data, *args: data['sampled'])
     })
 
 
-class DjangoDebugPlugin(object):
-    def enable_instrumentation(self, wrapped_root):
-        for connection in connections.all():
-            wrap_cursor(connection, wrapped_root)
-
-    def disable_instrumentation(self):
-        for connection in connections.all():
-            unwrap_cursor(connection)
+def get_debug(_root, args, info):
+    return {
+        'queries': _root.queries,
+        'query_count': len(_root.queries),
+        'duration': _root.duration,
+        'cost': info.request_context.get('cost'),
+        'sampled': _root.sampled,
+        'trace': info.request_context.get('trace'),
+    }
 
-    @contextmanager
-    def apply(self, request=None, root=None, schema=None):
-        root_fields = root.get_fields()
 
+class DjangoDebugPlugin(object):
+    """
+    Adds a '__debug' field to the query root, reporting the SQL queries
+    run by the request.
+
+    Args:
+        sample_rate (float): fraction of requests whose queries are recorded
+        light (bool): record only the duration, SQL and row count of queries,
+            see ``LightCursorWrapper``
+        stacktraces (bool): record the stack running each query; defaults to
+            debug toolbar's ENABLE_STACKTRACES, or False if ``light``
+    """
+    def __init__(self, sample_rate=1.0, light=False, stacktraces=None):
+        self.sample_rate = sample_rate
+        self.light = light
+        self.stacktraces = stacktraces
+        # root GraphQLObjectType -> (root with '__debug', its GraphQLSchema)
+        self._debug_schemas = {}
+        self._lock = Lock()
+
+    def get_debug_schema(self, root):
+        """
+        Returns ``root`` with an added '__debug' field, and a schema
+        querying it. Both are built once per ``root``: requests only differ
+        by the ``WrappedRoot`` they execute against, which also keeps
+        ``DjangoSchema.document_cache`` entries valid across requests.
+        """
+        with self._lock:
+            debug_schema = self._debug_schemas.get(root)
+            if debug_schema is None:
+                debug_schema = self._debug_schemas[root] = self._build_debug_schema(root)
+            return debug_schema
+
+    @staticmethod
+    def _build_debug_schema(root):
         # TODO: convenience method for copying GraphQLFields
         # that maintains root spec.
         # ``get_fields()`` returns root args as list, not dict.
@@ -269,14 +489,6 @@ class DjangoDebugPlugin(object):
                 resolver=field.resolver)
             for name, field in root.get_fields().iteritems()
         }
-
-        def get_debug(_root, *args):
-            return {
-                'queries': _root.queries,
-                'query_count': len(_root.queries),
-                'duration': _root.duration
-            }
-
         field_spec['__debug'] = GraphQLField(
             DjangoDebug,
             description=DjangoDebug.__doc__,
@@ -285,14 +497,23 @@ class DjangoDebugPlugin(object):
         root_with_debug = GraphQLObjectType(
             root.name,
             fields=field_spec)
-        wrapped_root = WrappedRoot(root=root_with_debug)
-        schema_with_debug = GraphQLSchema(query=root_with_debug)
+        return root_with_debug, GraphQLSchema(query=root_with_debug)
+
+    @contextmanager
+    def apply(self, request=None, root=None, schema=None):
+        root_with_debug, schema_with_debug = self.get_debug_schema(root)
+        wrapped_root = WrappedRoot(
+            root=root_with_debug,
+            light=self.light,
+            stacktraces=self.stacktraces,
+            sampled=random.random() < self.sample_rate)
         applied = {
             'request': request,
             'root': wrapped_root,
             'schema': schema_with_debug,
         }
 
-        self.enable_instrumentation(wrapped_root)
-        yield applied
-        self.disable_instrumentation()
+        # Only the calling thread (and the pool threads resolving its root
+        # fields, see ``concurrency.RequestWork``) record to ``wrapped_root``.
+        with record_queries(wrapped_root if wrapped_root.sampled else None):
+            yield applied
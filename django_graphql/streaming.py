@@ -0,0 +1,103 @@
+import json
+from itertools import islice
+
+from django.db.models.query import QuerySet, prefetch_related_objects
+
+from graphql.core.error import GraphQLError
+from graphql.core.execution.base import (
+    ExecutionContext,
+    ResolveInfo,
+    collect_fields,
+    default_resolve_fn,
+    get_field_def,
+    get_operation_root_type,
+)
+from graphql.core.pyutils.default_ordered_dict import DefaultOrderedDict
+from graphql.core.pyutils.defer import Deferred
+from graphql.core.type import GraphQLList, GraphQLNonNull
+
+from .cost import format_error
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    Yields lists of at most ``chunk_size`` rows of ``queryset``, read with
+    ``iterator()`` so rows are never all held at once. The queryset's
+    ``prefetch_related`` lookups are applied to each chunk in turn.
+    """
+    lookups = list(queryset._prefetch_related_lookups)
+    rows = queryset.prefetch_related(None).iterator()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        if lookups:
+            prefetch_related_objects(chunk, lookups)
+        yield chunk
+
+
+def stream_execution(executor, schema, document, root, variables=None,
+                     operation_name=None, request_context=None, chunk_size=500):
+    """
+    Executes ``document`` like ``executor.execute``, yielding the JSON
+    serialized result in fragments.
+
+    Root fields resolving to a QuerySet are read and completed
+    ``chunk_size`` rows at a time, each chunk serialized before the next
+    is fetched. Other root fields are completed whole.
+    """
+    request_context = request_context or {}
+    loaders = request_context.get('loaders')
+    try:
+        ctx = ExecutionContext(
+            schema, root, document, operation_name, variables or {}, request_context)
+    except GraphQLError as e:
+        yield json.dumps({'errors': [format_error(e)]})
+        return
+
+    def complete(return_type, field_asts, info, result):
+        completed = executor.complete_value_catching_error(
+            ctx, return_type, field_asts, info, result)
+        if isinstance(completed, Deferred):
+            completed = loaders.resolve(completed)
+        return completed
+
+    root_type = get_operation_root_type(schema, ctx.operation)
+    fields = collect_fields(
+        ctx, root_type, ctx.operation.selection_set, DefaultOrderedDict(list), set())
+
+    yield '{"data": {'
+    field_separator = ''
+    for response_name, field_asts in fields.items():
+        field_def = get_field_def(schema, root_type, field_asts[0].name.value)
+        if field_def is None:
+            continue
+        prefix = '%s%s: ' % (field_separator, json.dumps(response_name))
+        field_separator = ', '
+        return_type = field_def.type
+        info = ResolveInfo(
+            field_asts[0].name.value, field_asts, return_type, root_type, ctx)
+        result = executor.resolve_or_error(
+            field_def.resolver or default_resolve_fn,
+            root,
+            ctx.get_argument_values(field_def, field_asts[0]),
+            info)
+
+        list_type = return_type.of_type if isinstance(return_type, GraphQLNonNull) else return_type
+        if not isinstance(result, QuerySet) or not isinstance(list_type, GraphQLList):
+            yield prefix + json.dumps(complete(return_type, field_asts, info, result))
+            continue
+
+        yield prefix + '['
+        separator = ''
+        for chunk in iter_chunks(result, chunk_size):
+            items = complete(list_type, field_asts, info, chunk)
+            if items:
+                yield separator + ', '.join(json.dumps(item) for item in items)
+                separator = ', '
+        yield ']'
+    yield '}'
+
+    if ctx.errors:
+        yield ', "errors": %s' % json.dumps([format_error(error) for error in ctx.errors])
+    yield '}'
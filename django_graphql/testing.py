@@ -0,0 +1,148 @@
+"""
+Test helpers asserting how much SQL executing a document may cost, so a
+schema change dropping a prefetch fails CI instead of slowing production.
+
+    class ContainerTests(SQLBudgetMixin, TestCase):
+        def test_container(self):
+            self.assertSQLBudget(
+                schema, '{ container(id: 1) { items { name } } }',
+                max_queries=2, max_duplicates=0)
+"""
+from contextlib import contextmanager
+
+from .nplusone import get_query_shape
+from .recording import recording
+from .sql_debug import LightCursorWrapper
+from .tracing import Trace, format_path
+
+
+class SQLBudgetExceeded(AssertionError):
+    pass
+
+
+class SQLBudget(object):
+    """
+    Upper bounds on the SQL of one execution: the number of queries, the
+    rows they fetch, and the queries repeating the shape (SQL without its
+    parameters) of an earlier one. None leaves a bound unchecked.
+
+    Each recorded query is attributed to the response path of the field
+    resolving when it ran; with a ``ConcurrentExecutor``, root fields
+    overlap and paths are a best guess.
+    """
+    stacktraces = False
+
+    def __init__(self, max_queries=None, max_rows=None, max_duplicates=None):
+        self.limits = {
+            'queries': max_queries,
+            'rows': max_rows,
+            'duplicates': max_duplicates,
+        }
+        self.queries = []
+        self.trace = None
+
+    def wrap_cursor(self, cursor, connection):
+        return LightCursorWrapper(cursor, connection, self)
+
+    def record_query(self, query):
+        self.queries.append(query)
+
+    @contextmanager
+    def apply(self, request=None, root=None, schema=None):
+        self.trace = Trace()
+        try:
+            with recording(self):
+                yield {
+                    'request': request,
+                    'root': root,
+                    'schema': schema,
+                    'request_context': {'trace': self.trace},
+                }
+        finally:
+            self.trace.finish()
+
+    def get_path(self, query):
+        """
+        Returns the path of the innermost field whose resolver was running
+        when ``query`` started, or () if none was.
+        """
+        path = ()
+        latest = None
+        for timing in self.trace.resolvers:
+            start_time = self.trace.start_time + timing.start_offset / 1000
+            stop_time = start_time + (timing.duration or 0) / 1000
+            if start_time <= query['start_time'] <= stop_time and \
+                    (latest is None or start_time >= latest):
+                path = timing.path
+                latest = start_time
+        return path
+
+    def get_usage(self):
+        """
+        Returns the queries, rows and duplicate query shapes recorded.
+        """
+        shapes = set(get_query_shape(query['sql']) for query in self.queries)
+        return {
+            'queries': len(self.queries),
+            'rows': sum(query['rows'] for query in self.queries),
+            'duplicates': len(self.queries) - len(shapes),
+        }
+
+    def check(self):
+        """
+        Raises:
+            SQLBudgetExceeded: listing every query with the path of the
+                field which ran it, if any bound was exceeded
+        """
+        usage = self.get_usage()
+        exceeded = [
+            '%s %s exceeds max_%s %s' % (name, usage[name], name, self.limits[name])
+            for name in ('queries', 'rows', 'duplicates')
+            if self.limits[name] is not None and usage[name] > self.limits[name]
+        ]
+        if not exceeded:
+            return
+        lines = ['SQLBudgetExceeded: ' + '; '.join(exceeded)]
+        seen = set()
+        for query in self.queries:
+            shape = get_query_shape(query['sql'])
+            lines.append('  %s (%s rows%s): %s' % (
+                format_path(self.get_path(query)) or '<no field>',
+                query['rows'],
+                ', duplicate' if shape in seen else '',
+                query['sql']))
+            seen.add(shape)
+        raise SQLBudgetExceeded('\n'.join(lines))
+
+
+def assert_sql_budget(schema, document, variables=None, operation_name=None,
+                      max_queries=None, max_rows=None, max_duplicates=None):
+    """
+    Executes ``document`` with the DjangoSchema ``schema`` and returns the
+    ``ExecutionResult``, after checking its SQL against an ``SQLBudget``.
+
+    Raises:
+        SQLBudgetExceeded: if the execution exceeded the budget
+        AssertionError: if the execution returned errors
+    """
+    budget = SQLBudget(max_queries, max_rows, max_duplicates)
+    result = schema.execute(
+        document, variables=variables, operation_name=operation_name, plugins=[budget])
+    if result.errors:
+        raise AssertionError('Execution failed: %s' % result.errors)
+    budget.check()
+    return result
+
+
+class SQLBudgetMixin(object):
+    """
+    ``TestCase`` mixin adding ``assertSQLBudget``, see ``assert_sql_budget``.
+    """
+    def assertSQLBudget(self, schema, document, variables=None, operation_name=None,
+                        max_queries=None, max_rows=None, max_duplicates=None):
+        try:
+            return assert_sql_budget(
+                schema, document, variables, operation_name,
+                max_queries=max_queries, max_rows=max_rows, max_duplicates=max_duplicates)
+        except SQLBudgetExceeded as e:
+            raise self.failureException(str(e))
@@ -0,0 +1,233 @@
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from time import time
+
+from graphql.core.pyutils.defer import Deferred
+
+
+class ResolverTiming(object):
+    """
+    One field resolution of a traced request. ``start_offset`` (since the
+    request started) and ``duration`` are in milliseconds; resolvers
+    returning a Deferred last until it fires.
+    """
+    def __init__(self, path, parent_type, field_name, return_type, start_offset):
+        self.path = path
+        self.parent_type = parent_type
+        self.field_name = field_name
+        self.return_type = return_type
+        self.start_offset = start_offset
+        self.duration = None
+
+
+def format_path(path):
+    """
+    Formats a response path, e.g. ('container', 'items', 0, 'name') as
+    'container.items[0].name'.
+    """
+    formatted = ''
+    for key in path:
+        if isinstance(key, int):
+            formatted += '[%s]' % key
+        else:
+            formatted += '.%s' % key if formatted else key
+    return formatted
+
+
+class ResponsePaths(object):
+    """
+    The response paths of the fields of one request, built from response
+    names and list indexes, e.g. ('container', 'items', 0, 'name'), by
+    remembering where each resolved object sits in the response.
+    """
+    def __init__(self):
+        # id() of resolved objects -> their path, for their fields' paths
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def get(self, source, info):
+        """
+        Returns the path of ``info``'s field of ``source``.
+        """
+        field_ast = info.field_asts[0]
+        response_name = (field_ast.alias or field_ast.name).value
+        return self._paths.get(id(source), ()) + (response_name,)
+
+    def register(self, path, result):
+        """
+        Remembers ``result``, resolved at ``path``, as the source of the
+        fields below it. Returns ``result``.
+        """
+        if hasattr(result, '_fetch_all') and result._result_cache is None:
+            # Streamed QuerySets are only read after their resolver.
+            return result
+        with self._lock:
+            if isinstance(result, (list, tuple)) or hasattr(result, '_fetch_all'):
+                for index, item in enumerate(result):
+                    self._paths[id(item)] = path + (index,)
+            elif result is not None:
+                self._paths[id(result)] = path
+        return result
+
+
+class Trace(object):
+    """
+    Timings of every field resolved by one request, in the order their
+    resolvers were called, with their ``ResponsePaths``.
+    """
+    def __init__(self):
+        self.start_time = time()
+        self.end_time = None
+        self.resolvers = []
+        self._paths = ResponsePaths()
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        return ((self.end_time or time()) - self.start_time) * 1000
+
+    def resolve(self, resolve_fn, source, info):
+        """
+        Calls ``resolve_fn()``, the resolver of ``info``'s field for
+        ``source``, and records how long it took.
+        """
+        path = self._paths.get(source, info)
+        start_time = time()
+        timing = ResolverTiming(
+            path,
+            info.parent_type.name,
+            info.field_name,
+            str(info.return_type),
+            (start_time - self.start_time) * 1000)
+        with self._lock:
+            self.resolvers.append(timing)
+
+        def finish(result):
+            if hasattr(result, '_fetch_all') and not info.request_context.get('streaming'):
+                # Loading a returned QuerySet counts toward its field.
+                result._fetch_all()
+            timing.duration = (time() - start_time) * 1000
+            return self._paths.register(path, result)
+
+        try:
+            result = resolve_fn()
+        except Exception:
+            timing.duration = (time() - start_time) * 1000
+            raise
+        if isinstance(result, Deferred):
+            return result.add_callbacks(finish, finish)
+        return finish(result)
+
+    def finish(self):
+        self.end_time = time()
+
+    def stats(self):
+        """
+        Returns a list of {'name', 'count', 'total', 'p50', 'max'} per
+        'Type.field', slowest total first. Durations are in milliseconds.
+        """
+        durations = OrderedDict()
+        for timing in self.resolvers:
+            if timing.duration is None:
+                continue
+            name = '%s.%s' % (timing.parent_type, timing.field_name)
+            durations.setdefault(name, []).append(timing.duration)
+        stats = []
+        for name, values in durations.iteritems():
+            values.sort()
+            stats.append({
+                'name': name,
+                'count': len(values),
+                'total': sum(values),
+                'p50': values[(len(values) - 1) // 2],
+                'max': values[-1],
+            })
+        stats.sort(key=lambda stat: stat['total'], reverse=True)
+        return stats
+
+    def as_apollo_tracing(self):
+        """
+        Returns the trace in the Apollo Tracing format (version 1), as read
+        by GraphQL tooling; times are in nanoseconds.
+        """
+        return {
+            'version': 1,
+            'startTime': _format_timestamp(self.start_time),
+            'endTime': _format_timestamp(self.end_time or time()),
+            'duration': int(self.duration * 1e6),
+            'execution': {
+                'resolvers': [
+                    {
+                        'path': list(timing.path),
+                        'parentType': timing.parent_type,
+                        'fieldName': timing.field_name,
+                        'returnType': timing.return_type,
+                        'startOffset': int(timing.start_offset * 1e6),
+                        'duration': int((timing.duration or 0) * 1e6),
+                    }
+                    for timing in self.resolvers
+                ],
+            },
+        }
+
+    def to_json(self):
+        return json.dumps(self.as_apollo_tracing())
+
+
+def _format_timestamp(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def get_resolve_args(resolve_fn):
+    """
+    Returns the (source, args, info) a graphql-core execution middleware's
+    ``resolve_fn`` calls the resolver with, under other middlewares.
+    """
+    while len(resolve_fn.args) != 3:
+        resolve_fn = resolve_fn.args[0]
+    return resolve_fn.args
+
+
+class TracingMiddleware(object):
+    """
+    graphql-core execution middleware timing resolvers for requests with
+    a ``Trace`` in ``request_context['trace']``; other requests only pay
+    for the lookup.
+    """
+    def run_resolve_fn(self, resolve_fn, original_resolve_fn):
+        source, _, info = get_resolve_args(resolve_fn)
+        trace = info.request_context.get('trace')
+        if trace is None:
+            return resolve_fn()
+        return trace.resolve(resolve_fn, source, info)
+
+
+class TracingPlugin(object):
+    """
+    Records a ``Trace`` of every request, shown under
+    ``__debug { trace { ... } }`` along with ``DjangoDebugPlugin``.
+
+    Args:
+        on_trace (callable): called with each finished ``Trace``, e.g. to
+            write ``trace.to_json()`` somewhere
+    """
+    def __init__(self, on_trace=None):
+        self.on_trace = on_trace
+
+    @contextmanager
+    def apply(self, request=None, root=None, schema=None):
+        trace = Trace()
+        try:
+            yield {
+                'request': request,
+                'root': root,
+                'schema': schema,
+                'request_context': {'trace': trace},
+            }
+        finally:
+            trace.finish()
+            if self.on_trace is not None:
+                self.on_trace(trace)
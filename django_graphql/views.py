@@ -0,0 +1,227 @@
+import hashlib
+import json
+
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags, quote_etag
+from django.views.generic import View
+
+from graphql.core.error import GraphQLError
+from graphql.core.execution import ExecutionResult
+
+from .cost import format_error, get_operation
+from .result_cache import get_model_label
+
+ETAG_SOURCES = ('body', 'versions', None)
+
+
+def format_result(result):
+    """
+    Returns the JSON-serializable response for an ``ExecutionResult``.
+    """
+    response = {'data': result.data}
+    if result.errors:
+        response['errors'] = [format_error(e) for e in result.errors]
+    return response
+
+
+class GraphQLView(View):
+    """
+    Serves a DjangoSchema over HTTP.
+
+    POST takes a JSON object of 'query', and optionally 'variables' and
+    'operationName', or a list of up to ``max_batch_size`` of them,
+    executed together with ``DjangoSchema.execute_batch`` and answered
+    with a list of results in the same order. GET takes the same as query
+    string parameters (variables JSON-encoded), for query operations only.
+
+    Instead of 'query', requests may name a persisted query with 'id', or
+    Apollo's 'extensions': {"persistedQuery": {"sha256Hash": ...}}.
+
+    Successful GET responses can be cached: they get ``cache_control`` as
+    their Cache-Control header and an ETag, and requests whose
+    If-None-Match matches it are answered with an empty 304. ``etag`` is
+    'body' to hash the response, or 'versions' to hash the request and
+    the versions the schema's ``result_cache`` keeps of the registry's
+    models, which answers 304s without executing; writes which skip
+    model signals, or to models outside the registry, don't change it.
+
+        url(r'^graphql$', csrf_exempt(GraphQLView.as_view(
+            schema=schema, cache_control='public, max-age=60')))
+    """
+    schema = None
+    max_batch_size = 50
+    cache_control = None
+    etag = 'body'
+
+    def __init__(self, **kwargs):
+        super(GraphQLView, self).__init__(**kwargs)
+        if self.etag not in ETAG_SOURCES:
+            raise ValueError(
+                "Expected etag to be one of %s, saw: %r" % (ETAG_SOURCES, self.etag))
+        if self.etag == 'versions' and self.schema.result_cache is None:
+            raise ValueError("etag='versions' needs a schema with a result_cache")
+
+    def error_response(self, message, status=400):
+        return JsonResponse({'errors': [{'message': message}]}, status=status)
+
+    def get_persisted_id(self, request):
+        persisted = (request.get('extensions') or {}).get('persistedQuery') or {}
+        return request.get('id') or persisted.get('sha256Hash')
+
+    def get_request_error(self, request):
+        """
+        Returns why a request (a decoded JSON object) can't be executed,
+        or None.
+        """
+        if not isinstance(request, dict):
+            return 'Expected a JSON object, saw: %r' % (request,)
+        if not isinstance(request.get('extensions') or {}, dict):
+            return "Expected 'extensions' to be an object"
+        if not isinstance(request.get('query'), basestring) and \
+                self.get_persisted_id(request) is None:
+            return "Expected 'query' to be a string, or a persisted query id"
+        if not isinstance(request.get('variables') or {}, dict):
+            return "Expected 'variables' to be an object"
+        return None
+
+    def get_document(self, request):
+        """
+        Returns the validated document ``request`` names or sends, or None
+        if its query text doesn't validate.
+
+        Raises:
+            GraphQLError: for unknown persisted query ids
+        """
+        query_id = self.get_persisted_id(request)
+        if query_id is not None:
+            return self.schema.get_persisted_document(query_id, request.get('query'))
+        document, errors = self.schema.get_document(self.schema.schema, request['query'])
+        return None if errors else document
+
+    def execute(self, request, document=None):
+        """
+        Executes ``request``, using ``document`` if it was already looked up.
+        """
+        variables = request.get('variables')
+        operation_name = request.get('operationName')
+        if document is not None:
+            return self.schema.execute(document, variables, operation_name)
+        query_id = self.get_persisted_id(request)
+        if query_id is not None:
+            return self.schema.execute_persisted(
+                query_id, variables, operation_name, graphql_string=request.get('query'))
+        return self.schema.execute(request['query'], variables, operation_name)
+
+    def get_versions_etag(self, request):
+        """
+        Returns a weak ETag for ``request`` which changes whenever a row
+        of a model of the schema's registry is saved or deleted.
+        """
+        labels = sorted(get_model_label(model) for model in self.schema.registry.get_models())
+        key = json.dumps([
+            request.get('query'),
+            self.get_persisted_id(request),
+            request.get('variables'),
+            request.get('operationName'),
+            zip(labels, self.schema.result_cache.get_versions(labels)),
+        ], sort_keys=True)
+        return 'W/' + quote_etag(hashlib.sha1(key).hexdigest())
+
+    def is_not_modified(self, http_request, etag):
+        if_none_match = http_request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # Compared weakly, as If-None-Match is.
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        return etag in [quote_etag(value) for value in parse_etags(if_none_match)]
+
+    def set_cache_headers(self, response, etag):
+        if etag is not None:
+            response['ETag'] = etag
+        if self.cache_control is not None:
+            response['Cache-Control'] = self.cache_control
+        return response
+
+    def get(self, http_request, *args, **kwargs):
+        request = dict(
+            (name, http_request.GET[name])
+            for name in ('query', 'id', 'operationName') if name in http_request.GET)
+        for name in ('variables', 'extensions'):
+            if http_request.GET.get(name):
+                try:
+                    request[name] = json.loads(http_request.GET[name])
+                except ValueError:
+                    return self.error_response("Expected '%s' to be JSON" % name)
+        error = self.get_request_error(request)
+        if error is not None:
+            return self.error_response(error)
+
+        try:
+            document = self.get_document(request)
+        except GraphQLError as e:
+            return JsonResponse(format_result(ExecutionResult(errors=[e], invalid=True)))
+        if document is not None:
+            operation = get_operation(document, request.get('operationName'))
+            if operation is not None and operation.operation != 'query':
+                response = self.error_response(
+                    'Only query operations can be sent with GET, saw: %s' % operation.operation,
+                    status=405)
+                response['Allow'] = 'POST'
+                return response
+
+        etag = None
+        if self.etag == 'versions':
+            etag = self.get_versions_etag(request)
+            if self.is_not_modified(http_request, etag):
+                return self.set_cache_headers(HttpResponseNotModified(), etag)
+
+        result = self.execute(request, document)
+        response = JsonResponse(format_result(result))
+        if result.errors:
+            return response
+        if self.etag == 'body':
+            etag = quote_etag(hashlib.sha1(response.content).hexdigest())
+            if self.is_not_modified(http_request, etag):
+                return self.set_cache_headers(HttpResponseNotModified(), etag)
+        return self.set_cache_headers(response, etag)
+
+    def post(self, http_request, *args, **kwargs):
+        try:
+            body = json.loads(http_request.body.decode('utf-8'))
+        except ValueError:
+            return self.error_response('Expected a JSON request body')
+
+        if not isinstance(body, list):
+            error = self.get_request_error(body)
+            if error is not None:
+                return self.error_response(error)
+            return JsonResponse(format_result(self.execute(body)))
+
+        if not 0 < len(body) <= self.max_batch_size:
+            return self.error_response(
+                'Expected a batch of 1 to %s requests, saw: %s' % (
+                    self.max_batch_size, len(body)))
+        for index, request in enumerate(body):
+            error = self.get_request_error(request)
+            if error is not None:
+                return self.error_response('Request %s: %s' % (index, error))
+
+        results = [None] * len(body)
+        batch = []
+        for index, request in enumerate(body):
+            if self.get_persisted_id(request) is None:
+                batch.append((index, request))
+                continue
+            try:
+                document = self.get_document(request)
+            except GraphQLError as e:
+                results[index] = ExecutionResult(errors=[e], invalid=True)
+            else:
+                batch.append((index, dict(request, query=document)))
+        for (index, _), result in zip(batch, self.schema.execute_batch(
+                [request for _, request in batch])):
+            results[index] = result
+        return JsonResponse([format_result(result) for result in results], safe=False)
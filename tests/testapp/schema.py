@@ -1,3 +1,5 @@
+from django.db.models import Prefetch
+
 from django_graphql.lib import (
     DjangoSchema,
     DjangoType,
@@ -8,8 +10,11 @@ from django_graphql.lib import (
     GraphQLSchema,
     prefetch,
     mutation,
+    requires,
     TypeRegistry,
 )
+from django_graphql.loaders import BatchLoader
+from django_graphql.predicates import PredicateQuerySet
 
 import models
 
@@ -17,6 +22,17 @@ import models
 T = TypeRegistry()
 
 
+class CurrentContainerLoader(BatchLoader):
+    """
+    Loads the container each of a batch of items is currently in.
+    """
+    def load_batch(self, item_ids):
+        movements = models.ItemMovement.objects.filter(
+            item_id__in=item_ids,
+            left__isnull=True).select_related('container')
+        return {movement.item_id: movement.container for movement in movements}
+
+
 class Container(DjangoType):
     """
     Contains zero or more Items at any given time.
@@ -25,6 +41,8 @@ class Container(DjangoType):
     name = T.String
     items = T.List(T.Item)
     current_items = T.List(T.Item)
+    departed_items = T.List(T.Item)
+    itemmovement_set = T.Connection(T.ItemMovement)
 
     @prefetch('items')
     def get_items(self, obj, args, info):
@@ -33,12 +51,24 @@ class Container(DjangoType):
         """
         return obj.items.all()
 
-    @prefetch('items')
+    @prefetch(
+        Prefetch(
+            'itemmovement_set',
+            queryset=models.ItemMovement.objects.filter(left__isnull=True),
+            to_attr='current_movements'),
+        'current_movements__item')
     def get_current_items(self, obj, args, info):
         """
         All items currently in this container.
         """
-        return obj.items.filter(itemmovement__left__isnull=True)
+        return [movement.item for movement in obj.current_movements]
+
+    @prefetch('items__itemmovement_set')
+    def get_departed_items(self, obj, args, info):
+        """
+        All items that have left this container.
+        """
+        return PredicateQuerySet(obj.items).filter(itemmovement__left__isnull=False)
 
     class Meta:
         model = models.Container
@@ -56,6 +86,8 @@ class Item(DjangoType):
     name = T.String
     containers = T.List(T.Container)
     current_container = T.Container
+    itemmovement_set = T.List(T.ItemMovement)
+    label = T.String
 
     @prefetch('containers')
     def get_containers(self, obj, args, info):
@@ -64,12 +96,18 @@ class Item(DjangoType):
         """
         return obj.containers.all()
 
-    @prefetch('containers')
     def get_current_container(self, obj, args, info):
         """
         Current container the item is in.
         """
-        return obj.current_container()
+        return self.load(info, CurrentContainerLoader, obj.pk)
+
+    @requires('name')
+    def get_label(self, obj, args, info):
+        """
+        Item name, for display.
+        """
+        return obj.name.replace('_', ' ').title()
 
     class Meta:
         model = models.Item
@@ -77,6 +115,22 @@ class Item(DjangoType):
             'id',
             'name'
         )
+        connection = True
+
+
+class ItemMovement(DjangoType):
+    """
+    An Item entering, and possibly leaving, a Container.
+    """
+    id = T.Int
+    item = T.Item
+    container = T.Container
+
+    class Meta:
+        model = models.ItemMovement
+        filters = (
+            'id',
+        )
 
 
 schema = DjangoSchema(T)
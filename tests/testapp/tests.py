@@ -1,9 +1,44 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.core.signals import request_finished
+from django.db import connection, connections, transaction
+from django.db.models import Prefetch
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from graphql.core.error import GraphQLError
+from graphql.core.type import GraphQLField, GraphQLObjectType, GraphQLSchema, GraphQLString
 
-from django_graphql.lib import DjangoSchema
+from benchmarks.suite import compare, run_document
+from benchmarks.utils import generate_dataset
+from django_graphql.cache import BoundedCache
+from django_graphql.concurrency import ConcurrentExecutor
+from django_graphql.cost import analyze_cost
+from django_graphql.lib import DjangoSchema, DjangoType, TypeRegistry, prefetch
+from django_graphql.loaders import BatchLoader
+from django_graphql.metrics import Metrics, MetricsPlugin, metrics_view
+from django_graphql.nplusone import NPlusOneError, NPlusOnePlugin, NPlusOneWarning
+from django_graphql.pagination import encode_cursor
+from django_graphql.persisted import hash_query
+from django_graphql.predicates import PredicateQuerySet
+from django_graphql.predicates import stats as predicate_stats
+from django_graphql.recording import get_recorders
+from django_graphql.result_cache import DjangoResultCache, LocalResultCache
 from django_graphql.sql_debug import DjangoDebugPlugin
+from django_graphql.testing import SQLBudgetExceeded, SQLBudgetMixin, assert_sql_budget
+from django_graphql.tracing import TracingPlugin
+from django_graphql.views import GraphQLView
 
+import models
 from models import Container
 from models import Item
 from models import ItemMovement
@@ -234,15 +269,8 @@ class GraphQLExecutionTests(TestCase):
             result.data,
             {
                 '__debug': {
-                    'query_count': 4,
+                    'query_count': 3,
                     'queries': [
-                        {
-                            'sql': (
-                                'QUERY = u\'SELECT (1) AS "a" FROM "testapp_item" '
-                                'WHERE "testapp_item"."name" = %s '
-                                'LIMIT 1\' - PARAMS = (u"\'item_4\'",)'
-                            )
-                        },
                         {
                             'sql': (
                                 'QUERY = u\'SELECT "testapp_item"."id", '
@@ -319,3 +347,1528 @@ class GraphQLExecutionTests(TestCase):
                 'name': 'item_4'
             }
         })
+
+    def test_debug_schema_reused(self):
+        plugin = DjangoDebugPlugin()
+        debug_schema = DjangoSchema(schema.registry, [plugin])
+        query = '{ container(id: 1) { name }, __debug { query_count } }'
+        first = debug_schema.execute(query)
+        second = debug_schema.execute(query)
+
+        self.assertEqual(len(plugin._debug_schemas), 1)
+        self.assertEqual(debug_schema.document_cache.stats()['hits'], 1)
+        # Each request records its own queries (how many depends on
+        # whether '__debug' resolves before 'container').
+        self.assertLessEqual(second.data['__debug']['query_count'], 1)
+        self.assertEqual(first.data['container'], second.data['container'])
+
+    def test_debug_sql_light(self):
+        plugin = DjangoDebugPlugin(light=True)
+        with plugin.apply(root=schema.query_root) as applied:
+            list(Item.objects.filter(pk__in=[1, 2, 3]))
+            Item.objects.filter(pk=1).update(name='renamed')
+        queries = applied['root'].queries
+
+        self.assertEqual([query['rows'] for query in queries], [3, 1])
+        self.assertIn('IN (%s, %s, %s)', queries[0]['sql'])
+        self.assertEqual(queries[0]['stacktrace'], [])
+        self.assertNotIn('params', queries[0])
+
+        with DjangoDebugPlugin(light=True, stacktraces=True).apply(
+                root=schema.query_root) as applied:
+            Item.objects.count()
+        self.assertTrue(applied['root'].queries[0]['stacktrace'])
+
+    def test_debug_sql_sampling(self):
+        debug_schema = DjangoSchema(schema.registry, [DjangoDebugPlugin(sample_rate=0)])
+        result = debug_schema.execute(
+            '{ item(id: 1) { name }, __debug { sampled, query_count } }')
+        self.assertEqual(result.data['__debug'], {'sampled': False, 'query_count': 0})
+        self.assertEqual(result.data['item'], {'name': 'item_0'})
+
+    def test_debug_sql_concurrent_requests(self):
+        """
+        Tests that concurrent debug requests sharing a connection each
+        record their own queries, and only those.
+        """
+        plugin = DjangoDebugPlugin(stacktraces=False)
+        shared_connection = connections['default']
+
+        def request(i):
+            connections['default'] = shared_connection
+            pk = i % 5 + 1
+            with plugin.apply(root=schema.query_root) as applied:
+                for _ in range(i % 3 + 1):
+                    schema.execute('{ item(id: %s) { name } }' % pk)
+            return pk, i % 3 + 1, [query['sql'] for query in applied['root'].queries]
+
+        shared_connection.allow_thread_sharing = True
+        pool = ThreadPool(8)
+        try:
+            results = pool.map(request, range(100))
+        finally:
+            pool.close()
+            shared_connection.allow_thread_sharing = False
+
+        for pk, count, queries in results:
+            self.assertEqual(len(queries), count)
+            for sql in queries:
+                self.assertIn("PARAMS = (u'%s',)" % pk, sql)
+
+    def test_debug_sql_concurrent_executor(self):
+        concurrent_schema = DjangoSchema(schema.registry, max_workers=4)
+        with DjangoDebugPlugin().apply(root=schema.query_root) as applied:
+            result = concurrent_schema.execute(
+                '{ first: item(id: 1) { name }, second: item(id: 2) { name } }')
+        self.assertFalse(result.errors)
+        # Root fields were resolved, and recorded, on pool threads.
+        self.assertEqual(len(applied['root'].queries), 2)
+
+    def test_tracing(self):
+        traces = []
+        for max_workers in (0, 2):
+            traced_schema = DjangoSchema(
+                schema.registry, [TracingPlugin(on_trace=traces.append)],
+                max_workers=max_workers)
+            result = traced_schema.execute(
+                '{ box: container(id: 1) { name, items { label } } }')
+            self.assertFalse(result.errors)
+
+        for trace in traces:
+            paths = dict(
+                (timing.path, timing) for timing in trace.resolvers)
+            self.assertEqual(
+                sorted(paths),
+                [('box',), ('box', 'items'), ('box', 'items', 0, 'label'),
+                 ('box', 'items', 1, 'label'), ('box', 'items', 2, 'label'),
+                 ('box', 'items', 3, 'label'), ('box', 'items', 4, 'label'),
+                 ('box', 'name')])
+            self.assertEqual(paths['box', 'name'].parent_type, 'Container')
+            self.assertTrue(all(
+                timing.duration is not None for timing in trace.resolvers))
+
+            stats = dict((stat['name'], stat) for stat in trace.stats())
+            self.assertEqual(stats['Item.label']['count'], 5)
+            self.assertLessEqual(stats['Item.label']['p50'], stats['Item.label']['max'])
+
+            exported = json.loads(trace.to_json())
+            self.assertEqual(exported['version'], 1)
+            self.assertEqual(len(exported['execution']['resolvers']), 8)
+            self.assertIn({
+                'path': ['box', 'items', 0, 'label'],
+                'parentType': 'Item',
+                'fieldName': 'label',
+                'returnType': 'String',
+                'startOffset': paths['box', 'items', 0, 'label'].start_offset * 1e6 // 1,
+                'duration': paths['box', 'items', 0, 'label'].duration * 1e6 // 1,
+            }, exported['execution']['resolvers'])
+
+    def test_tracing_debug(self):
+        traced_schema = DjangoSchema(
+            schema.registry, [DjangoDebugPlugin(), TracingPlugin()])
+        result = traced_schema.execute(
+            '{ __debug { trace { resolvers { path, parent_type } } } }')
+        self.assertIn(
+            {'path': ['__debug'], 'parent_type': 'QUERY_ROOT'},
+            result.data['__debug']['trace']['resolvers'])
+
+    def test_plugin_exit_errors(self):
+        class ResultError(Exception):
+            pass
+
+        class ExitError(Exception):
+            pass
+
+        class FailingPlugin(object):
+            def __init__(self, on_result=False):
+                self.on_result = on_result
+                self.exception = None
+
+            @contextmanager
+            def apply(self, request=None, root=None, schema=None):
+                def on_result(result, operation_name, cost):
+                    raise ResultError()
+                try:
+                    yield {
+                        'request': request,
+                        'root': root,
+                        'schema': schema,
+                        'on_result': on_result if self.on_result else None,
+                    }
+                except Exception as e:
+                    self.exception = e
+                raise ExitError()
+
+        query = '{ container_list { id } }'
+        metrics = Metrics()
+        exiting = FailingPlugin()
+        plugins = [
+            FailingPlugin(on_result=True), MetricsPlugin(metrics), exiting, DjangoDebugPlugin()]
+        # The body's error propagates over the exit error, and every plugin
+        # exits with it.
+        with self.assertRaises(ResultError):
+            schema.execute(query, plugins=plugins)
+        self.assertIsInstance(exiting.exception, ResultError)
+        self.assertEqual(get_recorders(), ())
+        self.assertEqual(metrics.get_value('graphql_errors_total', operation='anonymous'), 1)
+
+        # A plugin's exit error is raised when the body succeeded.
+        with self.assertRaises(ExitError):
+            schema.execute(query, plugins=[FailingPlugin(), DjangoDebugPlugin()])
+        self.assertEqual(get_recorders(), ())
+
+    def test_nplusone(self):
+        R = TypeRegistry()
+
+        class ContainerItemsLoader(BatchLoader):
+            def load_batch(self, container_ids):
+                return [
+                    list(models.Item.objects.filter(itemmovement__container_id=container_id))
+                    for container_id in container_ids]
+
+        class Item(DjangoType):
+            id = R.Int
+            name = R.String
+
+            class Meta:
+                model = models.Item
+                filters = ('id',)
+
+        class Container(DjangoType):
+            id = R.Int
+            all_items = R.List(R.Item)
+            loaded_items = R.List(R.Item)
+
+            def get_all_items(self, obj, args, info):
+                return obj.items.all()
+
+            def get_loaded_items(self, obj, args, info):
+                return self.load(info, ContainerItemsLoader, obj.pk)
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+
+        query = '{ container_list { all_items { name } } }'
+        with self.assertRaises(NPlusOneError) as context:
+            DjangoSchema(R, [NPlusOnePlugin(action='raise')]).execute(query)
+        self.assertEqual(str(context.exception), (
+            'N+1 queries:\n'
+            'container_list.all_items ran 2 queries shaped: SELECT "testapp_item"."id", '
+            '"testapp_item"."name" FROM "testapp_item" INNER JOIN "testapp_itemmovement" '
+            'ON ( "testapp_item"."id" = "testapp_itemmovement"."item_id" ) '
+            'WHERE "testapp_itemmovement"."container_id" = %s\n'
+            "  Decorate Container.get_all_items with @prefetch('items'), "
+            "or load it with a BatchLoader."))
+
+        # Plugins applied before it still exit.
+        with self.assertRaises(NPlusOneError):
+            DjangoSchema(R, [DjangoDebugPlugin(), NPlusOnePlugin(action='raise')]).execute(query)
+        self.assertEqual(get_recorders(), ())
+
+        # Tolerated up to the threshold.
+        result = DjangoSchema(R, [NPlusOnePlugin(threshold=2, action='raise')]).execute(query)
+        self.assertEqual(len(result.data['container_list']), 2)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            DjangoSchema(R, [NPlusOnePlugin()]).execute(query)
+        self.assertEqual([warning.category for warning in caught], [NPlusOneWarning])
+
+        # Counted per path: each list repeats the query up to the threshold.
+        result = DjangoSchema(R, [NPlusOnePlugin(threshold=2, action='raise')]).execute(
+            '{ a: container_list { all_items { name } }, b: container_list { all_items { id } } }')
+        self.assertFalse(result.errors)
+
+        # Queries a loader runs count toward the field queuing its keys.
+        with self.assertRaises(NPlusOneError) as context:
+            DjangoSchema(R, [NPlusOnePlugin(action='raise')]).execute(
+                '{ container_list { loaded_items { name } } }')
+        self.assertTrue(str(context.exception).startswith(
+            'N+1 queries:\ncontainer_list.loaded_items ran 2 queries shaped: '))
+
+    def test_nplusone_prefetched(self):
+        detected_schema = DjangoSchema(
+            schema.registry, [DjangoDebugPlugin(), NPlusOnePlugin(action='raise')])
+        result = detected_schema.execute("""
+            {
+                container_list {
+                    items { name, current_container { name }, containers { name } },
+                    current_items { label }
+                },
+                __debug { query_count }
+            }
+        """)
+        self.assertFalse(result.errors)
+
+    def test_metrics(self):
+        metrics = Metrics()
+        query = """
+            query Boxes {
+                box: container(id: 1) { name, items { label } },
+                container_list { name }
+            }
+        """
+        for max_workers in (0, 2):
+            measured_schema = DjangoSchema(
+                schema.registry, [MetricsPlugin(metrics)], max_workers=max_workers)
+            with CaptureQueriesContext(connection) as queries:
+                result = measured_schema.execute(query)
+            self.assertFalse(result.errors)
+        measured_schema.execute('{ nope }')
+
+        self.assertEqual(metrics.get_value('graphql_requests_total', operation='Boxes'), 2)
+        self.assertEqual(metrics.get_value('graphql_errors_total', operation='Boxes'), 0)
+        self.assertEqual(metrics.get_value('graphql_errors_total', operation='anonymous'), 1)
+        counts, total = metrics.get_value('graphql_request_sql_queries', operation='Boxes')
+        self.assertEqual(sum(counts), 2)
+        self.assertEqual(total, 2 * len(queries))
+
+        # container(id: 1) loads the container, then prefetches its items.
+        counts, total = metrics.get_value(
+            'graphql_root_field_sql_queries', operation='Boxes', field='container')
+        self.assertEqual(total, 4)
+        counts, _ = metrics.get_value(
+            'graphql_root_field_duration_seconds', operation='Boxes', field='container_list')
+        self.assertEqual(sum(counts), 2)
+
+        rendered = metrics.render()
+        self.assertIn('# TYPE graphql_requests_total counter\n', rendered)
+        self.assertIn('graphql_requests_total{operation="Boxes"} 2\n', rendered)
+        self.assertIn(
+            'graphql_root_field_sql_queries_bucket'
+            '{operation="Boxes",field="container",le="2.0"} 2\n', rendered)
+        self.assertIn(
+            'graphql_root_field_duration_seconds_bucket'
+            '{operation="Boxes",field="container",le="+Inf"} 2\n', rendered)
+        self.assertIn('graphql_request_sql_queries_count{operation="Boxes"} 2\n', rendered)
+
+    def test_metrics_view(self):
+        metrics = Metrics(max_operations=1)
+        measured_schema = DjangoSchema(schema.registry, [MetricsPlugin(metrics)])
+        measured_schema.execute('query A { container(id: 1) { name } }')
+        measured_schema.execute('query B { container(id: 1) { name } }')
+
+        response = metrics_view(RequestFactory().get('/metrics'), metrics=metrics)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('graphql_requests_total{operation="A"} 1\n', response.content)
+        self.assertIn('graphql_requests_total{operation="other"} 1\n', response.content)
+
+    def test_sql_budget(self):
+        result = assert_sql_budget(
+            schema, '{ container(id: 1) { items { name }, current_items { name } } }',
+            max_queries=4, max_rows=15, max_duplicates=0)
+        self.assertEqual(len(result.data['container']['items']), 5)
+
+        with self.assertRaises(SQLBudgetExceeded) as context:
+            assert_sql_budget(schema, '{ container(id: 1) { items { name } } }', max_queries=1)
+        self.assertEqual(
+            str(context.exception).split('\n')[:2], [
+                'SQLBudgetExceeded: queries 2 exceeds max_queries 1',
+                '  container (1 rows): SELECT "testapp_container"."id" FROM "testapp_container" '
+                'WHERE "testapp_container"."id" = %s LIMIT 21'])
+        self.assertEqual(schema.plugins, ())
+
+        # The schema, which other threads may be using, is left alone.
+        seen = []
+
+        class PluginsSpy(object):
+            @contextmanager
+            def apply(self, **kwargs):
+                seen.append(spied_schema.plugins)
+                yield kwargs
+
+        spied_schema = DjangoSchema(schema.registry, (PluginsSpy(),))
+        assert_sql_budget(spied_schema, '{ container(id: 1) { name } }', max_queries=1)
+        self.assertEqual(seen, [spied_schema.plugins])
+        self.assertEqual(len(spied_schema.plugins), 1)
+
+    def test_sql_budget_duplicates(self):
+        R = TypeRegistry()
+
+        class Item(DjangoType):
+            name = R.String
+
+            class Meta:
+                model = models.Item
+                filters = ('id',)
+
+        class Container(DjangoType):
+            all_items = R.List(R.Item)
+
+            def get_all_items(self, obj, args, info):
+                return obj.items.all()
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+
+        class BudgetTests(SQLBudgetMixin, TestCase):
+            def runTest(self):
+                pass
+
+        with self.assertRaises(AssertionError) as context:
+            BudgetTests().assertSQLBudget(
+                DjangoSchema(R), '{ container_list { all_items { name } } }',
+                max_duplicates=0)
+        lines = str(context.exception).split('\n')
+        self.assertEqual(lines[0], 'SQLBudgetExceeded: duplicates 1 exceeds max_duplicates 0')
+        self.assertTrue(lines[2].startswith('  container_list[0].all_items (5 rows): SELECT'))
+        self.assertTrue(lines[3].startswith(
+            '  container_list[1].all_items (1 rows, duplicate): SELECT'))
+
+    def test_execute_batch(self):
+        requests = [
+            {'query': '{ item(id: 1) { name } }'},
+            {'query': 'query Second($id: Int) { item(id: $id) { name } }',
+             'variables': {'id': 2}},
+            {'query': '{ item(id: 3) { name, containers { name } } }'},
+            {'query': '{ container(id: 1) { name } }'},
+            {'query': '{ nope }'},
+            {'query': '{ item(id: 99) { name } }'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            results = schema.execute_batch(requests)
+
+        self.assertEqual([result.data for result in results], [
+            {'item': {'name': 'item_0'}},
+            {'item': {'name': 'item_1'}},
+            {'item': {'name': 'item_2', 'containers': [{'name': 'container_0'}]}},
+            {'container': {'name': 'container_0'}},
+            None,
+            {'item': None},
+        ])
+        self.assertTrue(results[4].invalid)
+        # Items 1, 2 and 99 share a selection and load with one query; item
+        # 3 adds a query and a prefetch, container 1 a query.
+        self.assertEqual(len(queries), 4)
+        self.assertIn('IN (%s, %s, %s)\' - PARAMS = (1, 2, 99)', queries[0]['sql'])
+
+    def test_batch_view(self):
+        view = GraphQLView.as_view(schema=schema)
+        factory = RequestFactory()
+
+        response = view(factory.post('/graphql', json.dumps([
+            {'query': '{ item(id: 1) { name } }'},
+            {'query': '{ nope }'},
+            {'query': '{ item(id: 2) {'},
+            {'query': '{ item(id: 3) { name } }'},
+        ]), content_type='application/json'))
+        self.assertEqual(response.status_code, 200)
+        data, error, syntax_error, more_data = json.loads(response.content)
+        self.assertEqual(data, {'data': {'item': {'name': 'item_0'}}})
+        self.assertEqual(error['data'], None)
+        self.assertIn('nope', error['errors'][0]['message'])
+        self.assertEqual(syntax_error['data'], None)
+        self.assertIn('Syntax Error', syntax_error['errors'][0]['message'])
+        self.assertEqual(more_data, {'data': {'item': {'name': 'item_2'}}})
+
+        for response in [
+                view(factory.post(
+                    '/graphql', json.dumps({'query': '{ item(id: 2) {'}),
+                    content_type='application/json')),
+                view(factory.get('/graphql', {'query': '{ item(id: 2) {'}))]:
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Syntax Error', json.loads(response.content)['errors'][0]['message'])
+
+        response = view(factory.post(
+            '/graphql', json.dumps({'query': '{ item(id: 2) { name } }'}),
+            content_type='application/json'))
+        self.assertEqual(json.loads(response.content), {'data': {'item': {'name': 'item_1'}}})
+
+        response = view(factory.post(
+            '/graphql', json.dumps([{'query': '{ item(id: 1) { name } }'}, {}]),
+            content_type='application/json'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content),
+            {'errors': [{
+                'message': "Request 1: Expected 'query' to be a string, or a persisted query id",
+            }]})
+
+    def test_view_get(self):
+        local_schema = DjangoSchema(schema.registry)
+        view = GraphQLView.as_view(schema=local_schema, cache_control='public, max-age=60')
+        factory = RequestFactory()
+        query = '{ item(id: 1) { name } }'
+
+        response = view(factory.get('/graphql', {'query': query}))
+        self.assertEqual(json.loads(response.content), {'data': {'item': {'name': 'item_0'}}})
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        etag = response['ETag']
+
+        response = view(factory.get('/graphql', {'query': query}, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+        self.assertEqual(response['ETag'], etag)
+
+        query_hash = local_schema.persisted_queries.register(query)
+        response = view(factory.get('/graphql', {'id': query_hash}))
+        self.assertEqual(response['ETag'], etag)
+        response = view(factory.get('/graphql', {'extensions': json.dumps(
+            {'persistedQuery': {'version': 1, 'sha256Hash': query_hash}})}))
+        self.assertEqual(response['ETag'], etag)
+
+        response = view(factory.get('/graphql', {
+            'query': 'query Q($id: Int) { item(id: $id) { name } }',
+            'variables': json.dumps({'id': 2})}))
+        self.assertEqual(json.loads(response.content), {'data': {'item': {'name': 'item_1'}}})
+
+        # Errors are neither tagged nor cacheable.
+        for params in ({'query': '{ nope }'}, {'id': 'unknown'}):
+            response = view(factory.get('/graphql', params))
+            self.assertIn('errors', json.loads(response.content))
+            self.assertFalse(response.has_header('ETag'))
+            self.assertFalse(response.has_header('Cache-Control'))
+
+        response = view(factory.get('/graphql', {'query': query, 'variables': '{'}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_get_mutation(self):
+        mutation_schema = DjangoSchema(schema.registry)
+        mutation_schema.schema = GraphQLSchema(
+            query=mutation_schema.query_root,
+            mutation=GraphQLObjectType('Mutation', {
+                'noop': GraphQLField(GraphQLString, resolver=lambda *args: 'done')}))
+        view = GraphQLView.as_view(schema=mutation_schema)
+
+        response = view(RequestFactory().get('/graphql', {'query': 'mutation { noop }'}))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'POST')
+
+        response = view(RequestFactory().post(
+            '/graphql', json.dumps({'query': 'mutation { noop }'}),
+            content_type='application/json'))
+        self.assertEqual(json.loads(response.content), {'data': {'noop': 'done'}})
+
+    def test_view_versions_etag(self):
+        cached_schema = DjangoSchema(schema.registry, result_cache=LocalResultCache())
+        view = GraphQLView.as_view(schema=cached_schema, etag='versions')
+        factory = RequestFactory()
+        query = {'query': '{ item(id: 1) { name } }'}
+
+        etag = view(factory.get('/graphql', query))['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        with CaptureQueriesContext(connection) as queries:
+            response = view(factory.get('/graphql', query, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+        Item.objects.get(id=2).save()
+        response = view(factory.get('/graphql', query, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        with self.assertRaises(ValueError):
+            GraphQLView(schema=schema, etag='versions')
+        with self.assertRaises(ValueError):
+            GraphQLView(schema=schema, etag='weak')
+
+    def test_document_cache(self):
+        """
+        Tests that repeated documents skip parsing and validation.
+        """
+        cached_schema = DjangoSchema(schema.registry)
+        query = '{ item(name: "item_0") { id, name } }'
+
+        first = cached_schema.execute(query)
+        second = cached_schema.execute(query)
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(second.data, {'item': {'id': 1, 'name': 'item_0'}})
+        self.assertEqual(cached_schema.document_cache.misses, 1)
+        self.assertEqual(cached_schema.document_cache.hits, 1)
+
+    def test_document_cache_validation_errors(self):
+        cached_schema = DjangoSchema(schema.registry)
+        for _ in range(2):
+            result = cached_schema.execute('{ item(name: "item_0") { nope } }')
+            self.assertTrue(result.invalid)
+            self.assertEqual(len(result.errors), 1)
+        self.assertEqual(cached_schema.document_cache.hits, 1)
+
+    def test_persisted_query(self):
+        persisted_schema = DjangoSchema(schema.registry)
+        query_hash = persisted_schema.persisted_queries.register(
+            'query Item($name: String) { item(name: $name) { id, name } }')
+
+        result = persisted_schema.execute_persisted(
+            query_hash, variables={'name': 'item_1'})
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.data, {'item': {'id': 2, 'name': 'item_1'}})
+        # Stored documents never go through the document cache.
+        self.assertEqual(persisted_schema.document_cache.misses, 0)
+
+    def test_persisted_query_strict(self):
+        persisted_schema = DjangoSchema(schema.registry)
+        query = '{ item(name: "item_1") { id } }'
+
+        result = persisted_schema.execute_persisted(
+            hash_query(query), graphql_string=query)
+
+        self.assertTrue(result.invalid)
+        self.assertIn('PersistedQueryNotFound', result.errors[0].message)
+        self.assertEqual(len(persisted_schema.persisted_queries), 0)
+
+    def test_persisted_query_on_demand(self):
+        persisted_schema = DjangoSchema(schema.registry, strict_persisted_queries=False)
+        query = '{ item(name: "item_1") { id } }'
+
+        mismatch = persisted_schema.execute_persisted('abc', graphql_string=query)
+        result = persisted_schema.execute_persisted(hash_query(query), graphql_string=query)
+        again = persisted_schema.execute_persisted(hash_query(query))
+
+        self.assertTrue(mismatch.invalid)
+        self.assertEqual(result.data, {'item': {'id': 2}})
+        self.assertEqual(again.data, {'item': {'id': 2}})
+
+    def test_persisted_query_on_demand_bounded(self):
+        persisted_schema = DjangoSchema(
+            schema.registry, strict_persisted_queries=False, persisted_query_cache_size=1)
+        manifest = '{ item(name: "item_0") { id } }'
+        persisted_schema.persisted_queries.register(manifest)
+        first = '{ item(name: "item_1") { id } }'
+        second = '{ item(name: "item_2") { id } }'
+
+        persisted_schema.execute_persisted(hash_query(first), graphql_string=first)
+        result = persisted_schema.execute_persisted(hash_query(second), graphql_string=second)
+
+        self.assertEqual(result.data, {'item': {'id': 3}})
+        self.assertNotIn(hash_query(first), persisted_schema.persisted_queries)
+        self.assertIn(hash_query(second), persisted_schema.persisted_queries)
+        self.assertIn(hash_query(manifest), persisted_schema.persisted_queries)
+        self.assertIn(
+            'PersistedQueryNotFound',
+            persisted_schema.execute_persisted(hash_query(first)).errors[0].message)
+
+    def test_prefetch_plan_cache(self):
+        """
+        Tests that prefetch plans are built once per cached document.
+        """
+        cached_schema = DjangoSchema(schema.registry)
+        plan_cache = schema.registry.plan_cache
+        query = '{ container(id: 1) { id, items { id, containers { id } } } }'
+        builds = plan_cache.builds
+
+        first = cached_schema.execute(query)
+        second = cached_schema.execute(query)
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(plan_cache.builds, builds + 1)
+        self.assertGreaterEqual(plan_cache.stats()['build_duration'], 0)
+
+    def test_single_root_lookup(self):
+        """
+        Tests that singular root lookups fetch with a single query, and
+        resolve missing rows to null.
+        """
+        self.assertEqual(
+            set(schema.registry._get_django_type('Container').get_unique_filters()),
+            {frozenset(['id']), frozenset(['name'])})
+        self.assertEqual(
+            schema.registry._get_django_type('Item').get_unique_filters(),
+            [frozenset(['id'])])
+
+        for query, expected in [
+                ('{ container(name: "container_1") { id } }', {'id': 2}),
+                ('{ container(name: "container_9") { id } }', None),
+                ('{ item(name: "item_3") { id } }', {'id': 4}),
+                ('{ item(name: "item_9") { id } }', None)]:
+            with self.assertNumQueries(1):
+                result = schema.execute(query)
+            self.assertEqual(result.errors, [])
+            self.assertEqual(result.data.values(), [expected])
+
+    def test_column_projection(self):
+        """
+        Tests that root and prefetch queries only load selected columns.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            result = schema.execute("""
+                {
+                  container(id: 1) {
+                    id,
+                    items {
+                      id
+                    }
+                  }
+                }
+            """)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(len(result.data['container']['items']), 5)
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertNotIn('"name"', query['sql'])
+
+    def test_requires(self):
+        """
+        Tests that columns declared with @requires are loaded up front.
+        """
+        with self.assertNumQueries(1):
+            result = schema.execute('{ item(name: "item_0") { id, label } }')
+
+        self.assertEqual(result.data, {'item': {'id': 1, 'label': 'Item 0'}})
+
+    def test_select_related(self):
+        """
+        Tests that to-one relations are joined instead of prefetched.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            result = schema.execute("""
+                {
+                  itemmovement(id: 6) {
+                    id,
+                    item {
+                      name
+                    },
+                    container {
+                      name
+                    }
+                  }
+                }
+            """)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.data, {
+            'itemmovement': {
+                'id': 6,
+                'item': {'name': 'item_4'},
+                'container': {'name': 'container_1'},
+            }
+        })
+        # A single joined query.
+        self.assertEqual(len(queries), 1)
+        self.assertIn('INNER JOIN "testapp_container"', queries[0]['sql'])
+
+    def test_inferred_prefetch(self):
+        """
+        Tests that fields named after model relations are prefetched
+        without @prefetch.
+        """
+        with self.assertNumQueries(2):
+            result = schema.execute("""
+                {
+                  item(name: "item_4") {
+                    itemmovement_set {
+                      id,
+                      container {
+                        name
+                      }
+                    }
+                  }
+                }
+            """)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.data, {
+            'item': {
+                'itemmovement_set': [
+                    {'id': 5, 'container': {'name': 'container_0'}},
+                    {'id': 6, 'container': {'name': 'container_1'}},
+                ]
+            }
+        })
+
+    def test_current_items_prefetch(self):
+        """
+        Tests that ``get_current_items`` loads open movements and their
+        items in a single query instead of one query per container.
+        """
+        # Container, open movements joined with items.
+        with self.assertNumQueries(2):
+            result = schema.execute("""
+                {
+                  container(id: 1) {
+                    current_items {
+                      name
+                    }
+                  }
+                }
+            """)
+
+        self.assertEqual(
+            result.data['container']['current_items'],
+            [{'name': 'item_%s' % i} for i in range(4)])
+
+    def test_nested_filtered_prefetch(self):
+        """
+        Tests that declared ``Prefetch`` objects compose under other lookups.
+        """
+        # Item, its containers, their open movements.
+        with self.assertNumQueries(3):
+            result = schema.execute("""
+                {
+                  item(name: "item_4") {
+                    containers {
+                      name,
+                      current_items {
+                        name
+                      }
+                    }
+                  }
+                }
+            """)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.data['item']['containers'], [
+            {
+                'name': 'container_0',
+                'current_items': [{'name': 'item_%s' % i} for i in range(4)]
+            },
+            {
+                'name': 'container_1',
+                'current_items': [{'name': 'item_4'}]
+            },
+        ])
+
+    def test_declarative_filtered_prefetch(self):
+        R = TypeRegistry()
+
+        class Item(DjangoType):
+            id = R.Int
+            name = R.String
+
+            class Meta:
+                model = models.Item
+                filters = ('id',)
+
+        class Container(DjangoType):
+            id = R.Int
+            some_items = R.List(R.Item)
+            items = R.List(R.Item)
+
+            @prefetch('items', filter={'name__in': ['item_1', 'item_2']}, to_attr='some')
+            def get_some_items(self, obj, args, info):
+                return obj.some
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+
+        with self.assertNumQueries(3):
+            result = DjangoSchema(R).execute(
+                '{ container(id: 1) { some_items { name }, items { id } } }')
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(
+            result.data['container']['some_items'],
+            [{'name': 'item_1'}, {'name': 'item_2'}])
+        self.assertEqual(len(result.data['container']['items']), 5)
+
+    def test_conflicting_prefetch_querysets(self):
+        R = TypeRegistry()
+
+        class Item(DjangoType):
+            id = R.Int
+
+            class Meta:
+                model = models.Item
+                filters = ('id',)
+
+        class Container(DjangoType):
+            id = R.Int
+            some_items = R.List(R.Item)
+            items = R.List(R.Item)
+
+            @prefetch(Prefetch('items', queryset=models.Item.objects.filter(id=1)))
+            def get_some_items(self, obj, args, info):
+                return obj.items.all()
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+
+        result = DjangoSchema(R).execute(
+            '{ container(id: 1) { some_items { id }, items { id } } }')
+
+        self.assertIn('to_attr', result.errors[0].message)
+
+    def test_predicate_queryset(self):
+        container = Container.objects.prefetch_related(
+            'items__itemmovement_set').get(name='container_0')
+        items = PredicateQuerySet(container.items)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [item.name for item in items.filter(id__gt=3, name__in=['item_2', 'item_3'])],
+                ['item_3'])
+            self.assertEqual(
+                [item.id for item in items.exclude(id__lte='3').order_by('-name')],
+                [5, 4])
+            self.assertEqual(items.filter(itemmovement__left__isnull=False).count(), 1)
+            self.assertFalse(items.filter(name='item_9').exists())
+
+    def test_predicate_queryset_same_related_row(self):
+        """
+        Tests that lookups of one filter() call on a multi-valued relation
+        match the same related row, and rows repeat as often as in SQL.
+        """
+        container = Container.objects.get(name='container_0')
+        ItemMovement.objects.create(
+            item=Item.objects.get(name='item_0'), container=container, left=timezone.now())
+        prefetched = Container.objects.prefetch_related(
+            'items__itemmovement_set').get(name='container_0')
+        later = timezone.now() + timedelta(days=1)
+        predicate_stats.reset()
+
+        for kwargs in [
+                {'itemmovement__left__isnull': True},
+                {'itemmovement__left__isnull': True, 'itemmovement__left__lt': later},
+                {'itemmovement__left__lt': later, 'name__in': ['item_0', 'item_4']},
+                {'itemmovement__container__pk': container.pk, 'name': 'item_0'},
+                {'containers__name': 'container_1'}]:
+            self.assertEqual(
+                sorted(item.name for item in PredicateQuerySet(prefetched.items).filter(**kwargs)),
+                sorted(item.name for item in container.items.filter(**kwargs)), kwargs)
+        # Only the lookup back to the manager's own container needs SQL.
+        self.assertEqual(predicate_stats.fallbacks, 1)
+
+    def test_predicate_queryset_resolver(self):
+        predicate_stats.reset()
+        # Container, its items, their movements; filtered in memory.
+        with self.assertNumQueries(3):
+            result = schema.execute('{ container(id: 1) { departed_items { name } } }')
+        self.assertEqual(result.data, {'container': {'departed_items': [{'name': 'item_4'}]}})
+        self.assertEqual(predicate_stats.fallbacks, 0)
+
+    def test_predicate_queryset_fallback(self):
+        predicate_stats.reset()
+        container = Container.objects.get(name='container_0')
+        items = PredicateQuerySet(container.items).filter(itemmovement__left__isnull=True)
+
+        self.assertEqual(items.count(), 4)
+        self.assertEqual(predicate_stats.fallback_reasons['not prefetched'], 1)
+
+        prefetched = Container.objects.prefetch_related('items').get(name='container_0')
+        with self.assertNumQueries(1):
+            names = PredicateQuerySet(prefetched.items).filter(name__startswith='item_')
+            self.assertEqual(len(names), 5)
+        self.assertEqual(predicate_stats.fallbacks, 2)
+        self.assertEqual(
+            predicate_stats.fallback_reasons["unsupported lookup type 'startswith'"], 1)
+
+    def test_batch_loader(self):
+        """
+        Tests that keys loaded across a list are fetched in one query per
+        nesting level.
+        """
+        with self.assertNumQueries(4):
+            result = schema.execute("""
+            {
+                item(name: "item_4") {
+                    containers {
+                        items {
+                            current_container { name }
+                        }
+                    }
+                }
+            }
+            """)
+
+        self.assertFalse(result.errors)
+        self.assertEqual(
+            [[item['current_container']['name'] for item in container['items']]
+             for container in result.data['item']['containers']],
+            [['container_0'] * 4 + ['container_1'], ['container_1']])
+
+    def test_batch_loader_cache(self):
+        R = TypeRegistry()
+        batches = []
+
+        class NameLoader(BatchLoader):
+            def load_batch(self, item_ids):
+                batches.append(item_ids)
+                if 0 in item_ids:
+                    raise ValueError('no item 0')
+                return [models.Item.objects.get(pk=pk).name for pk in item_ids]
+
+        class Item(DjangoType):
+            id = R.Int
+            name = R.String
+            first_name = R.String
+            missing_name = R.String
+
+            def get_name(self, obj, args, info):
+                return self.load(info, NameLoader, obj.pk)
+
+            def get_first_name(self, obj, args, info):
+                return self.load(info, NameLoader, 1)
+
+            def get_missing_name(self, obj, args, info):
+                return self.load(info, NameLoader, 0)
+
+            class Meta:
+                model = models.Item
+                filters = ('id',)
+
+        class Container(DjangoType):
+            id = R.Int
+            items = R.List(R.Item)
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+
+        loader_schema = DjangoSchema(R)
+        result = loader_schema.execute(
+            '{ container(id: 2) { items { name, first_name } } }')
+        self.assertEqual(
+            result.data['container']['items'],
+            [{'name': 'item_4', 'first_name': 'item_0'}])
+        self.assertEqual([sorted(batch) for batch in batches], [[1, 5]])
+
+        result = loader_schema.execute('{ item(id: 1) { name, missing_name } }')
+        self.assertEqual(result.data['item'], {'name': None, 'missing_name': None})
+        self.assertEqual(result.errors[0].message, 'no item 0')
+        # Loaded values are only cached for the request that loaded them.
+        self.assertEqual([sorted(batch) for batch in batches[1:]], [[0, 1]])
+
+    def test_connection(self):
+        """
+        Tests keyset pagination of root connections.
+        """
+        def page(args):
+            with self.assertNumQueries(1):
+                result = schema.execute("""
+                {
+                    item_connection(%s) {
+                        edges { cursor, node { name } }
+                        pageInfo { hasNextPage, hasPreviousPage, startCursor, endCursor }
+                    }
+                }
+                """ % args)
+            self.assertEqual(result.errors, [])
+            connection = result.data['item_connection']
+            return [edge['node']['name'] for edge in connection['edges']], connection['pageInfo']
+
+        names, page_info = page('first: 2')
+        self.assertEqual(names, ['item_0', 'item_1'])
+        self.assertEqual(page_info, {
+            'hasNextPage': True,
+            'hasPreviousPage': False,
+            'startCursor': encode_cursor(1),
+            'endCursor': encode_cursor(2),
+        })
+        names, page_info = page('first: 3, after: "%s"' % page_info['endCursor'])
+        self.assertEqual(names, ['item_2', 'item_3', 'item_4'])
+        self.assertFalse(page_info['hasNextPage'])
+
+        names, page_info = page('last: 2')
+        self.assertEqual(names, ['item_3', 'item_4'])
+        self.assertTrue(page_info['hasPreviousPage'])
+        names, page_info = page('last: 2, before: "%s"' % page_info['startCursor'])
+        self.assertEqual(names, ['item_1', 'item_2'])
+        self.assertTrue(page_info['hasPreviousPage'])
+
+        names, _ = page('name: "item_3"')
+        self.assertEqual(names, ['item_3'])
+
+        result = schema.execute('{ item_connection(after: "nope") { edges { cursor } } }')
+        self.assertEqual(result.data, {'item_connection': None})
+        self.assertEqual(result.errors[0].message, "Invalid cursor: 'nope'")
+
+    def test_connection_page_size(self):
+        result = schema.execute('{ item_connection(first: 1001) { edges { cursor } } }')
+        self.assertEqual(
+            result.errors[0].message, "Expected 'first' and 'last' to be at most 1000, saw: 1001")
+        result = schema.execute('{ item_connection(last: -1) { edges { cursor } } }')
+        self.assertEqual(
+            result.errors[0].message, "Expected 'first' and 'last' to be non-negative, saw: -1")
+
+        R = TypeRegistry()
+
+        class Item(DjangoType):
+            id = R.Int
+
+            class Meta:
+                model = models.Item
+                filters = ('id',)
+                connection = {'max_page_size': 2}
+
+        class Container(DjangoType):
+            id = R.Int
+            items = R.Connection(R.Item)
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+
+        result = DjangoSchema(R).execute("""
+            {
+                item_connection { edges { node { id } } }
+                container(id: 1) { items(first: 3) { edges { cursor } } }
+            }
+        """)
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ["Expected 'first' and 'last' to be at most 2, saw: 3"])
+        # Without 'first' or 'last', pages are cut to the maximum.
+        self.assertEqual(
+            result.data['item_connection'],
+            {'edges': [{'node': {'id': 1}}, {'node': {'id': 2}}]})
+
+    def test_nested_connection(self):
+        """
+        Tests that connections nested under a list load every parent's
+        page with one query.
+        """
+        with self.assertNumQueries(4):
+            result = schema.execute("""
+            {
+                item(name: "item_4") {
+                    containers {
+                        name,
+                        itemmovement_set(last: 1) {
+                            edges { node { id, item { name } } }
+                            pageInfo { hasPreviousPage }
+                        }
+                    }
+                }
+            }
+            """)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.data['item']['containers'], [
+            {
+                'name': 'container_0',
+                'itemmovement_set': {
+                    'edges': [{'node': {'id': 5, 'item': {'name': 'item_4'}}}],
+                    'pageInfo': {'hasPreviousPage': True},
+                },
+            },
+            {
+                'name': 'container_1',
+                'itemmovement_set': {
+                    'edges': [{'node': {'id': 6, 'item': {'name': 'item_4'}}}],
+                    'pageInfo': {'hasPreviousPage': False},
+                },
+            },
+        ])
+
+    def test_many_to_many_connection(self):
+        R = TypeRegistry()
+
+        class Item(DjangoType):
+            id = R.Int
+            containers = R.Connection(R.Container)
+
+            class Meta:
+                model = models.Item
+                filters = ('id',)
+
+        class Container(DjangoType):
+            id = R.Int
+            items = R.Connection(R.Item)
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+                connection = True
+
+        connection_schema = DjangoSchema(R)
+        with self.assertNumQueries(3):
+            result = connection_schema.execute("""
+            {
+                container_connection {
+                    edges {
+                        node {
+                            items(first: 2, after: "%s") {
+                                edges { node { id, containers { edges { node { id } } } } }
+                            }
+                        }
+                    }
+                }
+            }
+            """ % encode_cursor(3))
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(
+            [[[edge['node']['id'] for edge in item['node']['containers']['edges']]
+              for item in container['node']['items']['edges']]
+             for container in result.data['container_connection']['edges']],
+            [[[1], [1, 2]], [[1, 2]]])
+
+    def test_execute_stream(self):
+        """
+        Tests that streamed results match ``execute``, with list root
+        fields fetched and prefetched in chunks.
+        """
+        query = """
+        {
+            container(id: 2) { name },
+            item_list(id: [1, 2, 3, 5]) {
+                id,
+                containers { name }
+            }
+        }
+        """
+        # Container, items, then containers prefetched for each chunk of 2.
+        with self.assertNumQueries(4):
+            fragments = list(schema.execute_stream(query, chunk_size=2))
+
+        self.assertGreater(len(fragments), 4)
+        result = schema.execute(query)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(json.loads(''.join(fragments)), {'data': result.data})
+        self.assertEqual(
+            [item['id'] for item in result.data['item_list']], [1, 2, 3, 5])
+
+        fragments = schema.execute_stream('{ item_list(name: ["none"]) { id } }')
+        self.assertEqual(json.loads(''.join(fragments)), {'data': {'item_list': []}})
+
+        fragments = schema.execute_stream('{ item_list { nope } }')
+        self.assertEqual(
+            json.loads(''.join(fragments))['errors'][0]['message'],
+            'Cannot query field "nope" on "Item".')
+
+    def test_concurrent_root_fields(self):
+        """
+        Tests that root fields resolved on a thread pool give the same
+        results as resolving them one after another.
+        """
+        query = """
+        {
+            container(name: "container_1") { id, name },
+            item(id: 1) { name, current_container { name } },
+            item_list(id: [2, 5]) { name, containers { name } },
+            item_connection(after: "nope") { edges { cursor } }
+        }
+        """
+        concurrent_schema = DjangoSchema(
+            schema.registry, max_workers=4, concurrent_loaders=True)
+        expected = schema.execute(query)
+        result = concurrent_schema.execute(query)
+
+        self.assertEqual(result.data, expected.data)
+        self.assertEqual(result.data['item_list'][1]['containers'], [
+            {'name': 'container_0'},
+            {'name': 'container_1'},
+        ])
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ["Invalid cursor: 'nope'"])
+
+    def test_query_cost(self):
+        def get_cost(query, **kwargs):
+            document, errors = schema.get_document(schema.schema, query)
+            self.assertEqual(errors, [])
+            return analyze_cost(schema.registry, schema.schema, document, **kwargs).as_dict()
+
+        # 10 containers (no estimated_count), 10 items each, 10 containers
+        # each; every level is prefetched with one query.
+        self.assertEqual(
+            get_cost('{ container_list { name, items { name, containers { name } } } }'),
+            {'depth': 4, 'rows': 1110, 'queries': 3})
+        # 'current_container' is resolved for each item on its own.
+        self.assertEqual(
+            get_cost("""
+                query Items($ids: [Int]) {
+                    item_list(id: $ids) { ...itemFields }
+                }
+                fragment itemFields on Item { current_container { name } }
+            """, variables={'ids': [1, 2, 3]}),
+            {'depth': 3, 'rows': 6, 'queries': 4})
+        self.assertEqual(
+            get_cost("""{
+                item_connection(first: 5) { edges { node { containers { name } } } }
+            }"""),
+            {'depth': 5, 'rows': 55, 'queries': 2})
+
+    def test_query_cost_variable_defaults(self):
+        limited_schema = DjangoSchema(schema.registry, max_rows=3)
+        query = 'query Items($ids: [Int]) { item_list(id: $ids) { name } }'
+
+        # Without a filter every item is listed, estimated at 10.
+        for variables in [None, {'ids': None}]:
+            result = limited_schema.execute(query, variables=variables)
+            self.assertEqual(
+                [error.message for error in result.errors],
+                ['QueryCostExceeded: rows 10 exceeds max_rows 3'])
+        result = limited_schema.execute(
+            'query Items($ids: [Int] = [1, 2, 3, 4, 5]) { item_list(id: $ids) { name } }')
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ['QueryCostExceeded: rows 5 exceeds max_rows 3'])
+        result = limited_schema.execute(query, variables={'ids': [1, 2]})
+        self.assertEqual(len(result.data['item_list']), 2)
+
+        result = limited_schema.execute("""
+            query Page($first: Int = 4) { item_connection(first: $first) { edges { node { id } } } }
+        """)
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ['QueryCostExceeded: rows 4 exceeds max_rows 3'])
+
+    def test_query_cost_limits(self):
+        limited_schema = DjangoSchema(schema.registry, max_depth=3, max_queries=2)
+        query = '{ container_list { items { containers { items { name } } } } }'
+        with self.assertNumQueries(0):
+            result = limited_schema.execute(query)
+        self.assertTrue(result.invalid)
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ['QueryCostExceeded: depth 5 exceeds max_depth 3; '
+             'queries 4 exceeds max_queries 2'])
+        self.assertEqual(result.errors[0].cost.rows, 11110)
+
+        expected = {
+            'message': result.errors[0].message,
+            'locations': None,
+            'cost': {'depth': 5, 'rows': 11110, 'queries': 4},
+            'limits': {'depth': 3, 'queries': 2},
+        }
+        fragments = limited_schema.execute_stream(query)
+        error = json.loads(''.join(fragments))['errors'][0]
+        self.assertEqual(dict(error, locations=None), expected)
+        view = GraphQLView.as_view(schema=limited_schema)
+        response = view(RequestFactory().post(
+            '/graphql', json.dumps({'query': query}), content_type='application/json'))
+        error = json.loads(response.content)['errors'][0]
+        self.assertEqual(dict(error, locations=None), expected)
+
+        # Plugins see the estimate, whether or not it was admitted.
+        costs = []
+
+        class CostPlugin(object):
+            @contextmanager
+            def apply(self, **kwargs):
+                yield dict(kwargs, on_result=lambda result, name, cost: costs.append(cost))
+
+        result = limited_schema.execute('{ item(id: 1) { name } }', plugins=[CostPlugin()])
+        self.assertEqual(result.data, {'item': {'name': 'item_0'}})
+        limited_schema.execute(query, plugins=[CostPlugin()])
+        self.assertEqual(
+            [cost.as_dict() for cost in costs],
+            [{'depth': 2, 'rows': 1, 'queries': 1}, expected['cost']])
+
+    def test_query_cost_debug(self):
+        debug_schema = DjangoSchema(schema.registry, [DjangoDebugPlugin()])
+        result = debug_schema.execute(
+            '{ container(id: 1) { items { name } }, __debug { cost { depth, rows, queries } } }')
+        self.assertEqual(
+            result.data['__debug']['cost'],
+            {'depth': 3, 'rows': 11, 'queries': 2})
+
+    def assert_result_cache(self, result_cache):
+        cached_schema = DjangoSchema(schema.registry, result_cache=result_cache)
+        query = '{ container(id: 1) { name, items { name } } }'
+        with self.assertNumQueries(2):
+            expected = cached_schema.execute(query)
+        with self.assertNumQueries(0):
+            result = cached_schema.execute(query)
+        self.assertEqual(result.data, expected.data)
+        self.assertEqual(result_cache.hits, 1)
+
+        # Different arguments or selections are cached apart.
+        with self.assertNumQueries(1):
+            cached_schema.execute('{ container(id: 2) { name } }')
+        with self.assertNumQueries(1):
+            cached_schema.execute('{ container(id: 1) { name } }')
+
+        Item.objects.filter(pk=1).update(name='renamed')
+        Item.objects.get(pk=1).save()
+        with self.assertNumQueries(2):
+            result = cached_schema.execute(query)
+        self.assertEqual(result.data['container']['items'][0], {'name': 'renamed'})
+
+        # Through model rows change which items a container has.
+        ItemMovement.objects.create(item_id=5, container_id=1)
+        with self.assertNumQueries(2):
+            result = cached_schema.execute(query)
+        self.assertEqual(len(result.data['container']['items']), 6)
+        # Unrelated models leave entries alone.
+        with self.assertNumQueries(0):
+            cached_schema.execute('{ container(id: 2) { name } }')
+
+    def test_local_result_cache(self):
+        self.assert_result_cache(LocalResultCache())
+
+    def test_django_result_cache(self):
+        self.assert_result_cache(DjangoResultCache(key_prefix='test_%s' % time.time()))
+
+    def test_result_cache_lists(self):
+        cached_schema = DjangoSchema(schema.registry, result_cache=LocalResultCache())
+        query = '{ item_list(id: [1, 2]) { name, containers { name } } }'
+        expected = schema.execute(query)
+        with self.assertNumQueries(2):
+            cached_schema.execute(query)
+        with self.assertNumQueries(0):
+            result = cached_schema.execute(query)
+        self.assertEqual(result.data, expected.data)
+
+
+class ResultCacheTransactionTests(TransactionTestCase):
+    def test_invalidate_after_commit(self):
+        result_cache = LocalResultCache()
+        item = Item.objects.create(name='item_0')
+
+        with transaction.atomic():
+            item.save()
+            # Other threads can still read the old row until the commit.
+            version, = result_cache.get_versions(['testapp.Item'])
+        request_finished.send(sender=None)
+
+        self.assertGreater(result_cache.get_versions(['testapp.Item'])[0], version)
+
+
+class ConcurrentExecutorTests(TestCase):
+    def test_concurrent_execution(self):
+        threads = []
+
+        def resolve(value):
+            def resolver(root, args, info):
+                threads.append(threading.current_thread())
+                time.sleep(0.1)
+                if value is None:
+                    raise ValueError('no value')
+                return value
+            return resolver
+
+        query_root = GraphQLObjectType('Query', fields=dict(
+            (name, GraphQLField(GraphQLString, resolver=resolve(value)))
+            for name, value in [('a', 'A'), ('b', 'B'), ('c', None), ('d', 'D')]))
+        executor = ConcurrentExecutor(max_workers=4)
+
+        start = time.time()
+        with executor.get_work() as work:
+            deferred = executor.execute(
+                GraphQLSchema(query=query_root),
+                '{ a, b, c, d }',
+                request_context={'work': work})
+            work.wait()
+        result = deferred.result
+
+        self.assertLess(time.time() - start, 0.3)
+        self.assertEqual(result.data, {'a': 'A', 'b': 'B', 'c': None, 'd': 'D'})
+        self.assertEqual([error.message for error in result.errors], ['no value'])
+        self.assertEqual(len(set(threads)), 4)
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+class StrictPrefetchTests(TestCase):
+    def test_testapp_schema(self):
+        DjangoSchema(schema.registry, strict_prefetch=True)
+
+    def test_missing_prefetch(self):
+        R = TypeRegistry()
+
+        class Container(DjangoType):
+            id = R.Int
+            neighbours = R.List(R.Container)
+            recent_items = R.List(R.Container)
+            others = R.List(R.Container)
+
+            def get_neighbours(self, obj, args, info):
+                return obj.__class__.objects.exclude(pk=obj.pk)
+
+            @prefetch('itmes')
+            def get_recent_items(self, obj, args, info):
+                return obj.items.all()
+
+            @prefetch()
+            def get_others(self, obj, args, info):
+                return []
+
+            class Meta:
+                model = models.Container
+                filters = ('id',)
+
+        with self.assertRaises(ValueError) as context:
+            DjangoSchema(R, strict_prefetch=True)
+
+        message = str(context.exception)
+        self.assertIn('Container.neighbours', message)
+        self.assertIn("'itmes'", message)
+        self.assertNotIn('Container.others', message)
+
+
+class PersistedQueryStoreTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = DjangoSchema(schema.registry).persisted_queries
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_load_directory(self):
+        query = '{ container(id: 1) { name } }'
+        with open(os.path.join(self.directory, 'container.graphql'), 'w') as f:
+            f.write(query)
+        with open(os.path.join(self.directory, 'README'), 'w') as f:
+            f.write('not a query')
+
+        self.assertEqual(self.store.load_directory(self.directory), [hash_query(query)])
+        self.assertIn(hash_query(query), self.store)
+
+    def test_load_manifest(self):
+        path = os.path.join(self.directory, 'manifest.json')
+        with open(path, 'w') as f:
+            json.dump({'container-name': '{ container(id: 1) { name } }'}, f)
+
+        self.assertEqual(self.store.load_manifest(path), ['container-name'])
+        self.assertIsNotNone(self.store.get('container-name'))
+
+    def test_invalid_document(self):
+        with self.assertRaises(GraphQLError):
+            self.store.register('{ container(id: 1) { nope } }')
+
+
+class BoundedCacheTests(TestCase):
+    def test_lru_eviction(self):
+        cache = BoundedCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_fifo_eviction(self):
+        cache = BoundedCache(maxsize=2, eviction='fifo')
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+
+    def test_disabled(self):
+        cache = BoundedCache(maxsize=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_unknown_eviction(self):
+        with self.assertRaises(ValueError):
+            BoundedCache(eviction='random')
+
+
+class BenchmarkTests(TestCase):
+    def test_generate_dataset(self):
+        self.assertEqual(
+            generate_dataset(movements=800, skew=1.0),
+            {'containers': 8, 'items': 200, 'movements': 800})
+        fan_out = [
+            container.itemmovement_set.count()
+            for container in Container.objects.order_by('id')]
+        self.assertEqual(sum(fan_out), 800)
+        self.assertEqual(max(fan_out), fan_out[0])
+        self.assertEqual(ItemMovement.objects.filter(left__isnull=True).count(), 200)
+
+        measured = run_document(schema, '{ container(id: 1) { items { name } } }', iterations=1)
+        self.assertEqual(measured['queries'], 2)
+        self.assertEqual(measured['rows'], 1 + fan_out[0])
+
+    def test_compare(self):
+        baseline = {
+            'dataset': {'movements': 1000},
+            'documents': {'a': {'queries': 2, 'rows': 10, 'min_ms': 1.0, 'peak_memory_kb': None}},
+        }
+        results = {
+            'dataset': {'movements': 1000},
+            'documents': {'a': {'queries': 3, 'rows': 10, 'min_ms': 1.05, 'peak_memory_kb': 100}},
+        }
+        self.assertEqual(compare(baseline, results), ['a: queries went from 2 to 3'])